@@ -0,0 +1,317 @@
+# api_server.py
+# Local HTTP query API for the numbers behind the dashboard: rankings and per-ticker monthly references.
+# Requirements: pandas, numpy, duckdb, pyarrow (Arrow IPC responses); no Streamlit, standard library HTTP server
+#
+# Same engine as app.py: a DatasetWatcher keeps the dataset fresh in the background (atomic version
+# swap). Results go through a ResultCache whose keys start with the dataset fingerprint. With
+# RESULT_CACHE_DIR pointing at the dashboard's directory, the ranking entries are shared on disk
+# between the two processes.
+#
+# Endpoints (GET, JSON unless format=arrow or Accept: application/vnd.apache.arrow.stream):
+#   /health                                      dataset version, fingerprint, load time
+#   /metrics                                     metric keys, universes, date range
+#   /ranking?metric=EQS%20(w.avg)&start=2025-11-03&end=2025-11-28&universe=BIST100&engine=prefix
+#   /references?ticker=AKBNK.E&start=...&end=...  calc_month_references: share %, daily average, days
+#
+# Every response carries an ETag derived from the dataset fingerprint and the normalized request. A
+# poll with If-None-Match gets 304 before anything is computed. Response bodies are cached too, so a
+# repeat poll without the header is a dictionary lookup. Requests run on a fixed pool of worker
+# threads; when all of them and the pending slots are busy, new connections wait in the listen backlog.
+#
+# Run:
+#   python api_server.py                                  # 127.0.0.1:8502
+#   python api_server.py --port 9000 --workers 16
+#   curl -s "localhost:8502/ranking?metric=Trade%25%20(w.avg)&universe=BANKA"
+#   curl -s -H "Accept: application/vnd.apache.arrow.stream" "localhost:8502/ranking" -o ranking.arrow
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+import perf
+from bist_metrics import (
+    METRICS,
+    calc_month_references,
+    dataset_ranking,
+    load_universes,
+    stock_slice,
+    universe_members,
+    universe_names,
+)
+from dataset_watcher import ActiveDataset, DatasetWatcher
+from result_cache import ResultCache
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+JSON = "application/json; charset=utf-8"
+ENGINES = ("prefix", "duckdb", "pandas")
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+# -----------------------------
+# Encoding
+# -----------------------------
+def encode_json(meta: dict, frame: pd.DataFrame | None) -> bytes:
+    rows = frame.to_json(orient="records", date_format="iso", force_ascii=False) if frame is not None else "null"
+    return ('{"meta":' + json.dumps(meta, ensure_ascii=False, default=str) + ',"rows":' + rows + "}").encode("utf-8")
+
+
+def encode_arrow(meta: dict, frame: pd.DataFrame) -> bytes:
+    # One IPC stream; meta travels as JSON in the schema metadata
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           b"bist": json.dumps(meta, ensure_ascii=False, default=str).encode()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+# -----------------------------
+# Queries
+# -----------------------------
+class QueryApi:
+    def __init__(self, watcher: DatasetWatcher, cache: ResultCache, universes: pd.DataFrame, engine: str = "prefix"):
+        self.watcher = watcher
+        self.cache = cache
+        self.universes = universes
+        self.engine = engine
+
+    def cached(self, fingerprint: str, name: str, key: tuple, compute):
+        # Same key layout as cached_result() in app.py
+        return self.cache.get_or_compute((fingerprint, name) + key, compute)
+
+    def _range(self, active: ActiveDataset, params: dict) -> tuple[pd.Timestamp, pd.Timestamp]:
+        dates = active.state.prefix.dates
+        if not len(dates):
+            raise ApiError(503, "dataset is empty")
+        try:
+            start = pd.Timestamp(params["start"]) if params.get("start") else pd.Timestamp(dates[0])
+            end = pd.Timestamp(params["end"]) if params.get("end") else pd.Timestamp(dates[-1])
+        except ValueError as e:
+            raise ApiError(400, f"bad date: {e}")
+        if start > end:
+            raise ApiError(400, "start is after end")
+        return start, end
+
+    def health(self, active: ActiveDataset, params: dict):
+        return {**self.watcher.info(), "version": active.version, "fingerprint": active.state.fingerprint}, None
+
+    def metrics(self, active: ActiveDataset, params: dict):
+        dates = active.state.prefix.dates
+        return {
+            "metrics": {k: {"label": v["label"], "better_high": v["better_high"]} for k, v in METRICS.items()},
+            "universes": universe_names(self.universes),
+            "engines": list(ENGINES),
+            "start": str(pd.Timestamp(dates[0]).date()) if len(dates) else None,
+            "end": str(pd.Timestamp(dates[-1]).date()) if len(dates) else None,
+            "tickers": len(active.state.index.offsets),
+        }, None
+
+    def ranking(self, active: ActiveDataset, params: dict):
+        metric_key = params.get("metric", next(iter(METRICS)))
+        if metric_key not in METRICS:
+            raise ApiError(400, f"unknown metric: {metric_key} (known: {', '.join(METRICS)})")
+        by_lower = {n.lower(): n for n in universe_names(self.universes)}
+        universe = by_lower.get(params.get("universe", "BIST100").lower())
+        if universe is None:
+            raise ApiError(400, f"unknown universe: {params.get('universe')} (known: {', '.join(by_lower.values())})")
+        engine = params.get("engine", self.engine)
+        if engine not in ENGINES:
+            raise ApiError(400, f"unknown engine: {engine} (known: {', '.join(ENGINES)})")
+        start, end = self._range(active, params)
+
+        state = active.state
+        members = universe_members(self.universes, universe, end)
+        loaded = set(state.index.offsets)
+        stocks = tuple(sorted(loaded if members is None else loaded.intersection(members)))
+        frame = self.cached(state.fingerprint, "ranking", (metric_key, str(start), str(end), stocks, engine),
+                            lambda: dataset_ranking(state, stocks, start, end, metric_key, engine=engine))
+        frame = frame.assign(rank=range(1, len(frame) + 1))
+        meta = {"metric": metric_key, "better_high": METRICS[metric_key]["better_high"], "universe": universe,
+                "engine": engine, "start": str(start.date()), "end": str(end.date())}
+        return meta, frame
+
+    def references(self, active: ActiveDataset, params: dict):
+        ticker = params.get("ticker")
+        state = active.state
+        if not ticker:
+            raise ApiError(400, "ticker is required")
+        if ticker not in state.index.offsets:
+            raise ApiError(404, f"unknown ticker: {ticker}")
+        start, end = self._range(active, params)
+
+        def compute():
+            dfh = stock_slice(state.index, ticker, start, end)
+            if dfh.empty:
+                return 0, pd.DataFrame(columns=["final_state", "emir_sayisi", "yuzde", "emir_gunluk_ort"])
+            month_pct, month_cnt_daily_avg, n_days = calc_month_references(dfh)
+            frame = month_pct.merge(month_cnt_daily_avg.rename(columns={"emir_sayisi": "emir_gunluk_ort"}),
+                                    on="final_state")
+            frame["final_state"] = frame["final_state"].astype(str)
+            return n_days, frame.sort_values("emir_sayisi", ascending=False, ignore_index=True)
+
+        n_days, frame = self.cached(state.fingerprint, "references", (ticker, str(start), str(end)), compute)
+        meta = {"ticker": ticker, "start": str(start.date()), "end": str(end.date()), "n_days": n_days}
+        return meta, frame
+
+    ROUTES = {"/health": "health", "/metrics": "metrics", "/ranking": "ranking", "/references": "references"}
+
+    def handle(self, path: str, params: dict, fmt: str, if_none_match: str | None) -> tuple[int, dict, bytes]:
+        route = self.ROUTES.get(path.rstrip("/") or "/")
+        if route is None:
+            raise ApiError(404, f"unknown path: {path} (known: {', '.join(self.ROUTES)})")
+        active = self.watcher.active
+        fingerprint = active.state.fingerprint
+        canonical = json.dumps([path, sorted(params.items()), fmt])
+        etag = '"' + hashlib.sha1(f"{fingerprint}|{canonical}".encode()).hexdigest()[:32] + '"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Dataset-Version": str(active.version)}
+        if route != "health" and etag_matches(if_none_match, etag):
+            return 304, headers, b""
+
+        def build() -> bytes:
+            meta, frame = getattr(self, route)(active, params)
+            meta = {**meta, "dataset_fingerprint": fingerprint, "dataset_version": active.version}
+            if fmt == "arrow":
+                if frame is None:
+                    raise ApiError(406, f"{path} is only available as JSON")
+                return encode_arrow(meta, frame)
+            return encode_json(meta, frame)
+
+        # health reports live watcher state, everything else is a pure function of the fingerprint
+        body = build() if route == "health" else self.cached(fingerprint, "api", (canonical,), build)
+        headers["Content-Type"] = ARROW_STREAM if fmt == "arrow" else JSON
+        return 200, headers, body
+
+
+# -----------------------------
+# HTTP
+# -----------------------------
+class QueryHandler(BaseHTTPRequestHandler):
+    server_version = "bist-api/1"
+    timeout = 30  # a slow client cannot hold a worker forever
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        fmt = params.pop("format", None) or ("arrow" if ARROW_STREAM in self.headers.get("Accept", "") else "json")
+        with perf.run(f"api{parts.path}"):
+            try:
+                if fmt not in ("json", "arrow"):
+                    raise ApiError(400, f"unknown format: {fmt} (json, arrow)")
+                status, headers, body = self.server.api.handle(parts.path, params, fmt, self.headers.get("If-None-Match"))
+            except ApiError as e:
+                status, headers, body = e.status, {"Content-Type": JSON}, json.dumps({"error": str(e)}).encode()
+            except Exception as e:
+                # anything else (duckdb / pyarrow errors, a bug) still gets an answer instead of a closed
+                # socket; logged with the traceback even with --quiet
+                sys.stderr.write(f"[{self.log_date_time_string()}] {self.command} {self.path} failed\n"
+                                 f"{traceback.format_exc()}")
+                message = f"internal error: {type(e).__name__}: {e}"
+                status, headers, body = 500, {"Content-Type": JSON}, json.dumps({"error": message}).encode()
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class PooledHTTPServer(HTTPServer):
+    # HTTPServer that hands each connection to a fixed thread pool (ThreadingHTTPServer starts one
+    # thread per connection, unbounded). At most `workers` requests run at once and `workers * 4` are
+    # accepted; beyond that the accept loop blocks and clients queue in the listen backlog.
+    def __init__(self, address, api: QueryApi, workers: int = 8, backlog: int = 128, quiet: bool = False):
+        self.request_queue_size = backlog
+        super().__init__(address, QueryHandler)
+        self.api = api
+        self.quiet = quiet
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api")
+        self._slots = threading.BoundedSemaphore(workers * 4)
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        self._pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sıralama ve hisse referanslarını JSON / Arrow IPC olarak sunan HTTP API")
+    parser.add_argument("parquet_path", nargs="?", default=os.getenv("PARQUET_PATH", "final_state_daily_bist100.parquet"),
+                        help="final state parquet dosyası, glob veya hive-partitioned dizin")
+    parser.add_argument("--host", default=os.getenv("API_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8502")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("API_WORKERS", "8")), help="istek thread sayısı")
+    parser.add_argument("--start", default=os.getenv("DATA_START") or None, help="yüklenecek ilk gün (YYYY-MM-DD)")
+    parser.add_argument("--end", default=os.getenv("DATA_END") or None, help="yüklenecek son gün (YYYY-MM-DD)")
+    parser.add_argument("--engine", choices=ENGINES, default=os.getenv("METRIC_ENGINE", "prefix"))
+    parser.add_argument("--load-mode", choices=["duckdb", "arrow"], default=os.getenv("LOAD_MODE", "duckdb"))
+    parser.add_argument("--arrow-cache-dir", default=os.getenv("ARROW_CACHE_DIR", ".arrow_cache"))
+    parser.add_argument("--universes-file", default=os.getenv("UNIVERSES_PATH", "universes.csv"))
+    parser.add_argument("--cache-mb", type=int, default=int(os.getenv("RESULT_CACHE_MB", "256")))
+    parser.add_argument("--cache-dir", default=os.getenv("RESULT_CACHE_DIR") or None,
+                        help="sonuç cache'inin disk kopyası (dashboard ile paylaşılabilir)")
+    parser.add_argument("--poll-seconds", type=float, default=float(os.getenv("DATA_POLL_SECONDS", "10")))
+    parser.add_argument("--quiet", action="store_true", help="istek loglarını yazma")
+    args = parser.parse_args()
+
+    watcher = DatasetWatcher(args.parquet_path, args.start, args.end, load_mode=args.load_mode,
+                             arrow_cache_dir=args.arrow_cache_dir, poll_seconds=args.poll_seconds)
+    active = watcher.active  # load before accepting connections
+    watcher.start()
+    api = QueryApi(watcher, ResultCache(max_bytes=args.cache_mb * 2**20, disk_dir=args.cache_dir),
+                   load_universes(args.universes_file), engine=args.engine)
+    server = PooledHTTPServer((args.host, args.port), api, workers=args.workers, quiet=args.quiet)
+    print(f"v{active.version} ({active.state.fingerprint[:8]}, {active.load_seconds:.1f}s) "
+          f"http://{args.host}:{server.server_port} ({args.workers} worker)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        watcher.stop()
+
+
+if __name__ == "__main__":
+    main()
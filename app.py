@@ -1,32 +1,94 @@
 # app.py
 # Streamlit dashboard for BIST100 Final State distributions (PARQUET-BASED, no DB locks)
-# Requirements: streamlit, pandas, plotly, duckdb
+# Requirements: streamlit>=1.65 (st.fragment, lazy tabs/expanders), numpy, pandas, plotly, duckdb
 #
 # Data expectation:
-#   - A parquet file exported from your aggregation step, e.g. final_state_daily_bist100.parquet
+#   - A parquet file exported from the aggregation step (build_final_state.py), e.g. final_state_daily_bist100.parquet
 #   - Columns: tarih, islem_kodu, final_state, emir_sayisi, yuzde
 #
 # Run:
 #   streamlit run app.py
 #
 # Optional:
-#   export PARQUET_PATH env var to point to your parquet
+#   export PARQUET_PATH env var to point to your parquet, a glob (data/*.parquet)
+#          or a hive-partitioned directory (see repartition_parquet.py)
+#   export DATA_START / DATA_END (YYYY-MM-DD) to only read that date window
 #   export SHOW_TABLE=1 to show raw tables by default
-
+#   export METRIC_ENGINE=duckdb|pandas to rank with a DuckDB query / pandas pivot instead of the
+#          precomputed prefix-sum index
+#   export LOAD_MODE=arrow to load through memory-mapped Arrow (schema cast once, no DuckDB/pandas
+#          coercion passes); the table is cached as an Arrow IPC file in ARROW_CACHE_DIR that all
+#          workers on the host map, so they share one copy in the page cache
+#   export RESULT_CACHE_MB=256 to size the shared ranking/detail result cache (LRU), and
+#          RESULT_CACHE_DIR=... to keep a disk copy so a restarted server starts warm
+#   export UNIVERSES_PATH=universes.csv for the dated index/sector constituents (universe selector)
+#   export RANKINGS_PATH=metrics.parquet to serve month rankings precomputed by batch_metrics.py
+#          (used while its dataset fingerprint matches the loaded data)
+#   export BOOTSTRAP_SAMPLES=1000 resamples for the ranking confidence intervals
+#   export DATA_POLL_SECONDS=10 how often a background thread checks PARQUET_PATH for changed/new files
+#          and swaps in the reloaded dataset (0 = check inline on every rerun)
+#   export PERF_TRACE=1 to time the hot paths, show a debug panel in the sidebar and append timings
+#          to PERF_LOG (JSON lines) / PERF_PROM (Prometheus text), see perf.py
+
+import functools
 import os
-import duckdb
+import time
+
+import numpy as np
 import pandas as pd
 import streamlit as st
-import plotly.express as px
-import plotly.graph_objects as go
+
+import perf
+from dataset_watcher import ActiveDataset, DatasetWatcher
+from result_cache import ResultCache
+from bist_metrics import (
+    ANOMALY_Z,
+    BUCKET_FREQS,
+    METRICS,
+    UNIVERSE_ALL,
+    anomaly_alerts,
+    bootstrap_ci,
+    bucket_series,
+    dataset_ranking,
+    load_universes,
+    nearest_neighbours,
+    stock_slice,
+    ticker_similarity,
+    universe_members,
+    universe_names,
+)
+from charts import (
+    DetailData,
+    daily_cnt_figure,
+    daily_pct_figure,
+    ranking_bar_figure,
+    ranking_scatter_figure,
+    similarity_heatmap_figure,
+    tensor_detail_data,
+    timeseries_figure,
+    weekly_cnt_figure,
+    weekly_pct_figure,
+)
 
 st.set_page_config(page_title="BIST100 Final State Dashboard", layout="wide")
+perf.start_run("rerun")
 
 # -----------------------------
 # Config
 # -----------------------------
 PARQUET_PATH = os.getenv("PARQUET_PATH", "final_state_daily_bist100.parquet")
 SHOW_TABLE_DEFAULT = os.getenv("SHOW_TABLE", "0") == "1"
+METRIC_ENGINE = os.getenv("METRIC_ENGINE", "prefix")
+DATA_START = os.getenv("DATA_START") or None
+DATA_END = os.getenv("DATA_END") or None
+LOAD_MODE = os.getenv("LOAD_MODE", "duckdb")
+ARROW_CACHE_DIR = os.getenv("ARROW_CACHE_DIR", ".arrow_cache")
+RESULT_CACHE_MB = int(os.getenv("RESULT_CACHE_MB", "256"))
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR") or None
+UNIVERSES_PATH = os.getenv("UNIVERSES_PATH", "universes.csv")
+RANKINGS_PATH = os.getenv("RANKINGS_PATH", "metrics.parquet")
+BOOTSTRAP_SAMPLES = int(os.getenv("BOOTSTRAP_SAMPLES", "1000"))
+DATA_POLL_SECONDS = float(os.getenv("DATA_POLL_SECONDS", "10"))
 
 METRIC_DETAILS_MD = {
     "EQS (w.avg)": r"""
@@ -86,67 +148,94 @@ Cancel/Trade = \frac{CanceledByUser\%}{Trade\%}
 
 
 # -----------------------------
-# BIST100 list (with .E suffix)
+# Dataset registry (cached, shared)
 # -----------------------------
-BIST100 = [
-    "AEFES.E", "AGHOL.E", "AKBNK.E", "AKSA.E", "AKSEN.E", "ALARK.E", "ALTNY.E", "ANSGR.E", "ARCLK.E", "ASELS.E", "ASTOR.E", "BALSU.E",
-    "BIMAS.E", "BRSAN.E", "BRYAT.E", "BSOKE.E", "BTCIM.E", "CANTE.E", "CCOLA.E", "CIMSA.E", "CWENE.E", "DAPGM.E", "DOAS.E", "DOHOL.E",
-    "DSTKF.E", "ECILC.E", "EFOR.E", "EGEEN.E", "EKGYO.E", "ENERY.E", "ENJSA.E", "ENKAI.E", "EREGL.E", "EUPWR.E", "FENER.E", "FROTO.E",
-    "GARAN.E", "GENIL.E", "GESAN.E", "GLRMK.E", "GRSEL.E", "GRTHO.E", "GSRAY.E", "GUBRF.E", "HALKB.E", "HEKTS.E", "ISCTR.E", "ISMEN.E",
-    "IZENR.E", "KCAER.E", "KCHOL.E", "KLRHO.E", "KONTR.E", "KRDMD.E", "KTLEV.E", "KUYAS.E", "MAGEN.E", "MAVI.E", "MGROS.E", "MIATK.E",
-    "MPARK.E", "OBAMS.E", "ODAS.E", "OTKAR.E", "OYAKC.E", "PASEU.E", "PATEK.E", "PETKM.E", "PGSUS.E", "QUAGR.E", "RALYH.E", "REEDR.E",
-    "SAHOL.E", "SASA.E", "SISE.E", "SKBNK.E", "SOKM.E", "TABGD.E", "TAVHL.E", "TCELL.E", "THYAO.E", "TKFEN.E", "TOASO.E", "TRALT.E",
-    "TRENJ.E", "TRMET.E", "TSKB.E", "TSPOR.E", "TTKOM.E", "TTRAK.E", "TUKAS.E", "TUPRS.E", "TUREX.E", "TURSG.E", "ULKER.E", "VAKBN.E",
-    "VESTL.E", "YEOTK.E", "YKBNK.E", "ZOREN.E"
-]
+@st.cache_resource(show_spinner=False)
+def _dataset_watcher(parquet_path: str, start_date=None, end_date=None) -> DatasetWatcher:
+    return DatasetWatcher(parquet_path, start_date, end_date, load_mode=LOAD_MODE, arrow_cache_dir=ARROW_CACHE_DIR,
+                          poll_seconds=DATA_POLL_SECONDS).start()
+
+def get_dataset(parquet_path: str, start_date=None, end_date=None) -> ActiveDataset:
+    # Process-wide, keyed on the path + window. A background thread reloads changed files (new
+    # day/partition files are appended, a rewritten file triggers a full reload) and swaps the
+    # version in when it is fully built, so reruns never wait on a reload. With DATA_POLL_SECONDS=0
+    # the fingerprint is checked inline on every rerun instead; a failed reload raises only before the
+    # first version exists, afterwards it keeps serving and shows up as last_error like in the background.
+    watcher = _dataset_watcher(parquet_path, start_date, end_date)
+    if DATA_POLL_SECONDS <= 0:
+        watcher.refresh()
+    return watcher.active
+
 
 # -----------------------------
-# Metrics
+# Result cache (cached, shared)
 # -----------------------------
-METRICS = {
-    "EQS (w.avg)": {
-        "label": "EQS = Trade% - CanceledByUser% - Expired% (volume-weighted)",
-        "better_high": True,
-    },
-    "Trade% (w.avg)": {
-        "label": "Trade% (volume-weighted)",
-        "better_high": True,
-    },
-    "CanceledByUser% (w.avg)": {
-        "label": "CanceledByUser% (volume-weighted) — lower is better",
-        "better_high": False,
-    },
-    "Expired% (w.avg)": {
-        "label": "Expired% (volume-weighted) — lower is better",
-        "better_high": False,
-    },
-    "Cancel/Trade (w.avg)": {
-        "label": "CanceledByUser% / Trade% (volume-weighted) — lower is better",
-        "better_high": False,
-    },
-}
+@st.cache_resource(show_spinner=False)
+def _result_cache() -> ResultCache:
+    return ResultCache(max_bytes=RESULT_CACHE_MB * 2**20, disk_dir=RESULT_CACHE_DIR)
+
+def cached_result(name: str, key: tuple, compute):
+    # Shared by all sessions, keyed on the dataset fingerprint; a hit is the stored object itself
+    # (no pickle round trip like st.cache_data), so results must be treated as read-only.
+    def run():
+        perf.cache_miss()
+        return compute()
+
+    with perf.cache_lookup(name):
+        return _result_cache().get_or_compute((dataset.fingerprint, name) + key, run)
+
 
 # -----------------------------
-# Load parquet (cached)
+# Universes + precomputed rankings (cached, shared; reloaded when the file changes)
 # -----------------------------
-@st.cache_data(show_spinner=False)
-def load_all_daily_states(parquet_path: str) -> pd.DataFrame:
-    # NOTE: DuckDB cannot open ":memory:" in read_only mode
-    con = duckdb.connect(database=":memory:")
-    df = con.execute(f"SELECT * FROM read_parquet('{parquet_path}')").fetchdf()
-
-    df["tarih"] = pd.to_datetime(df["tarih"])
-    df["yuzde"] = pd.to_numeric(df["yuzde"], errors="coerce").fillna(0.0)
-    df["emir_sayisi"] = pd.to_numeric(df["emir_sayisi"], errors="coerce").fillna(0.0)
-    df["islem_kodu"] = df["islem_kodu"].astype(str)
-    df["final_state"] = df["final_state"].astype(str)
+def _mtime(path: str) -> int | None:
+    return os.stat(path).st_mtime_ns if path and os.path.exists(path) else None
+
+@st.cache_resource(show_spinner=False)
+def _universes(path: str, mtime: int | None) -> pd.DataFrame:
+    return load_universes(path)
+
+@st.cache_resource(show_spinner=False)
+def _precomputed_rankings(path: str, mtime: int | None) -> tuple[str | None, dict]:
+    # batch_metrics.py output -> (dataset fingerprint, {(universe, metric, start, end): ranking frame})
+    if mtime is None or not path.endswith(".parquet"):
+        return None, {}
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(path)
+    fingerprint = (table.schema.metadata or {}).get(b"dataset_fingerprint", b"").decode() or None
+    df = table.to_pandas()
+    if "universe" not in df.columns:
+        return None, {}
+    lookup = {}
+    for (universe, metric, start, end), g in df.groupby(["universe", "metric", "start_date", "end_date"], sort=False):
+        lookup[(universe, metric, str(pd.Timestamp(start)), str(pd.Timestamp(end)))] = (
+            g[["islem_kodu", "metric_wavg", "total_emir_period"]].reset_index(drop=True)
+        )
+    return fingerprint, lookup
 
-    return df
+def precomputed_ranking(universe: str, metric_key: str, start_date, end_date) -> pd.DataFrame | None:
+    fingerprint, lookup = _precomputed_rankings(RANKINGS_PATH, _mtime(RANKINGS_PATH))
+    if fingerprint != dataset.fingerprint:
+        return None
+    return lookup.get((universe, metric_key, str(start_date), str(end_date)))
 
 
 # -----------------------------
 # Helpers
 # -----------------------------
+AYLAR = ["Ocak", "Şubat", "Mart", "Nisan", "Mayıs", "Haziran", "Temmuz", "Ağustos", "Eylül", "Ekim", "Kasım", "Aralık"]
+
+def period_label(start_date: pd.Timestamp, end_date: pd.Timestamp) -> str:
+    # "Kasım 2025", "Ekim – Kasım 2025" or "Kasım 2025 – Mart 2026" (Turkish month names, no locale)
+    start = f"{AYLAR[start_date.month - 1]} {start_date.year}"
+    end = f"{AYLAR[end_date.month - 1]} {end_date.year}"
+    if start == end:
+        return start
+    if start_date.year == end_date.year:
+        return f"{AYLAR[start_date.month - 1]} – {end}"
+    return f"{start} – {end}"
+
 def metric_card(title: str, value: str, subtitle: str = ""):
     subtitle_html = f'<div style="font-size:12px; opacity:0.75; margin-top:6px;">{subtitle}</div>' if subtitle else ""
     st.markdown(
@@ -170,98 +259,63 @@ def metric_card(title: str, value: str, subtitle: str = ""):
         unsafe_allow_html=True
     )
 
-def add_week_index(df: pd.DataFrame, n_days: int = 20) -> pd.DataFrame:
-    out = df.copy()
-    out["tarih"] = pd.to_datetime(out["tarih"])
-    days = sorted(out["tarih"].unique())[:n_days]
-    day2idx = {d: i for i, d in enumerate(days)}
-    out = out[out["tarih"].isin(days)].copy()
-    out["gun_idx"] = out["tarih"].map(day2idx)
-    out["hafta"] = (out["gun_idx"] // 5) + 1
-    out["tarih_str"] = out["tarih"].dt.strftime("%Y-%m-%d")
-    return out
-
-def calc_month_references(df_daily: pd.DataFrame):
-    d = df_daily.copy()
-    d["tarih"] = pd.to_datetime(d["tarih"])
-    n_days = int(d["tarih"].nunique()) if d["tarih"].nunique() else 1
-
-    month_cnt = d.groupby("final_state", as_index=False)["emir_sayisi"].sum()
-    total = float(month_cnt["emir_sayisi"].sum())
-    month_pct = month_cnt.copy()
-    month_pct["yuzde"] = (100.0 * month_pct["emir_sayisi"] / total) if total else 0.0
-
-    month_cnt_daily_avg = month_cnt.copy()
-    month_cnt_daily_avg["emir_sayisi"] = month_cnt_daily_avg["emir_sayisi"] / n_days
-
-    return month_pct, month_cnt_daily_avg, n_days
-
-def black_ref_bar(name: str, x, y):
-    return go.Bar(
-        name=name,
-        x=x,
-        y=y,
-        marker=dict(color="black", opacity=0.45, line=dict(color="black", width=3)),
-    )
+def show_chart(name: str, build):
+    # Figure building and st.plotly_chart (plotly JSON serialization) are timed as separate spans
+    with perf.span(f"fig.{name}"):
+        fig = build()
+    with perf.span(f"render.{name}"):
+        st.plotly_chart(fig, width="stretch")
 
-def filter_period(df_all: pd.DataFrame, start_date: pd.Timestamp, end_date: pd.Timestamp) -> pd.DataFrame:
-    return df_all[(df_all["tarih"] >= start_date) & (df_all["tarih"] <= end_date)].copy()
-
-def compute_bist100_metric(df_all: pd.DataFrame, stocks: list[str], start_date: pd.Timestamp, end_date: pd.Timestamp, metric_key: str):
-    df = df_all[
-        (df_all["islem_kodu"].isin(stocks)) &
-        (df_all["tarih"] >= start_date) &
-        (df_all["tarih"] <= end_date)
-    ].copy()
-
-    if df.empty:
-        return pd.DataFrame(columns=["islem_kodu", "metric_wavg", "total_emir_period"]), METRICS[metric_key]["better_high"]
-
-    # daily pivot: percentages and counts per state
-    daily = (df.pivot_table(index=["tarih", "islem_kodu"], columns="final_state",
-                            values=["yuzde", "emir_sayisi"], aggfunc="sum")
-             .fillna(0))
-    daily.columns = [f"{a}_{b}" for a, b in daily.columns]
-    daily = daily.reset_index()
-
-    daily["trade_pct"] = daily.get("yuzde_Trade", 0.0)
-    daily["cancel_pct"] = daily.get("yuzde_CanceledByUser", 0.0)
-    daily["expired_pct"] = daily.get("yuzde_Expired", 0.0)
-
-    emir_cols = [c for c in daily.columns if c.startswith("emir_sayisi_")]
-    daily["total_emir"] = daily[emir_cols].sum(axis=1)
-
-    if metric_key == "EQS (w.avg)":
-        daily["metric_value"] = daily["trade_pct"] - daily["cancel_pct"] - daily["expired_pct"]
-    elif metric_key == "Trade% (w.avg)":
-        daily["metric_value"] = daily["trade_pct"]
-    elif metric_key == "CanceledByUser% (w.avg)":
-        daily["metric_value"] = daily["cancel_pct"]
-    elif metric_key == "Expired% (w.avg)":
-        daily["metric_value"] = daily["expired_pct"]
-    elif metric_key == "Cancel/Trade (w.avg)":
-        daily["metric_value"] = daily["cancel_pct"] / daily["trade_pct"].replace(0, pd.NA)
-        daily["metric_value"] = daily["metric_value"].fillna(0.0)
-    else:
-        daily["metric_value"] = daily["trade_pct"] - daily["cancel_pct"] - daily["expired_pct"]
 
-    better_high = METRICS[metric_key]["better_high"]
-
-    # volume-weighted average over the period
-    def wavg(g):
-        w = g["total_emir"]
-        denom = float(w.sum())
-        if denom <= 0:
-            return pd.Series({"metric_wavg": 0.0, "total_emir_period": 0.0})
-        return pd.Series({
-            "metric_wavg": float((g["metric_value"] * w).sum() / denom),
-            "total_emir_period": float(denom),
-        })
-
-    out = daily.groupby("islem_kodu", as_index=False).apply(wavg).reset_index(drop=True)
-    out = out.sort_values("metric_wavg", ascending=better_high is False)  # if better_high False, sort ascending
-
-    return out, better_high
+# -----------------------------
+# Performance panel (PERF_TRACE=1)
+# -----------------------------
+PERF_HISTORY = 20
+
+def traced_fragment(fn):
+    # Fragment bodies are their own perf run when the fragment reruns alone
+    @functools.wraps(fn)
+    def inner(*args, **kwargs):
+        with perf.run(fn.__name__) as record:
+            result = fn(*args, **kwargs)
+        remember_perf_run(record)
+        return result
+    return inner
+
+def remember_perf_run(record: dict | None):
+    # Only finished (outermost) runs have total_ms; nested fragment runs are spans of the full rerun
+    if record is None or "total_ms" not in record:
+        return
+    history = st.session_state.setdefault("perf_runs", [])
+    history.append(record)
+    del history[:-PERF_HISTORY]
+
+def perf_panel():
+    runs = st.session_state.get("perf_runs", [])
+    with st.sidebar.expander("⏱ Performans (debug)", expanded=False):
+        if not runs:
+            st.caption("Henüz ölçüm yok.")
+            return
+        st.markdown("**Son çalıştırmalar**")
+        st.dataframe(pd.DataFrame([
+            {"run": r["run"], "toplam_ms": round(r["total_ms"], 1),
+             "saat": pd.Timestamp(r["ts"], unit="s").strftime("%H:%M:%S")} for r in reversed(runs)
+        ]), hide_index=True, width="stretch")
+        last = runs[-1]
+        st.markdown(f"**Son çalıştırma: {last['run']}** ({last['total_ms']:.1f} ms)")
+        st.dataframe(pd.DataFrame([
+            {"aşama": "  " * sp["depth"] + sp["name"], "ms": round(sp["ms"], 2)} for sp in last["spans"]
+        ]), hide_index=True, width="stretch")
+        info = _result_cache().info()
+        st.caption(f"Sonuç cache: {info['entries']} kayıt, {info['nbytes'] / 2**20:.1f} / "
+                   f"{info['max_bytes'] / 2**20:.0f} MiB, {info['evictions']} eviction, {info['disk_hits']} disk hit")
+        totals = perf.cache_totals()
+        if totals:
+            st.markdown("**Cache (process geneli)**")
+            st.dataframe(pd.DataFrame([
+                {"cache": k, "hit": h, "miss": m, "hit_oranı": round(h / (h + m), 3) if h + m else None}
+                for k, (h, m) in sorted(totals.items())
+            ]), hide_index=True, width="stretch")
 
 # -----------------------------
 # Sidebar
@@ -271,26 +325,41 @@ def compute_bist100_metric(df_all: pd.DataFrame, stocks: list[str], start_date:
 # Load parquet once (cached)
 # -----------------------------
 try:
-    df_all = load_all_daily_states(PARQUET_PATH)
+    active = get_dataset(PARQUET_PATH, DATA_START, DATA_END)
+    dataset = active.state
+    stock_index = dataset.index
+    df_all = stock_index.frame
 except Exception as e:
     st.error(f"Parquet okunamadı: {e}")
     st.stop()
 
-# Auto date range from data (no UI)
-min_date = df_all["tarih"].min()
-max_date = df_all["tarih"].max()
-start_date = min_date
-end_date = max_date
+min_date = pd.Timestamp(dataset.prefix.dates[0]) if len(dataset.prefix.dates) else pd.Timestamp.today().normalize()
+max_date = pd.Timestamp(dataset.prefix.dates[-1]) if len(dataset.prefix.dates) else min_date
+
+# Dataset version in use; a newer one is picked up by the next rerun once the watcher has swapped it in
+st.sidebar.caption(
+    f"Veri sürümü **v{active.version}** · `{dataset.fingerprint[:8]}` · {len(dataset.prefix.dates)} gün  \n"
+    f"Yüklendi {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(active.loaded_at))} "
+    f"({active.load_seconds:.1f} sn)"
+)
+last_error = _dataset_watcher(PARQUET_PATH, DATA_START, DATA_END).last_error
+if last_error:
+    st.sidebar.warning(f"Son veri yenilemesi başarısız, v{active.version} kullanılmaya devam ediyor: {last_error}")
 
-# Available BIST100 tickers in parquet
-available_stocks = sorted(set(df_all["islem_kodu"].unique()).intersection(BIST100))
+universes = _universes(UNIVERSES_PATH, _mtime(UNIVERSES_PATH))
+UNIVERSE_LABELS = {UNIVERSE_ALL: "Tüm Piyasa"}
+
+# Available BIST100 tickers in parquet (stock pickers)
+available_stocks = sorted(set(stock_index.offsets).intersection(universe_members(universes, "BIST100", max_date) or []))
 if not available_stocks:
-    available_stocks = sorted(df_all["islem_kodu"].unique())
-st.title("BIST100 Emir Defteri Final State Analizi (Kasım 2025)")
+    available_stocks = sorted(stock_index.offsets)
+# Title and intro follow the loaded data (any dated partitions), not a fixed month
+data_period = period_label(min_date, max_date)
+st.title(f"BIST100 Emir Defteri Final State Analizi ({data_period})")
 st.markdown("## 📌 Dashboard Hakkında")
-st.markdown("""
-Bu dashboard, **BIST 100 endeksinde yer alan hisselerin 2025 Kasım ayı boyunca işlem gören emir defteri verileri**
-üzerinden hazırlanmıştır. Amaç, emirlerin gün içindeki davranışlarını ve sonuçlarını **emir yaşam döngüsü (order lifecycle)**
+st.markdown(f"""
+Bu dashboard, **BIST 100 endeksinde yer alan hisselerin {data_period} döneminde
+({min_date:%d.%m.%Y} – {max_date:%d.%m.%Y}) işlem gören emir defteri verileri** üzerinden hazırlanmıştır. Amaç, emirlerin gün içindeki davranışlarını ve sonuçlarını **emir yaşam döngüsü (order lifecycle)**
 perspektifinden incelemektir.
 
 Emirler gün içinde birden fazla güncellenebilir ve farklı ara durumlara uğrayabilir. Ancak bu uygulamada temel yaklaşım,
@@ -322,262 +391,341 @@ with s4:
 
 
 # -----------------------------
-# Top controls (no sidebar)
+# Date range (outside the fragments: both sections depend on it)
 # -----------------------------
-ctrl1, ctrl2, ctrl3 = st.columns([1.4, 1.4, 1.2])
+range_col, _ = st.columns([2.8, 1.2])
+
+with range_col:
+    date_range = st.date_input(
+        "Tarih aralığı",
+        value=(min_date.date(), max_date.date()),
+        min_value=min_date.date(),
+        max_value=max_date.date(),
+        format="YYYY-MM-DD",
+    )
 
-with ctrl1:
-    metric_key = st.selectbox("Ana sayfa metriği", list(METRICS.keys()), index=0)
+if isinstance(date_range, (tuple, list)) and len(date_range) == 2:
+    start_date, end_date = pd.Timestamp(date_range[0]), pd.Timestamp(date_range[1])
+else:
+    # only the first day picked so far: keep the full range until the range is complete
+    start_date, end_date = min_date, max_date
 
 
-with ctrl2:
-    st.markdown("**Kapsam**")
+# -----------------------------
+# Top controls + 1) Comparison (fragment: metric changes rerun only this part)
+# -----------------------------
+def compute_ranking(metric_key: str, start_date, end_date, stocks: tuple[str, ...]) -> pd.DataFrame:
+    # prefix engine: any [start, end] is a difference of two prefix rows, no recompute per range change
+    return dataset_ranking(dataset, stocks, start_date, end_date, metric_key, engine=METRIC_ENGINE)
+
+@st.fragment
+@traced_fragment
+def comparison_section():
+    ctrl1, ctrl2, ctrl3 = st.columns([1.4, 1.4, 1.2])
+
+    with ctrl1:
+        metric_key = st.selectbox("Ana sayfa metriği", list(METRICS.keys()), index=0)
+        show_ci = st.toggle("Güven aralığı (%95, gün bazlı bootstrap)", value=True, key="show_ci")
+
+    with ctrl3:
+        names = universe_names(universes)
+        universe = st.selectbox("Evren", names, index=names.index("BIST100") if "BIST100" in names else 0,
+                                format_func=lambda n: UNIVERSE_LABELS.get(n, n), key="universe")
+        universe_label = UNIVERSE_LABELS.get(universe, universe)
+
+    with ctrl2:
+        st.markdown("**Kapsam**")
+        st.markdown(
+            f"""
+            <div style="
+                display:inline-block;
+                padding: 8px 12px;
+                border-radius: 999px;
+                border: 1px solid rgba(49, 51, 63, 0.20);
+                background: rgba(240, 242, 246, 0.70);
+                font-size: 14px;
+                font-weight: 700;
+            ">
+                {start_date.strftime('%Y-%m-%d')} → {end_date.strftime('%Y-%m-%d')}
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
+
     st.markdown(
         f"""
-        <div style="
-            display:inline-block;
-            padding: 8px 12px;
-            border-radius: 999px;
-            border: 1px solid rgba(49, 51, 63, 0.20);
-            background: rgba(240, 242, 246, 0.70);
-            font-size: 14px;
-            font-weight: 700;
-        ">
-            {start_date.strftime('%Y-%m-%d')} → {end_date.strftime('%Y-%m-%d')}
+    <div style="
+        padding: 14px 16px;
+        border-radius: 12px;
+        border: 1px solid rgba(49, 51, 63, 0.2);
+        background: rgba(240, 242, 246, 0.65);
+        margin-top: 10px;
+        margin-bottom: 10px;
+    ">
+        <div style="font-size: 13px; opacity: 0.8; margin-bottom: 6px;">
+            Ana sayfa metriği
         </div>
-        """,
+        <div style="font-size: 18px; font-weight: 700; margin-bottom: 6px;">
+            {metric_key}
+        </div>
+        <div style="font-size: 14px; opacity: 0.95;">
+            {METRICS[metric_key]['label']}
+        </div>
+    </div>
+    """,
         unsafe_allow_html=True
     )
 
-st.markdown(
-    f"""
-<div style="
-    padding: 14px 16px;
-    border-radius: 12px;
-    border: 1px solid rgba(49, 51, 63, 0.2);
-    background: rgba(240, 242, 246, 0.65);
-    margin-top: 10px;
-    margin-bottom: 10px;
-">
-    <div style="font-size: 13px; opacity: 0.8; margin-bottom: 6px;">
-        Ana sayfa metriği
-    </div>
-    <div style="font-size: 18px; font-weight: 700; margin-bottom: 6px;">
-        {metric_key}
-    </div>
-    <div style="font-size: 14px; opacity: 0.95;">
-        {METRICS[metric_key]['label']}
-    </div>
-</div>
-""",
-    unsafe_allow_html=True
-)
+    with st.expander("Metrik detayı (formül ve yorum)", expanded=False):
+        detail_md = METRIC_DETAILS_MD.get(metric_key, "")
+        if detail_md:
+            st.markdown(detail_md)
+        else:
+            st.write("Detay bulunamadı.")
+
+    st.subheader(f"1) {universe_label} Karşılaştırma")
+
+    # Constituents as of the range end; a precomputed month ranking is a lookup, anything else is
+    # computed (and kept in the shared result cache)
+    members = universe_members(universes, universe, end_date)
+    loaded = set(stock_index.offsets)
+    stocks = tuple(sorted(loaded if members is None else loaded.intersection(members)))
+    metric_df = precomputed_ranking(universe, metric_key, start_date, end_date)
+    if metric_df is None:
+        metric_df = cached_result(
+            "ranking", (metric_key, str(start_date), str(end_date), stocks, METRIC_ENGINE),
+            lambda: compute_ranking(metric_key, start_date, end_date, stocks),
+        )
 
-with st.expander("Metrik detayı (formül ve yorum)", expanded=False):
-    detail_md = METRIC_DETAILS_MD.get(metric_key, "")
-    if detail_md:
-        st.markdown(detail_md)
-    else:
-        st.write("Detay bulunamadı.")
+    if show_ci and not metric_df.empty:
+        # all metrics at once, so switching metric reuses the same resamples
+        ci = cached_result(
+            "bootstrap", (str(start_date), str(end_date), stocks, BOOTSTRAP_SAMPLES),
+            lambda: bootstrap_ci(dataset.prefix, start_date, end_date, list(stocks), n_boot=BOOTSTRAP_SAMPLES),
+        )
+        metric_ci = ci.loc[ci["metric"] == metric_key, ["islem_kodu", "ci_low", "ci_high"]]
+        metric_df = metric_df.merge(metric_ci, on="islem_kodu", how="left")
+
+    k1, k2, k3 = st.columns(3)
+
+    with k1:
+        metric_card("Hisse Sayısı", str(len(metric_df)), f"{universe_label} içinde hesaplanan")
+
+    with k2:
+        total_emir_all = int(metric_df["total_emir_period"].sum()) if not metric_df.empty else 0
+        metric_card("Toplam Emir", f"{total_emir_all:,}".replace(",", "."), "Seçili kapsam (tüm hisseler)")
+
+    with k3:
+        direction = "Yüksek daha iyi" if METRICS[metric_key]["better_high"] else "Düşük daha iyi"
+        metric_card("Metrik Yönü", direction, metric_key)
+
+    # on_change="rerun" tracks the selected tab, so only the visible one builds its figure
+    tabA, tabB, tabC = st.tabs(["Bar (Ranking)", "Scatter (Metrik vs Hacim)", "Tablo"], key="cmp_tab", on_change="rerun")
+
+    with tabA:
+        if tabA.open:
+            if metric_df.empty:
+                st.warning("Bu aralıkta veri yok.")
+            else:
+                show_chart("ranking_bar", lambda: ranking_bar_figure(metric_df, metric_key))
+
+    with tabB:
+        if tabB.open:
+            if metric_df.empty:
+                st.warning("Bu aralıkta veri yok.")
+            else:
+                show_chart("ranking_scatter", lambda: ranking_scatter_figure(metric_df, metric_key))
+
+    with tabC:
+        if tabC.open:
+            st.dataframe(metric_df, width="stretch")
 
 
 # -----------------------------
-# 1) Comparison
+# 2) Stock detail (fragment: picking a stock reruns only this part)
 # -----------------------------
-st.subheader("1) BIST100 Karşılaştırma")
+@st.fragment
+@traced_fragment
+def stock_detail_section():
+    st.subheader("2) Hisse Detayı")
 
-metric_df, _ = compute_bist100_metric(df_all, available_stocks if available_stocks else BIST100, start_date, end_date, metric_key)
+    default_hisse = "AKBNK.E" if "AKBNK.E" in available_stocks else available_stocks[0]
+    hisse = st.selectbox("Hisse seç", available_stocks, index=available_stocks.index(default_hisse))
 
-k1, k2, k3 = st.columns(3)
+    dfh = stock_slice(stock_index, hisse, start_date, end_date)
 
-with k1:
-    metric_card("Hisse Sayısı", str(len(metric_df)), "BIST100 içinde hesaplanan")
+    if dfh.empty:
+        st.warning("Seçili hisse ve tarih aralığı için veri bulunamadı.")
+        return
 
-with k2:
-    total_emir_all = int(metric_df["total_emir_period"].sum()) if not metric_df.empty else 0
-    metric_card("Toplam Emir", f"{total_emir_all:,}".replace(",", "."), "Seçili kapsam (tüm hisseler)")
+    # Calendar weeks (Mon-Sun) over the whole selected range
+    d = cached_result("detail", (hisse, str(start_date), str(end_date)),
+                      lambda: tensor_detail_data(dataset.tensor, hisse, start_date, end_date))
 
-with k3:
-    direction = "Yüksek daha iyi" if METRICS[metric_key]["better_high"] else "Düşük daha iyi"
-    metric_card("Metrik Yönü", direction, metric_key)
+    c1, c2, c3 = st.columns(3)
 
+    with c1:
+        metric_card("Seçili Hisse", hisse, "Detay analiz")
 
-tabA, tabB, tabC = st.tabs(["Bar (Ranking)", "Scatter (Metrik vs Hacim)", "Tablo"])
+    with c2:
+        metric_card("Gün Sayısı", str(d.n_days), "Seçili kapsam içinde")
 
-with tabA:
-    if metric_df.empty:
-        st.warning("Bu aralıkta veri yok.")
-    else:
-        fig = px.bar(
-            metric_df,
-            x="islem_kodu",
-            y="metric_wavg",
-            hover_data=["total_emir_period"],
-            title=METRICS[metric_key]["label"],
-            labels={"islem_kodu": "Hisse", "metric_wavg": metric_key, "total_emir_period": "Toplam Emir (Period)"},
-        )
-        fig.update_layout(xaxis_tickangle=-45, height=520)
-        st.plotly_chart(fig, use_container_width=True)
+    with c3:
+        total_emir_period = int(dfh["emir_sayisi"].sum())
+        metric_card("Toplam Emir", f"{total_emir_period:,}".replace(",", "."), "Seçili kapsam içinde")
 
-with tabB:
-    if metric_df.empty:
-        st.warning("Bu aralıkta veri yok.")
-    else:
-        fig = px.scatter(
-            metric_df,
-            x="total_emir_period",
-            y="metric_wavg",
-            hover_name="islem_kodu",
-            title=f"{metric_key} vs Toplam Emir (Period)",
-            labels={"total_emir_period": "Toplam Emir (Period)", "metric_wavg": metric_key},
-        )
-        fig.update_layout(height=520)
-        st.plotly_chart(fig, use_container_width=True)
+    st.markdown("### Hafta hafta ortalama Final State %")
+    show_chart("weekly_pct", lambda: weekly_pct_figure(d, start_date, end_date))
 
-with tabC:
-    st.dataframe(metric_df, use_container_width=True)
+    st.markdown("### Hafta hafta Final State Emir Sayısı")
+    show_chart("weekly_cnt", lambda: weekly_cnt_figure(d))
 
-# -----------------------------
-# 2) Stock detail
-# -----------------------------
-st.subheader("2) Hisse Detayı")
+    daily_week_section(d, hisse)
 
-default_hisse = "AKBNK.E" if "AKBNK.E" in available_stocks else available_stocks[0]
-hisse = st.selectbox("Hisse seç", available_stocks, index=available_stocks.index(default_hisse))
+    similarity_section(hisse)
 
-df_period = filter_period(df_all, start_date, end_date)
-dfh = df_period[df_period["islem_kodu"] == hisse].copy()
+    # Raw table (optional); built only while the expander is open
+    raw = st.expander("Seçili hisse için ham aggregated veri", expanded=SHOW_TABLE_DEFAULT, key="raw_table", on_change="rerun")
+    with raw:
+        if raw.open:
+            st.dataframe(dfh.sort_values(["tarih", "emir_sayisi"], ascending=[True, False]), width="stretch")
 
-if dfh.empty:
-    st.warning("Seçili hisse ve tarih aralığı için veri bulunamadı.")
-    st.stop()
+@st.fragment
+@traced_fragment
+def daily_week_section(d: DetailData, hisse: str):
+    # Daily views (select week): the week radio reruns only this part
+    st.markdown("### Günlük Görünüm")
+    week_label = lambda w: f"{w} ({d.week_starts[w].strftime('%Y-%m-%d')})"
+    if len(d.weeks) <= 6:
+        week_sel = st.radio("Hafta seç", d.weeks, horizontal=True, index=0)
+    else:
+        week_sel = st.select_slider("Hafta seç", d.weeks, value=d.weeks[0], format_func=week_label)
 
-month_pct, month_cnt_daily_avg, n_days = calc_month_references(dfh)
-state_order = month_pct.sort_values("emir_sayisi", ascending=False)["final_state"].tolist()
+    # anomalous (day, state) bars are outlined in red
+    alerts = anomaly_alerts(dataset.anomalies, start_date, end_date, stocks=[hisse])
 
-c1, c2, c3 = st.columns(3)
+    st.markdown(f"#### Hafta {week_sel} — Günlük Final State %")
+    show_chart("daily_pct", lambda: daily_pct_figure(d, week_sel, alerts))
 
-with c1:
-    metric_card("Seçili Hisse", hisse, "Detay analiz")
+    st.markdown(f"#### Hafta {week_sel} — Günlük Final State Emir Sayısı")
+    show_chart("daily_cnt", lambda: daily_cnt_figure(d, week_sel, alerts))
 
-with c2:
-    metric_card("Gün Sayısı", str(n_days), "Seçili kapsam içinde")
 
-with c3:
-    total_emir_period = int(dfh.groupby("tarih")["emir_sayisi"].sum().sum())
-    metric_card("Toplam Emir", f"{total_emir_period:,}".replace(",", "."), "Seçili kapsam içinde")
+@st.fragment
+@traced_fragment
+def similarity_section(hisse: str):
+    # Nearest neighbours by final-state mix over every loaded ticker; one distance matrix per
+    # (range, distance), shared through the result cache
+    st.markdown("### Benzer Hisseler (Final State karışımı)")
+    metric = st.radio("Mesafe", ["js", "cosine"], horizontal=True, key="sim_metric",
+                      format_func={"js": "Jensen-Shannon", "cosine": "Kosinüs"}.get)
+    sim = cached_result(
+        "similarity", (str(start_date), str(end_date), metric),
+        lambda: ticker_similarity(dataset.prefix, start_date, end_date, metric=metric),
+    )
+    neighbours = nearest_neighbours(sim, hisse, n=10)
+    if neighbours.empty:
+        st.info("Seçili hisse için benzerlik hesaplanamadı (aralıkta emir yok).")
+        return
+    st.dataframe(
+        neighbours.rename(columns={"islem_kodu": "Hisse", "mesafe": "Mesafe", "kume": "Küme"}),
+        width="stretch", hide_index=True,
+    )
 
+    heat = st.expander("Benzerlik ısı haritası (kümelenmiş)", expanded=False, key="sim_heatmap", on_change="rerun")
+    with heat:
+        if heat.open:
+            show_chart("similarity", lambda: similarity_heatmap_figure(sim, highlight=hisse))
 
-# Weekly (assume first 20 trading days => 4 weeks)
-dfw = add_week_index(dfh, n_days=20)
 
+# -----------------------------
+# 3) Time series (fragment; bucketed from the prefix index, WebGL + server-side downsampling)
+# -----------------------------
+@st.fragment
+@traced_fragment
+def timeseries_section():
+    st.subheader("3) Zaman Serisi")
+
+    default_hisse = "AKBNK.E" if "AKBNK.E" in available_stocks else available_stocks[0]
+    states = list(dataset.prefix.states)
+    default_states = [s for s in ("Trade", "CanceledByUser", "Expired") if s in states] or states[:1]
+
+    c1, c2 = st.columns(2)
+    with c1:
+        tickers = st.multiselect("Hisseler", available_stocks, default=[default_hisse], key="ts_tickers")
+    with c2:
+        sel_states = st.multiselect("Final State", states, default=default_states, key="ts_states")
+    c3, c4 = st.columns(2)
+    with c3:
+        bucket = st.radio("Periyot", list(BUCKET_FREQS), horizontal=True, key="ts_bucket")
+    with c4:
+        measure = st.radio("Ölçü", ["Yüzde", "Emir Sayısı"], horizontal=True, key="ts_measure")
+
+    if not tickers or not sel_states:
+        st.info("En az bir hisse ve bir final state seçin.")
+        return
+
+    x, counts, totals = bucket_series(dataset.prefix, tickers, start_date, end_date, BUCKET_FREQS[bucket])
+    if len(x) == 0:
+        st.warning("Bu aralıkta veri yok.")
+        return
 
-st.markdown("### Hafta hafta ortalama Final State %")
-weekly_pct = dfw.groupby(["hafta", "final_state"], as_index=False)["yuzde"].mean()
+    state_pos = {s: i for i, s in enumerate(states)}
+    known = set(dataset.prefix.tickers)
+    series = {}
+    for k, t in enumerate(t for t in tickers if t in known):
+        for s in sel_states:
+            y = counts[:, k, state_pos[s]].astype(float)
+            if measure == "Yüzde":
+                # Share of the bucket's orders; buckets without orders become gaps
+                tot = totals[:, k]
+                y = np.where(tot > 0, y / np.maximum(tot, 1) * 100, np.nan)
+            series[f"{t} · {s}"] = y
 
-fig1 = go.Figure()
-for w in [1, 2, 3, 4]:
-    sub = (weekly_pct[weekly_pct["hafta"] == w]
-            .set_index("final_state")
-            .reindex(state_order)
-            .fillna(0))
-    fig1.add_trace(go.Bar(name=f"Hafta {w} (Ort.)", x=state_order, y=sub["yuzde"].values))
+    title = f"{bucket} {measure} ({start_date.strftime('%Y-%m-%d')} → {end_date.strftime('%Y-%m-%d')})"
+    show_chart("timeseries", lambda: timeseries_figure(x, series, title, measure))
 
-mref_pct = (month_pct.set_index("final_state").reindex(state_order).fillna(0))
-fig1.add_trace(black_ref_bar(f"Ay Toplamı ({start_date.strftime('%Y-%m-%d')}→{end_date.strftime('%Y-%m-%d')})",
-                                state_order, mref_pct["yuzde"].values))
 
-fig1.update_layout(
-    barmode="group",
-    height=520,
-    title="Hafta Hafta Ortalama % + Ay Toplamı",
-    xaxis_title="Final State",
-    yaxis_title="Yüzde",
-    yaxis=dict(range=[0, 100]),
-    legend_title="Seriler",
-)
-st.plotly_chart(fig1, use_container_width=True)
-
-st.markdown("### Hafta hafta Final State Emir Sayısı")
-weekly_cnt = dfw.groupby(["hafta", "final_state"], as_index=False)["emir_sayisi"].sum()
-
-fig2 = go.Figure()
-for w in [1, 2, 3, 4]:
-    sub = (weekly_cnt[weekly_cnt["hafta"] == w]
-            .set_index("final_state")
-            .reindex(state_order)
-            .fillna(0))
-    fig2.add_trace(go.Bar(name=f"Hafta {w} (Toplam)", x=state_order, y=sub["emir_sayisi"].values))
-
-# Monthly reference for weekly counts: daily avg * 5 (benchmark)
-mref_week = (month_cnt_daily_avg.set_index("final_state").reindex(state_order).fillna(0)).copy()
-mref_week["emir_sayisi"] = mref_week["emir_sayisi"] * 5
-fig2.add_trace(black_ref_bar("Ay Ort. (5 gün beklenen)", state_order, mref_week["emir_sayisi"].values))
-
-fig2.update_layout(
-    barmode="group",
-    height=520,
-    title="Hafta Hafta Toplam Emir + Ay Ort. (5 gün beklenen)",
-    xaxis_title="Final State",
-    yaxis_title="Emir Sayısı",
-    legend_title="Seriler",
-)
-st.plotly_chart(fig2, use_container_width=True)
-
-# Daily views (select week)
-st.markdown("### Günlük Görünüm")
-week_sel = st.radio("Hafta seç", [1, 2, 3, 4], horizontal=True, index=0)
-
-df_week = dfw[dfw["hafta"] == week_sel].copy()
-days = sorted(df_week["tarih"].unique())
-
-
-st.markdown(f"#### Hafta {week_sel} — Günlük Final State %")
-fig3 = go.Figure()
-for d in days:
-    dstr = pd.to_datetime(d).strftime("%Y-%m-%d")
-    sub = (df_week[df_week["tarih"] == d]
-            .set_index("final_state")
-            .reindex(state_order)
-            .fillna(0))
-    fig3.add_trace(go.Bar(name=dstr, x=state_order, y=sub["yuzde"].values))
-
-fig3.add_trace(black_ref_bar("Ay Toplamı", state_order, mref_pct["yuzde"].values))
-fig3.update_layout(
-    barmode="group",
-    height=520,
-    title=f"Hafta {week_sel} — Günlük % + Ay Toplamı",
-    xaxis_title="Final State",
-    yaxis_title="Yüzde",
-    yaxis=dict(range=[0, 100]),
-    legend_title="Seriler",
-)
-st.plotly_chart(fig3, use_container_width=True)
-
-st.markdown(f"#### Hafta {week_sel} — Günlük Final State Emir Sayısı")
-fig4 = go.Figure()
-for d in days:
-    dstr = pd.to_datetime(d).strftime("%Y-%m-%d")
-    sub = (df_week[df_week["tarih"] == d]
-            .set_index("final_state")
-            .reindex(state_order)
-            .fillna(0))
-    fig4.add_trace(go.Bar(name=dstr, x=state_order, y=sub["emir_sayisi"].values))
-
-# Monthly reference for daily counts: daily avg per state
-mref_daily = (month_cnt_daily_avg.set_index("final_state").reindex(state_order).fillna(0))
-fig4.add_trace(black_ref_bar("Ay Günlük Ort.", state_order, mref_daily["emir_sayisi"].values))
-
-fig4.update_layout(
-    barmode="group",
-    height=520,
-    title=f"Hafta {week_sel} — Günlük Emir Sayısı + Ay Günlük Ort.",
-    xaxis_title="Final State",
-    yaxis_title="Emir Sayısı",
-    legend_title="Seriler",
-)
-st.plotly_chart(fig4, use_container_width=True)
+# -----------------------------
+# 4) Anomaly alerts (fragment; EWMA z-scores kept up to date as days are appended)
+# -----------------------------
+@st.fragment
+@traced_fragment
+def anomaly_section():
+    st.subheader("4) Anomali Uyarıları")
+    st.caption("Her hisse ve final state için günlük payın kendi geçmişine göre EWMA z-skoru "
+               "(yalnızca seçili tarih aralığındaki günler listelenir).")
+
+    states = list(dataset.prefix.states)
+    default_states = [s for s in ("CanceledByUser", "Expired") if s in states] or states[:1]
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        sel_states = st.multiselect("Final State", states, default=default_states, key="an_states")
+    with c2:
+        z_min = st.slider("|z| eşiği", min_value=ANOMALY_Z, max_value=10.0, value=ANOMALY_Z, step=0.5, key="an_z")
+    with c3:
+        scope = st.radio("Hisseler", ["BIST100", "Tümü"], horizontal=True, key="an_scope")
+
+    alerts = anomaly_alerts(dataset.anomalies, start_date, end_date,
+                            stocks=available_stocks if scope == "BIST100" else None, states=sel_states, z_min=z_min)
+    metric_card("Uyarı Sayısı", str(len(alerts)), f"|z| ≥ {z_min:g}")
+    if alerts.empty:
+        st.info("Seçili aralıkta uyarı yok.")
+        return
+    st.dataframe(
+        alerts.assign(tarih=alerts["tarih"].dt.strftime("%Y-%m-%d")).rename(columns={
+            "tarih": "Tarih", "islem_kodu": "Hisse", "final_state": "Final State", "yuzde": "Yüzde",
+            "ewma_ort": "EWMA Ort.", "ewma_std": "EWMA Std", "z": "z",
+        }),
+        width="stretch", hide_index=True,
+    )
+
+
+comparison_section()
+stock_detail_section()
+timeseries_section()
+anomaly_section()
 
-# Raw table (optional)
-with st.expander("Seçili hisse için ham aggregated veri", expanded=SHOW_TABLE_DEFAULT):
-    st.dataframe(dfh.sort_values(["tarih", "emir_sayisi"], ascending=[True, False]), use_container_width=True)
+remember_perf_run(perf.finish_run())
+if perf.ENABLED:
+    perf_panel()
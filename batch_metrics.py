@@ -0,0 +1,174 @@
+# batch_metrics.py
+# Batch CLI: every METRICS entry for every ticker and period, written to parquet or CSV.
+# Requirements: pandas, duckdb, pyarrow (no Streamlit)
+#
+# Each period (calendar month by default) is computed by one worker process: it reads only that
+# month from PARQUET_PATH (date filter pushed into the scan) and runs compute_all_metrics, a
+# single DuckDB query that produces all metric columns at once. Metrics do not depend on the
+# universe, so each period is computed once and then ranked within every requested universe
+# (membership from universes.csv as of the period's end date).
+#
+# Output (long format, one row per period x universe x metric x ticker):
+#   period, start_date, end_date, universe, metric, islem_kodu, metric_wavg, total_emir_period, rank
+# The parquet output records the dataset fingerprint in its metadata; app.py serves rankings from it
+# (RANKINGS_PATH) while the fingerprint matches the loaded dataset.
+#
+# Run:
+#   python batch_metrics.py final_state_daily_bist100.parquet metrics.parquet
+#   python batch_metrics.py final_state_daily_bist100.parquet metrics.parquet --universe "*"
+#   python batch_metrics.py data/final_state_daily metrics.csv --universe ALL --workers 8
+#   python batch_metrics.py data/final_state_daily metrics.parquet --period all --start 2025-01-01
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from bist_metrics import (
+    METRICS,
+    compute_all_metrics,
+    dataset_fingerprint,
+    file_fingerprints,
+    load_all_daily_states,
+    load_universes,
+    parquet_source_sql,
+    universe_members,
+    universe_names,
+)
+
+RANKING_COLUMNS = ["period", "start_date", "end_date", "universe", "metric", "islem_kodu", "metric_wavg",
+                   "total_emir_period", "rank"]
+
+
+def list_periods(parquet_path: str, period: str, start_date=None, end_date=None) -> list[tuple[str, pd.Timestamp, pd.Timestamp]]:
+    import duckdb
+
+    con = duckdb.connect(database=":memory:")
+    lo, hi = con.execute(f"SELECT MIN(tarih), MAX(tarih) FROM {parquet_source_sql(parquet_path)}").fetchone()
+    con.close()
+    if lo is None:
+        return []
+    lo = max(pd.Timestamp(lo), pd.Timestamp(start_date)) if start_date else pd.Timestamp(lo)
+    hi = min(pd.Timestamp(hi), pd.Timestamp(end_date)) if end_date else pd.Timestamp(hi)
+    if period == "all":
+        return [(f"{lo:%Y-%m-%d}_{hi:%Y-%m-%d}", lo, hi)]
+    months = pd.period_range(lo, hi, freq="M")
+    return [(str(m), max(m.start_time.normalize(), lo), min(m.end_time.normalize(), hi)) for m in months]
+
+
+def rank_within(wide: pd.DataFrame) -> pd.DataFrame:
+    # wide (one column per metric) -> long with rank 1 = best: descending when higher is better
+    long = wide.melt(id_vars=["islem_kodu", "total_emir_period"], value_vars=list(METRICS),
+                     var_name="metric", value_name="metric_wavg")
+    better_high = long["metric"].map({k: v["better_high"] for k, v in METRICS.items()})
+    signed = long["metric_wavg"].where(better_high, -long["metric_wavg"])
+    long["rank"] = signed.groupby(long["metric"]).rank(ascending=False, method="min").astype("int32")
+    return long
+
+
+def compute_period(parquet_path: str, label: str, start_date: pd.Timestamp, end_date: pd.Timestamp,
+                   universes: pd.DataFrame, names: list[str]) -> pd.DataFrame:
+    df = load_all_daily_states(parquet_path, start_date, end_date)
+    if df.empty:
+        return pd.DataFrame()
+    tickers = sorted(map(str, df["islem_kodu"].unique()))
+    wide = compute_all_metrics(df, tickers, start_date, end_date)
+
+    parts = []
+    for name in names:
+        members = universe_members(universes, name, end_date)
+        sub = wide if members is None else wide[wide["islem_kodu"].isin(members)]
+        if sub.empty:
+            continue
+        long = rank_within(sub)
+        long.insert(0, "universe", name)
+        parts.append(long)
+    if not parts:
+        return pd.DataFrame()
+    out = pd.concat(parts, ignore_index=True)
+    out.insert(0, "period", label)
+    out.insert(1, "start_date", start_date)
+    out.insert(2, "end_date", end_date)
+    return out[RANKING_COLUMNS]
+
+
+def resolve_universes(universes: pd.DataFrame, spec: str) -> list[str]:
+    # "*" = every universe in the file + ALL; otherwise a comma list, matched case-insensitively
+    known = universe_names(universes)
+    if spec.strip() == "*":
+        return known
+    by_lower = {n.lower(): n for n in known}
+    names = []
+    for part in spec.split(","):
+        name = by_lower.get(part.strip().lower())
+        if name is None:
+            raise ValueError(f"unknown universe: {part.strip()} (known: {', '.join(known)})")
+        names.append(name)
+    return names
+
+
+def run_batch(parquet_path: str, period: str = "month", universe: str = "BIST100", workers: int = 0,
+              start_date=None, end_date=None, universes_path: str | None = "universes.csv") -> pd.DataFrame:
+    universes = load_universes(universes_path)
+    names = resolve_universes(universes, universe)
+    periods = list_periods(parquet_path, period, start_date, end_date)
+    if not periods:
+        return pd.DataFrame()
+    workers = workers or min(len(periods), os.cpu_count() or 1)
+    if workers <= 1 or len(periods) == 1:
+        frames = [compute_period(parquet_path, label, lo, hi, universes, names) for label, lo, hi in periods]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(compute_period, parquet_path, label, lo, hi, universes, names)
+                       for label, lo, hi in periods]
+            frames = [f.result() for f in futures]
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True).sort_values(["period", "universe", "metric", "rank", "islem_kodu"],
+                                                           ignore_index=True)
+
+
+def write_rankings(out: pd.DataFrame, out_path: str, parquet_path: str) -> None:
+    if out_path.endswith(".csv"):
+        out.to_csv(out_path, index=False)
+        return
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(out, preserve_index=False)
+    fingerprint = dataset_fingerprint(file_fingerprints(parquet_path))
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"dataset_fingerprint": fingerprint.encode()})
+    pq.write_table(table, out_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tüm metrikleri tüm hisse ve dönemler için hesaplar")
+    parser.add_argument("parquet_path", nargs="?", default=os.getenv("PARQUET_PATH", "final_state_daily_bist100.parquet"),
+                        help="final state parquet dosyası, glob veya hive-partitioned dizin")
+    parser.add_argument("out_path", nargs="?", default="metrics.parquet", help="çıktı (.parquet veya .csv)")
+    parser.add_argument("--period", choices=["month", "all"], default="month")
+    parser.add_argument("--universe", default="BIST100",
+                        help='evren(ler), virgülle ayrılmış (örn. BIST100,BANKA,ALL) veya "*" = hepsi')
+    parser.add_argument("--universes-file", default=os.getenv("UNIVERSES_PATH", "universes.csv"),
+                        help="tarihli endeks üyelikleri (universe, islem_kodu, start_date, end_date)")
+    parser.add_argument("--start", default=None, help="YYYY-MM-DD")
+    parser.add_argument("--end", default=None, help="YYYY-MM-DD")
+    parser.add_argument("--workers", type=int, default=0, help="process sayısı (0 = dönem sayısı / CPU)")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    try:
+        out = run_batch(args.parquet_path, args.period, args.universe, args.workers, args.start, args.end,
+                        args.universes_file)
+    except ValueError as e:
+        parser.error(str(e))
+    write_rankings(out, args.out_path, args.parquet_path)
+    n_periods = out["period"].nunique() if not out.empty else 0
+    print(f"{n_periods} dönem, {len(out):,} satır -> {args.out_path} ({time.perf_counter() - t0:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
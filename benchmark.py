@@ -0,0 +1,239 @@
+# benchmark.py
+# Benchmark suite for the compute layer (bist_metrics.py) on deterministic synthetic data.
+# Requirements: pandas, numpy, duckdb, pyarrow, plotly (charts.py detail tables)
+#
+# The generator (synthetic.py) writes parquet files with the same schema as
+# final_state_daily_bist100.parquet (tarih, islem_kodu, final_state, emir_sayisi, yuzde). The same
+# (tickers, days, seed) always gives the same file, so timings from different commits are
+# comparable. Files are cached in bench_data/.
+#
+# For every size preset each function is timed (best and median of --repeat runs), then run once
+# more under tracemalloc for its peak Python/numpy allocation. DuckDB's own memory is not visible
+# to tracemalloc; max_rss_mib is the process peak RSS so far (it never goes down). Results are
+# appended as JSON lines (one record per size x function) so runs can be compared with --compare.
+#
+# Run:
+#   python benchmark.py run --sizes month,year --repeat 5
+#   python benchmark.py run --sizes market --out bench_results.jsonl --compare baseline.jsonl
+#   python benchmark.py run --sizes month --check     # also check pandas/duckdb/prefix rankings and the
+#                                                      # pandas/tensor detail tables agree
+#   python benchmark.py generate synthetic.parquet --tickers 500 --years 5
+
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from bist_metrics import (
+    METRICS,
+    add_week_index,
+    build_daily_tensor,
+    build_prefix_index,
+    build_stock_index,
+    calc_month_references,
+    compute_all_metrics,
+    compute_bist100_metric,
+    load_all_daily_states,
+    range_ranking,
+    stock_slice,
+)
+from charts import detail_data, tensor_detail_data
+from synthetic import check_detail_equivalence, check_equivalence, generate_daily_states
+
+BENCH_DIR = os.getenv("BENCH_DIR", "bench_data")
+
+# name -> (tickers, trading days); month matches the bundled file, market is 500+ tickers x 5 years
+SIZES = {
+    "month": (100, 20),
+    "quarter": (100, 63),
+    "year": (300, 252),
+    "market": (520, 1260),
+}
+
+# -----------------------------
+# Synthetic data
+# -----------------------------
+def synthetic_path(n_tickers: int, n_days: int, seed: int = 0) -> str:
+    # Cached per (tickers, days, seed); the generator is deterministic so a cached file is reused as is
+    path = os.path.join(BENCH_DIR, f"synthetic_{n_tickers}t_{n_days}d_s{seed}.parquet")
+    if not os.path.exists(path):
+        os.makedirs(BENCH_DIR, exist_ok=True)
+        pq.write_table(generate_daily_states(n_tickers, n_days, seed=seed), path + ".tmp")
+        os.replace(path + ".tmp", path)
+    return path
+
+
+# -----------------------------
+# Measurements
+# -----------------------------
+def measure(fn, repeat: int = 3) -> dict:
+    # Timings without tracemalloc (it slows allocation-heavy code), then one traced run for peak memory
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"best_s": min(times), "median_s": statistics.median(times), "peak_py_mib": peak / 2**20}
+
+
+def bench_cases(path: str, frame: pd.DataFrame) -> dict:
+    # name -> zero-arg callable; every case works on the full synthetic range and universe
+    stocks = sorted(str(c) for c in frame["islem_kodu"].cat.categories)
+    start, end = frame["tarih"].min(), frame["tarih"].max()
+    index = build_stock_index(frame)
+    tensor = build_daily_tensor(frame)
+    prefix = build_prefix_index(frame, tensor)
+    metric_key = next(iter(METRICS))
+    ticker = stocks[0]
+    return {
+        "load_all_daily_states": lambda: load_all_daily_states(path),
+        "build_stock_index": lambda: build_stock_index(frame),
+        "build_daily_tensor": lambda: build_daily_tensor(frame),
+        "build_prefix_index": lambda: build_prefix_index(frame, tensor),
+        "compute_bist100_metric[pandas]": lambda: compute_bist100_metric(frame, stocks, start, end, metric_key, engine="pandas"),
+        "compute_bist100_metric[duckdb]": lambda: compute_bist100_metric(frame, stocks, start, end, metric_key, index=index, engine="duckdb"),
+        "compute_all_metrics": lambda: compute_all_metrics(frame, stocks, start, end),
+        "range_ranking": lambda: range_ranking(prefix, stocks, start, end, metric_key),
+        "add_week_index": lambda: add_week_index(frame),
+        "calc_month_references": lambda: calc_month_references(frame),
+        "detail_data[pandas]": lambda: detail_data(stock_slice(index, ticker, start, end)),
+        "detail_data[tensor]": lambda: tensor_detail_data(tensor, ticker, start, end),
+    }
+
+
+def run_info() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import duckdb
+
+    return {
+        "run_at": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "host": platform.node(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "duckdb": duckdb.__version__,
+    }
+
+
+def run_suite(sizes: list[str], repeat: int = 3, only: list[str] | None = None, check: bool = False,
+              seed: int = 0) -> list[dict]:
+    info = run_info()
+    records = []
+    for size in sizes:
+        n_tickers, n_days = SIZES[size]
+        path = synthetic_path(n_tickers, n_days, seed)
+        frame = load_all_daily_states(path)
+        if check:
+            check_equivalence(frame)
+            print(f"[{size}] pandas / duckdb / prefix sıralamaları eşit")
+            check_detail_equivalence(frame)
+            print(f"[{size}] pandas / tensor hisse detay tabloları eşit")
+        for name, fn in bench_cases(path, frame).items():
+            if only and not any(o in name for o in only):
+                continue
+            m = measure(fn, repeat)
+            records.append({
+                **info,
+                "size": size,
+                "tickers": n_tickers,
+                "days": n_days,
+                "rows": len(frame),
+                "function": name,
+                "repeat": repeat,
+                **m,
+                "rows_per_s": len(frame) / m["best_s"] if m["best_s"] else None,
+                "max_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            })
+            print(f"[{size}] {name:<32} {m['best_s'] * 1000:>10.1f} ms  {m['peak_py_mib']:>9.1f} MiB  "
+                  f"{records[-1]['rows_per_s']:>14,.0f} satır/s")
+    return records
+
+
+def compare(records: list[dict], baseline_path: str) -> None:
+    # Latest baseline record per (size, function) vs this run; ratio > 1 means slower now
+    baseline = {}
+    with open(baseline_path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                r = json.loads(line)
+                baseline[(r["size"], r["function"])] = r
+    print(f"Karşılaştırma ({baseline_path}):")
+    for r in records:
+        b = baseline.get((r["size"], r["function"]))
+        if b is None:
+            continue
+        ratio = r["best_s"] / b["best_s"] if b["best_s"] else float("nan")
+        print(f"[{r['size']}] {r['function']:<32} {b['best_s'] * 1000:>10.1f} -> {r['best_s'] * 1000:>10.1f} ms  "
+              f"x{ratio:5.2f}  ({b.get('commit')} -> {r.get('commit')})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="bist_metrics fonksiyonları için sentetik veri üzerinde benchmark")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_run = sub.add_parser("run", help="benchmark çalıştırır, sonuçları JSON lines olarak ekler")
+    p_run.add_argument("--sizes", default="month,year", help=f"virgülle ayrılmış: {','.join(SIZES)}")
+    p_run.add_argument("--repeat", type=int, default=3, help="fonksiyon başına tekrar sayısı")
+    p_run.add_argument("--only", default=None, help="yalnızca adında bu parçaları içeren fonksiyonlar (virgülle)")
+    p_run.add_argument("--out", default="bench_results.jsonl", help="sonuç dosyası (JSON lines, sona eklenir)")
+    p_run.add_argument("--compare", default=None, help="önceki bir sonuç dosyası ile karşılaştır")
+    p_run.add_argument("--check", action="store_true", help="pandas/duckdb/prefix sıralama ve pandas/tensor detay eşitliğini doğrula")
+    p_run.add_argument("--seed", type=int, default=0)
+
+    p_gen = sub.add_parser("generate", help="sentetik final_state_daily parquet üretir")
+    p_gen.add_argument("out_path")
+    p_gen.add_argument("--tickers", type=int, default=100)
+    p_gen.add_argument("--days", type=int, default=20, help="işlem günü sayısı")
+    p_gen.add_argument("--years", type=float, default=None, help="gün yerine yıl (252 işlem günü/yıl)")
+    p_gen.add_argument("--start", default="2025-11-03")
+    p_gen.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.cmd == "generate":
+        n_days = int(args.years * 252) if args.years else args.days
+        t0 = time.perf_counter()
+        table = generate_daily_states(args.tickers, n_days, args.start, args.seed)
+        pq.write_table(table, args.out_path)
+        print(f"{table.num_rows:,} satır ({args.tickers} hisse x {n_days} gün) -> {args.out_path} "
+              f"({time.perf_counter() - t0:.1f}s)")
+        return
+
+    sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        parser.error(f"bilinmeyen boyut: {', '.join(unknown)}")
+    only = [o.strip() for o in args.only.split(",")] if args.only else None
+
+    records = run_suite(sizes, args.repeat, only, args.check, args.seed)
+    if args.compare:
+        compare(records, args.compare)
+    with open(args.out, "a", encoding="utf-8") as f:
+        for r in records:
+            f.write(json.dumps(r) + "\n")
+    print(f"{len(records)} sonuç -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
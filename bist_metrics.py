@@ -0,0 +1,1195 @@
+# bist_metrics.py
+# Headless compute layer for the BIST100 final state dashboard: loading, indexing and metrics.
+# No Streamlit dependency; app.py, batch_metrics.py and other batch jobs import from here.
+# Requirements: pandas, numpy, duckdb, pyarrow (duckdb / pyarrow are imported on first use)
+
+from __future__ import annotations
+
+import functools
+import glob
+import hashlib
+import os
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from perf import timed
+
+# -----------------------------
+# BIST100 list (with .E suffix)
+# -----------------------------
+BIST100 = [
+    "AEFES.E", "AGHOL.E", "AKBNK.E", "AKSA.E", "AKSEN.E", "ALARK.E", "ALTNY.E", "ANSGR.E", "ARCLK.E", "ASELS.E", "ASTOR.E", "BALSU.E",
+    "BIMAS.E", "BRSAN.E", "BRYAT.E", "BSOKE.E", "BTCIM.E", "CANTE.E", "CCOLA.E", "CIMSA.E", "CWENE.E", "DAPGM.E", "DOAS.E", "DOHOL.E",
+    "DSTKF.E", "ECILC.E", "EFOR.E", "EGEEN.E", "EKGYO.E", "ENERY.E", "ENJSA.E", "ENKAI.E", "EREGL.E", "EUPWR.E", "FENER.E", "FROTO.E",
+    "GARAN.E", "GENIL.E", "GESAN.E", "GLRMK.E", "GRSEL.E", "GRTHO.E", "GSRAY.E", "GUBRF.E", "HALKB.E", "HEKTS.E", "ISCTR.E", "ISMEN.E",
+    "IZENR.E", "KCAER.E", "KCHOL.E", "KLRHO.E", "KONTR.E", "KRDMD.E", "KTLEV.E", "KUYAS.E", "MAGEN.E", "MAVI.E", "MGROS.E", "MIATK.E",
+    "MPARK.E", "OBAMS.E", "ODAS.E", "OTKAR.E", "OYAKC.E", "PASEU.E", "PATEK.E", "PETKM.E", "PGSUS.E", "QUAGR.E", "RALYH.E", "REEDR.E",
+    "SAHOL.E", "SASA.E", "SISE.E", "SKBNK.E", "SOKM.E", "TABGD.E", "TAVHL.E", "TCELL.E", "THYAO.E", "TKFEN.E", "TOASO.E", "TRALT.E",
+    "TRENJ.E", "TRMET.E", "TSKB.E", "TSPOR.E", "TTKOM.E", "TTRAK.E", "TUKAS.E", "TUPRS.E", "TUREX.E", "TURSG.E", "ULKER.E", "VAKBN.E",
+    "VESTL.E", "YEOTK.E", "YKBNK.E", "ZOREN.E"
+]
+
+# -----------------------------
+# Metrics
+# -----------------------------
+METRICS = {
+    "EQS (w.avg)": {
+        "label": "EQS = Trade% - CanceledByUser% - Expired% (volume-weighted)",
+        "better_high": True,
+    },
+    "Trade% (w.avg)": {
+        "label": "Trade% (volume-weighted)",
+        "better_high": True,
+    },
+    "CanceledByUser% (w.avg)": {
+        "label": "CanceledByUser% (volume-weighted) — lower is better",
+        "better_high": False,
+    },
+    "Expired% (w.avg)": {
+        "label": "Expired% (volume-weighted) — lower is better",
+        "better_high": False,
+    },
+    "Cancel/Trade (w.avg)": {
+        "label": "CanceledByUser% / Trade% (volume-weighted) — lower is better",
+        "better_high": False,
+    },
+}
+
+# Daily metric value per (tarih, islem_kodu) as a SQL expression over the daily state percentages
+METRIC_SQL = {
+    "EQS (w.avg)": "trade_pct - cancel_pct - expired_pct",
+    "Trade% (w.avg)": "trade_pct",
+    "CanceledByUser% (w.avg)": "cancel_pct",
+    "Expired% (w.avg)": "expired_pct",
+    "Cancel/Trade (w.avg)": "COALESCE(cancel_pct / NULLIF(trade_pct, 0), 0.0)",
+}
+
+# -----------------------------
+# Universes (dated constituents)
+# -----------------------------
+# universes.csv: universe, islem_kodu, start_date, end_date (empty date = open-ended), one row per
+# membership interval, so a ticker leaving and re-joining an index has two rows.
+UNIVERSE_ALL = "ALL"   # implicit universe: every ticker in the data
+
+def load_universes(path: str | None = None) -> pd.DataFrame:
+    # Without a file only the built-in (undated) BIST100 list is known
+    if path and os.path.exists(path):
+        u = pd.read_csv(path, dtype=str, keep_default_na=False)
+    else:
+        u = pd.DataFrame({"universe": "BIST100", "islem_kodu": BIST100, "start_date": "", "end_date": ""})
+    u = u[["universe", "islem_kodu", "start_date", "end_date"]].copy()
+    for col in ("universe", "islem_kodu"):
+        u[col] = u[col].str.strip()
+    for col in ("start_date", "end_date"):
+        u[col] = pd.to_datetime(u[col].str.strip().replace("", None), format="%Y-%m-%d")
+    return u
+
+def universe_names(universes: pd.DataFrame) -> list[str]:
+    # File order, then the implicit full market
+    return list(dict.fromkeys(universes["universe"])) + [UNIVERSE_ALL]
+
+def universe_members(universes: pd.DataFrame, name: str, as_of) -> list[str] | None:
+    # Constituents on as_of (a period is ranked with its end-date membership); None = no restriction
+    if name == UNIVERSE_ALL:
+        return None
+    as_of = pd.Timestamp(as_of)
+    u = universes[universes["universe"] == name]
+    valid = (u["start_date"].isna() | (u["start_date"] <= as_of)) & (u["end_date"].isna() | (u["end_date"] >= as_of))
+    return sorted(u.loc[valid, "islem_kodu"].unique())
+
+
+# -----------------------------
+# Load parquet
+# -----------------------------
+# Known final states first (stable category codes); any other state in the data is appended after them
+FINAL_STATES = ["Trade", "CanceledByUser", "Expired", "New"]
+
+# Column coercion done once inside the scan: date-typed tarih, integer counts, float32 percentages.
+# Counts are read as BIGINT (an INTEGER cast would turn counts >= 2**31 into NULL and then 0) and
+# narrowed to int32 afterwards only when they all fit (compact_counts).
+SELECT_COERCED = """
+    CAST(tarih AS DATE) AS tarih,
+    CAST(islem_kodu AS VARCHAR) AS islem_kodu,
+    CAST(final_state AS VARCHAR) AS final_state,
+    COALESCE(TRY_CAST(emir_sayisi AS BIGINT), 0) AS emir_sayisi,
+    COALESCE(TRY_CAST(yuzde AS FLOAT), 0.0) AS yuzde
+"""
+
+def compact_counts(counts: np.ndarray) -> np.ndarray:
+    # int32 when every count fits, otherwise int64 as read: never wraps or zeroes a large count
+    if len(counts) == 0 or (counts.min() >= -2**31 and counts.max() < 2**31):
+        return counts.astype(np.int32, copy=False)
+    return counts.astype(np.int64, copy=False)
+
+def parquet_source_sql(parquet_path: str, files: list[str] | None = None) -> str:
+    # A directory is read as a hive-partitioned dataset (e.g. year=2025/month=11/...), a path with
+    # wildcards as a glob of files, anything else as a single parquet file.
+    # files: read only these files of the dataset (incremental append).
+    hive = os.path.isdir(parquet_path)
+    if files is not None:
+        file_list = "[" + ", ".join(f"'{f}'" for f in files) + "]"
+        return f"read_parquet({file_list}, hive_partitioning = {str(hive).lower()})"
+    if hive:
+        pattern = os.path.join(parquet_path, "**", "*.parquet")
+        return f"read_parquet('{pattern}', hive_partitioning = true)"
+    return f"read_parquet('{parquet_path}')"
+
+def dataset_files(parquet_path: str) -> list[str]:
+    if os.path.isdir(parquet_path):
+        return sorted(glob.glob(os.path.join(parquet_path, "**", "*.parquet"), recursive=True))
+    if glob.has_magic(parquet_path):
+        return sorted(glob.glob(parquet_path, recursive=True))
+    return [parquet_path]
+
+@functools.lru_cache(maxsize=16384)
+def _parquet_footer(path: str, mtime_ns: int, size: int) -> tuple:
+    # mtime/size are part of the key so the footer is only re-read when the file changes
+    import pyarrow.parquet as pq
+
+    md = pq.read_metadata(path)
+    return (md.num_rows, md.num_row_groups, md.serialized_size, md.created_by)
+
+def file_fingerprints(parquet_path: str) -> dict[str, tuple]:
+    out = {}
+    for f in dataset_files(parquet_path):
+        stat = os.stat(f)
+        out[f] = (stat.st_mtime_ns, stat.st_size) + _parquet_footer(f, stat.st_mtime_ns, stat.st_size)
+    return out
+
+def dataset_fingerprint(fingerprints: dict[str, tuple]) -> str:
+    h = hashlib.sha1()
+    for f in sorted(fingerprints):
+        h.update(repr((f, fingerprints[f])).encode())
+    return h.hexdigest()[:16]
+
+def scan_filters(columns: list[str], start_date=None, end_date=None, stocks=None):
+    # WHERE clause + params for the scan. Filters on partition columns (year, month, islem_kodu) let
+    # DuckDB skip whole directories; the tarih / islem_kodu filters also prune row groups by their stats.
+    where, params = [], []
+    for bound, op in ((start_date, ">="), (end_date, "<=")):
+        if bound is None:
+            continue
+        bound = pd.Timestamp(bound)
+        where.append(f"tarih {op} ?")
+        params.append(bound.date())
+        if "year" in columns and "month" in columns:
+            where.append(f"year * 100 + month {op} ?")
+            params.append(bound.year * 100 + bound.month)
+        elif "year" in columns:
+            where.append(f"year {op} ?")
+            params.append(bound.year)
+    if stocks is not None:
+        stocks = list(stocks)
+        if stocks:
+            where.append(f"islem_kodu IN ({', '.join('?' for _ in stocks)})")
+            params.extend(stocks)
+        else:
+            where.append("FALSE")
+    return (" WHERE " + " AND ".join(where)) if where else "", params
+
+@timed("load_parquet")
+def load_all_daily_states(parquet_path: str, start_date=None, end_date=None, stocks: tuple[str, ...] | None = None,
+                          files: list[str] | None = None, mode: str = "duckdb",
+                          arrow_cache_dir: str | None = None) -> pd.DataFrame:
+    # mode="arrow": see load_daily_states_arrow (memory-mapped, schema cast once, shared page cache)
+    if mode == "arrow":
+        return load_daily_states_arrow(parquet_path, start_date, end_date, stocks, files, arrow_cache_dir)
+    if mode != "duckdb":
+        raise ValueError(f"unknown load mode: {mode}")
+
+    import duckdb
+
+    # NOTE: DuckDB cannot open ":memory:" in read_only mode
+    con = duckdb.connect(database=":memory:")
+    source = parquet_source_sql(parquet_path, files)
+    columns = [r[0] for r in con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()]
+    where_sql, params = scan_filters(columns, start_date, end_date, stocks)
+    df = con.execute(f"SELECT {SELECT_COERCED} FROM {source}{where_sql}", params).fetchdf()
+    con.close()
+
+    # Categoricals keep one copy of each ticker/state string; filters, groupbys and pivots run on the codes.
+    df["tarih"] = df["tarih"].astype("datetime64[s]")
+    df["emir_sayisi"] = compact_counts(df["emir_sayisi"].to_numpy())
+    df["islem_kodu"] = df["islem_kodu"].astype("category")
+    extra_states = sorted(set(df["final_state"].unique()) - set(FINAL_STATES))
+    df["final_state"] = pd.Categorical(df["final_state"], categories=FINAL_STATES + extra_states)
+
+    return df
+
+# -----------------------------
+# Arrow load mode
+# -----------------------------
+# The same coercion as SELECT_COERCED, applied once as a projection of the Arrow scan. Unlike TRY_CAST,
+# an unparseable count/percentage string raises instead of becoming 0. Counts are cast safely to
+# int64 (a non-integral value raises), then narrowed to int32 when they all fit, like compact_counts.
+def _arrow_projection() -> dict:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    return {
+        "tarih": pc.field("tarih").cast(pa.timestamp("s")),
+        "islem_kodu": pc.field("islem_kodu").cast(pa.string()),
+        "final_state": pc.field("final_state").cast(pa.string()),
+        "emir_sayisi": pc.field("emir_sayisi").cast(pa.int64()),
+        "yuzde": pc.field("yuzde").cast(pa.float32(), safe=False),
+    }
+
+def arrow_scan_filter(columns: list[str], start_date=None, end_date=None, stocks=None):
+    # Arrow twin of scan_filters: partition fields (year, month) prune directories, tarih/islem_kodu rows
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    tarih = pc.field("tarih").cast(pa.timestamp("s"))
+    expr = None
+    def both(e):
+        return e if expr is None else expr & e
+
+    for bound, is_start in ((start_date, True), (end_date, False)):
+        if bound is None:
+            continue
+        bound = pd.Timestamp(bound)
+        value = pa.scalar(bound.to_pydatetime(), pa.timestamp("s"))
+        expr = both(tarih >= value if is_start else tarih <= value)
+        if "year" in columns:
+            year = pc.field("year")
+            if "month" in columns:
+                month = pc.field("month")
+                after = (month >= bound.month) if is_start else (month <= bound.month)
+                beyond = (year > bound.year) if is_start else (year < bound.year)
+                expr = both(beyond | ((year == bound.year) & after))
+            else:
+                expr = both(year >= bound.year if is_start else year <= bound.year)
+    if stocks is not None:
+        expr = both(pc.field("islem_kodu").cast(pa.string()).isin(pa.array(list(stocks), pa.string())))
+    return expr
+
+def _arrow_dictionary(column, categories: list[str], index_type):
+    # Dictionary column with a fixed category order (pandas keeps it as Categorical categories)
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    dictionary = pa.array(categories, pa.string())
+    indices = pc.index_in(column.combine_chunks() if hasattr(column, "combine_chunks") else column,
+                          value_set=dictionary)
+    return pa.DictionaryArray.from_arrays(indices.cast(index_type), dictionary)
+
+def read_daily_states_arrow(parquet_path: str, start_date=None, end_date=None, stocks=None,
+                            files: list[str] | None = None):
+    # Parquet -> one Arrow table in the frame layout: schema cast once, tickers/states dictionary
+    # encoded (sorted tickers; known states first), rows ordered by (islem_kodu, tarih, final_state)
+    # so build_stock_index can use it without a sort.
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+
+    hive = os.path.isdir(parquet_path)
+    dataset = ds.dataset(
+        files if files is not None else dataset_files(parquet_path),
+        format="parquet",
+        filesystem=pafs.LocalFileSystem(use_mmap=True),
+        partitioning="hive" if hive else None,
+        partition_base_dir=parquet_path if hive else None,
+    )
+    expr = arrow_scan_filter(dataset.schema.names, start_date, end_date, stocks)
+    table = dataset.to_table(columns=_arrow_projection(), filter=expr)
+    counts = pc.fill_null(table["emir_sayisi"], 0)
+    lo, hi = pc.min_max(counts).values()
+    if lo.as_py() is None or (lo.as_py() >= -2**31 and hi.as_py() < 2**31):
+        counts = counts.cast(pa.int32())
+    table = table.set_column(3, "emir_sayisi", counts)
+    table = table.set_column(4, "yuzde", pc.fill_null(table["yuzde"], 0.0))
+
+    tickers = sorted(pc.unique(table["islem_kodu"]).drop_null().to_pylist())
+    states = pc.unique(table["final_state"]).drop_null().to_pylist()
+    states = FINAL_STATES + sorted(set(states) - set(FINAL_STATES))
+    ticker_col = _arrow_dictionary(table["islem_kodu"], tickers, pa.int16())
+    state_col = _arrow_dictionary(table["final_state"], states, pa.int8())
+    table = table.set_column(1, "islem_kodu", ticker_col).set_column(2, "final_state", state_col)
+
+    order = pc.sort_indices(
+        pa.table({"t": ticker_col.indices, "d": table["tarih"], "s": state_col.indices}),
+        sort_keys=[("t", "ascending"), ("d", "ascending"), ("s", "ascending")],
+    )
+    return table.take(order).combine_chunks()
+
+def _arrow_cache_path(cache_dir: str, parquet_path: str, start_date, end_date, stocks, files) -> tuple[str, str]:
+    # (window prefix, file): the prefix identifies path + filters, the suffix the file contents
+    fingerprints = file_fingerprints(parquet_path)
+    if files is not None:
+        fingerprints = {f: fingerprints[f] for f in files if f in fingerprints}
+    window = hashlib.sha1(repr((os.path.abspath(parquet_path), str(start_date), str(end_date),
+                                tuple(stocks) if stocks is not None else None, files is not None)).encode())
+    prefix = window.hexdigest()[:12]
+    return prefix, os.path.join(cache_dir, f"{prefix}-{dataset_fingerprint(fingerprints)}.arrow")
+
+def load_daily_states_arrow(parquet_path: str, start_date=None, end_date=None, stocks=None,
+                            files: list[str] | None = None, cache_dir: str | None = None) -> pd.DataFrame:
+    # With cache_dir, the Arrow table is written once as an uncompressed Arrow IPC file and then
+    # memory-mapped: the tarih, emir_sayisi and yuzde columns of the frame are zero-copy numpy views
+    # of the mapped file, so every Streamlit worker on the host shares one copy of them in the OS page
+    # cache. Files of older dataset versions are unlinked (processes that still map them keep working).
+    #
+    # The frame keeps numpy / Categorical dtypes rather than pd.ArrowDtype: the indexes, the tensor and
+    # the pandas engines work on cat.codes and numpy arrays, and ArrowDtype columns would be converted
+    # on every such call (dictionary ArrowDtype has no .cat accessor). pyarrow always copies the
+    # dictionary indices into Categorical codes, so islem_kodu / final_state (1-2 bytes per row) are
+    # per-process copies; their strings are one small dictionary.
+    import pyarrow as pa
+
+    if cache_dir is None:
+        table = read_daily_states_arrow(parquet_path, start_date, end_date, stocks, files)
+    else:
+        prefix, path = _arrow_cache_path(cache_dir, parquet_path, start_date, end_date, stocks, files)
+        if not os.path.exists(path):
+            table = read_daily_states_arrow(parquet_path, start_date, end_date, stocks, files)
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp, path)
+            if files is None:
+                for old in glob.glob(os.path.join(cache_dir, f"{prefix}-*.arrow")):
+                    if old != path:
+                        os.remove(old)
+        table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+    return table.to_pandas(split_blocks=True, self_destruct=cache_dir is None)
+
+def append_daily_states(df: pd.DataFrame, df_new: pd.DataFrame) -> pd.DataFrame:
+    # Align the categories of both frames (sorted tickers, known states first) before concat,
+    # otherwise pandas falls back to object columns.
+    tickers = sorted(set(df["islem_kodu"].cat.categories) | set(df_new["islem_kodu"].cat.categories))
+    extra_states = sorted((set(df["final_state"].cat.categories) | set(df_new["final_state"].cat.categories)) - set(FINAL_STATES))
+    parts = [
+        part.assign(islem_kodu=part["islem_kodu"].cat.set_categories(tickers),
+                    final_state=part["final_state"].cat.set_categories(FINAL_STATES + extra_states))
+        for part in (df, df_new)
+    ]
+    return pd.concat(parts, ignore_index=True)
+
+def align_categories(df: pd.DataFrame, like: pd.DataFrame) -> pd.DataFrame:
+    # df with the ticker/state categories of like (a superset, e.g. the frame df was appended to)
+    return df.assign(islem_kodu=df["islem_kodu"].cat.set_categories(like["islem_kodu"].cat.categories),
+                     final_state=df["final_state"].cat.set_categories(like["final_state"].cat.categories))
+
+
+# -----------------------------
+# Per-ticker index
+# -----------------------------
+class StockIndex(NamedTuple):
+    frame: pd.DataFrame                     # sorted by (islem_kodu, tarih), treat as read-only
+    offsets: dict[str, tuple[int, int]]     # ticker -> [start, stop) row range in frame
+    tarih: np.ndarray                       # frame["tarih"] as datetime64, for searchsorted
+
+@timed()
+def build_stock_index(df_all: pd.DataFrame) -> StockIndex:
+    if _is_stock_sorted(df_all):
+        # already in (islem_kodu, tarih) order (Arrow load mode): keep the columns as they are
+        frame = df_all
+    else:
+        frame = df_all.sort_values(["islem_kodu", "tarih"], kind="stable").reset_index(drop=True)
+    return _stock_index(frame)
+
+@timed()
+def append_stock_index(index: StockIndex, df_new: pd.DataFrame) -> StockIndex:
+    # For df_new days all after the loaded ones: each ticker's new rows go right after its existing
+    # block, so the sorted frame is a merge of two code-sorted blocks placed by counting, not a full sort.
+    n_old = len(index.frame)
+    combined = append_daily_states(index.frame, df_new)
+    codes = combined["islem_kodu"].cat.codes.to_numpy()
+    old_codes = codes[:n_old]
+    new_order = np.lexsort((combined["tarih"].to_numpy()[n_old:], codes[n_old:]))
+    new_codes = codes[n_old:][new_order]
+    perm = np.empty(len(combined), dtype=np.int64)
+    perm[np.arange(n_old) + np.searchsorted(new_codes, old_codes, side="left")] = np.arange(n_old)
+    perm[np.arange(len(new_codes)) + np.searchsorted(old_codes, new_codes, side="right")] = n_old + new_order
+    return _stock_index(combined.take(perm).reset_index(drop=True))
+
+def _stock_index(frame: pd.DataFrame) -> StockIndex:
+    codes = frame["islem_kodu"].cat.codes.to_numpy()
+    categories = frame["islem_kodu"].cat.categories
+    starts = np.searchsorted(codes, np.arange(len(categories)), side="left")
+    stops = np.searchsorted(codes, np.arange(len(categories)), side="right")
+    offsets = {str(c): (int(a), int(b)) for c, a, b in zip(categories, starts, stops) if b > a}
+    return StockIndex(frame, offsets, frame["tarih"].to_numpy())
+
+def _is_stock_sorted(df: pd.DataFrame) -> bool:
+    if not df.index.equals(pd.RangeIndex(len(df))):
+        return False
+    dc = np.diff(df["islem_kodu"].cat.codes.to_numpy())
+    dt = np.diff(df["tarih"].to_numpy())
+    return bool(np.all((dc > 0) | ((dc == 0) & (dt >= np.timedelta64(0)))))
+
+def stock_rows(index: StockIndex, hisse: str, start_date: pd.Timestamp, end_date: pd.Timestamp) -> tuple[int, int]:
+    a, b = index.offsets.get(hisse, (0, 0))
+    days = index.tarih[a:b]
+    lo = a + int(np.searchsorted(days, np.datetime64(start_date), side="left"))
+    hi = a + int(np.searchsorted(days, np.datetime64(end_date), side="right"))
+    return lo, hi
+
+def stock_slice(index: StockIndex, hisse: str, start_date: pd.Timestamp, end_date: pd.Timestamp) -> pd.DataFrame:
+    # Contiguous row range -> positional slice, no boolean scan over the full frame
+    lo, hi = stock_rows(index, hisse, start_date, end_date)
+    return index.frame.iloc[lo:hi]
+
+def index_rows(index: StockIndex, stocks: list[str], start_date: pd.Timestamp, end_date: pd.Timestamp) -> pd.DataFrame:
+    ranges = [stock_rows(index, h, start_date, end_date) for h in stocks]
+    rows = [np.arange(lo, hi) for lo, hi in ranges if hi > lo]
+    if not rows:
+        return index.frame.iloc[0:0]
+    return index.frame.take(np.concatenate(rows))
+
+
+# -----------------------------
+# Dense day x ticker x state tensor
+# -----------------------------
+class DailyTensor(NamedTuple):
+    # The loaded frame materialised once as dense (days, tickers, states) arrays; per-ticker / per-day
+    # views are slices and reductions instead of pivot_table / groupby / reindex on the long frame.
+    dates: np.ndarray                       # (D,) sorted trading days, datetime64
+    tickers: list[str]                      # (T,) islem_kodu categories
+    states: list[str]                       # (S,) final_state categories
+    ticker_pos: dict[str, int]
+    state_pos: dict[str, int]
+    counts: np.ndarray                      # (D, T, S) emir_sayisi, int32 (int64 if it would overflow)
+    pct: np.ndarray                         # (D, T, S) yuzde as loaded, float32
+    rows: np.ndarray                        # (D, T, S) bool, a source row exists (pandas observed=True)
+
+@timed()
+def build_daily_tensor(frame: pd.DataFrame) -> DailyTensor:
+    tickers = [str(c) for c in frame["islem_kodu"].cat.categories]
+    states = [str(c) for c in frame["final_state"].cat.categories]
+    tarih = frame["tarih"].to_numpy()
+    dates = np.unique(tarih)
+    shape = (len(dates), len(tickers), len(states))
+    n = shape[0] * shape[1] * shape[2]
+
+    flat = ((np.searchsorted(dates, tarih) * shape[1] + frame["islem_kodu"].cat.codes.to_numpy().astype(np.int64))
+            * shape[2] + frame["final_state"].cat.codes.to_numpy().astype(np.int64))
+    counts = np.bincount(flat, weights=frame["emir_sayisi"].to_numpy(dtype=np.float64), minlength=n)
+    pct = np.bincount(flat, weights=frame["yuzde"].to_numpy(dtype=np.float64), minlength=n)
+    rows = np.bincount(flat, minlength=n) > 0
+    count_type = np.int32 if len(counts) == 0 or counts.max() < 2**31 else np.int64
+    return DailyTensor(
+        dates=dates,
+        tickers=tickers,
+        states=states,
+        ticker_pos={t: i for i, t in enumerate(tickers)},
+        state_pos={s: i for i, s in enumerate(states)},
+        counts=counts.astype(count_type).reshape(shape),
+        pct=pct.astype(np.float32).reshape(shape),
+        rows=rows.reshape(shape),
+    )
+
+@timed()
+def append_daily_tensor(tensor: DailyTensor, df_new: pd.DataFrame) -> DailyTensor:
+    # df_new: rows of days after tensor.dates[-1], categories aligned by append_daily_states. Only those
+    # rows are counted; the existing days are stacked above them (re-placed if the categories grew).
+    block = build_daily_tensor(df_new)
+    grow = _grow_categories(tensor.tickers, tensor.states, block.tickers, block.states)
+    return block._replace(
+        dates=np.concatenate([tensor.dates, block.dates]),
+        counts=np.concatenate([grow(tensor.counts), block.counts]),
+        pct=np.concatenate([grow(tensor.pct), block.pct]),
+        rows=np.concatenate([grow(tensor.rows), block.rows]),
+    )
+
+def _grow_categories(tickers: list[str], states: list[str], new_tickers: list[str], new_states: list[str]):
+    # (D, T[, S]) array over tickers/states -> the same over the grown category lists, new ones zero
+    if tickers == new_tickers and states == new_states:
+        return lambda x: x
+    t_pos = {t: i for i, t in enumerate(new_tickers)}
+    s_pos = {st: i for i, st in enumerate(new_states)}
+    t_idx = np.array([t_pos[t] for t in tickers], dtype=np.int64)
+    s_idx = np.array([s_pos[st] for st in states], dtype=np.int64)
+
+    def grow(x: np.ndarray) -> np.ndarray:
+        out = np.zeros((x.shape[0], len(new_tickers)) + ((len(new_states),) if x.ndim == 3 else ()), dtype=x.dtype)
+        if x.ndim == 3:
+            out[:, t_idx[:, None], s_idx[None, :]] = x
+        else:
+            out[:, t_idx] = x
+        return out
+
+    return grow
+
+def tensor_day_range(tensor: DailyTensor, start_date, end_date) -> tuple[int, int]:
+    return _day_range(tensor.dates, start_date, end_date)
+
+def _day_range(dates: np.ndarray, start_date, end_date) -> tuple[int, int]:
+    lo = int(np.searchsorted(dates, np.datetime64(pd.Timestamp(start_date)), side="left"))
+    hi = int(np.searchsorted(dates, np.datetime64(pd.Timestamp(end_date)), side="right"))
+    return lo, max(lo, hi)
+
+def week_starts_of(days: np.ndarray) -> np.ndarray:
+    # Monday of each day's calendar week (Mon-Sun), same as to_period("W-SUN").start_time
+    d = days.astype("datetime64[D]")
+    weekday = (d.view(np.int64) + 3) % 7            # 1970-01-01 was a Thursday
+    return (d - weekday.astype("timedelta64[D]")).astype("datetime64[ns]")
+
+
+# -----------------------------
+# Date-range prefix index
+# -----------------------------
+class PrefixIndex(NamedTuple):
+    # Cumulative sums over the trading days: row i holds the sum of days [0, i), so any inclusive
+    # day range [lo, hi) is cum[hi] - cum[lo] for every ticker at once.
+    dates: np.ndarray                       # (D,) sorted trading days, datetime64
+    tickers: list[str]                      # (T,)
+    states: list[str]                       # (S,) final_state categories
+    cum_counts: np.ndarray                  # (D+1, T, S) emir_sayisi per state
+    cum_total: np.ndarray                   # (D+1, T) total_emir (all states)
+    cum_days: np.ndarray                    # (D+1, T) days with data
+    cum_weighted: dict[str, np.ndarray]     # metric key -> (D+1, T) metric daily value * total_emir
+
+def metric_daily_values(trade_pct: np.ndarray, cancel_pct: np.ndarray, expired_pct: np.ndarray) -> dict[str, np.ndarray]:
+    # numpy twin of METRIC_SQL
+    cancel_trade = np.divide(cancel_pct, trade_pct, out=np.zeros_like(cancel_pct), where=trade_pct != 0)
+    return {
+        "EQS (w.avg)": trade_pct - cancel_pct - expired_pct,
+        "Trade% (w.avg)": trade_pct,
+        "CanceledByUser% (w.avg)": cancel_pct,
+        "Expired% (w.avg)": expired_pct,
+        "Cancel/Trade (w.avg)": cancel_trade,
+    }
+
+@timed()
+def build_prefix_index(frame: pd.DataFrame, tensor: DailyTensor | None = None) -> PrefixIndex:
+    # Cumulative sums of the dense tensor along the day axis (built here unless passed in)
+    tensor = build_daily_tensor(frame) if tensor is None else tensor
+    return _prefix_rows(tensor, 0, None)
+
+@timed()
+def append_prefix_index(prefix: PrefixIndex, tensor: DailyTensor) -> PrefixIndex:
+    # tensor = append_daily_tensor(...) of the tensor prefix was built on: the sums continue from the
+    # last row over the new days only. Same additions in the same order as a full build, so same values.
+    return _prefix_rows(tensor, len(prefix.dates), prefix)
+
+def _prefix_rows(tensor: DailyTensor, lo: int, prefix: PrefixIndex | None) -> PrefixIndex:
+    # Prefix rows for tensor days [lo, D) on top of prefix (days [0, lo)), or from zero
+    n_t = len(tensor.tickers)
+    counts = tensor.counts[lo:].astype(np.float64)
+    total = counts.sum(axis=2)
+    present = tensor.rows[lo:].any(axis=2)
+
+    def state_pct(name: str) -> np.ndarray:
+        if name not in tensor.state_pos:
+            return np.zeros((len(counts), n_t))
+        return tensor.pct[lo:, :, tensor.state_pos[name]].astype(np.float64)
+
+    daily = metric_daily_values(state_pct("Trade"), state_pct("CanceledByUser"), state_pct("Expired"))
+
+    grow = None if prefix is None else _grow_categories(prefix.tickers, prefix.states, tensor.tickers, tensor.states)
+
+    def cumulative(x: np.ndarray, cum: np.ndarray | None) -> np.ndarray:
+        if cum is None:
+            out = np.zeros((x.shape[0] + 1,) + x.shape[1:], dtype=np.float64)
+            np.cumsum(x, axis=0, out=out[1:])
+            return out
+        # running sum seeded with the last existing row
+        cum = grow(cum)
+        return np.concatenate([cum[:-1], np.cumsum(np.concatenate([cum[-1:], x]), axis=0)])
+
+    def old(name: str) -> np.ndarray | None:
+        return None if prefix is None else getattr(prefix, name)
+
+    return PrefixIndex(
+        dates=tensor.dates,
+        tickers=tensor.tickers,
+        states=tensor.states,
+        cum_counts=cumulative(counts, old("cum_counts")),
+        cum_total=cumulative(total, old("cum_total")),
+        cum_days=cumulative(present.astype(np.float64), old("cum_days")),
+        cum_weighted={k: cumulative(v * total, None if prefix is None else prefix.cum_weighted[k])
+                      for k, v in daily.items()},
+    )
+
+def prefix_day_range(prefix: PrefixIndex, start_date, end_date) -> tuple[int, int]:
+    return _day_range(prefix.dates, start_date, end_date)
+
+def range_metrics(prefix: PrefixIndex, start_date, end_date, stocks: list[str] | None = None) -> pd.DataFrame:
+    # All METRICS for all tickers over [start_date, end_date]: two prefix rows per array, O(tickers)
+    lo, hi = prefix_day_range(prefix, start_date, end_date)
+    total = prefix.cum_total[hi] - prefix.cum_total[lo]
+    n_days = prefix.cum_days[hi] - prefix.cum_days[lo]
+
+    out = pd.DataFrame({"islem_kodu": prefix.tickers})
+    for key, cum in prefix.cum_weighted.items():
+        wsum = cum[hi] - cum[lo]
+        out[key] = np.divide(wsum, total, out=np.zeros_like(wsum), where=total > 0)
+    out["total_emir_period"] = np.where(total > 0, total, 0.0)
+    out["n_days"] = n_days.astype(np.int64)
+
+    keep = n_days > 0
+    if stocks is not None:
+        keep &= out["islem_kodu"].isin(stocks).to_numpy()
+    return out[keep].reset_index(drop=True)
+
+@timed()
+def range_ranking(prefix: PrefixIndex, stocks: list[str], start_date, end_date, metric_key: str):
+    # Same frame/order as compute_bist100_metric, served from the prefix index
+    better_high = METRICS[metric_key]["better_high"]
+    m = range_metrics(prefix, start_date, end_date, stocks)
+    out = m[["islem_kodu", metric_key, "total_emir_period"]].rename(columns={metric_key: "metric_wavg"})
+    values = out["metric_wavg"].to_numpy()
+    order = np.lexsort((out["islem_kodu"].to_numpy(), -values if better_high else values))
+    return out.iloc[order].reset_index(drop=True), better_high
+
+
+# -----------------------------
+# Bootstrap confidence intervals
+# -----------------------------
+def _column_quantiles(x: np.ndarray, qs: list[float]) -> list[np.ndarray]:
+    # np.nanquantile(x, q, axis=0) with linear interpolation, but one sort for all columns
+    # (np.sort puts NaN last, so each column's valid values are its first n_valid rows)
+    x = np.sort(x, axis=0)
+    n_valid = (~np.isnan(x)).sum(axis=0)
+    cols = np.arange(x.shape[1])
+    out = []
+    for q in qs:
+        pos = q * np.maximum(n_valid - 1, 0)
+        below = np.floor(pos).astype(np.int64)
+        above = np.minimum(below + 1, np.maximum(n_valid - 1, 0))
+        frac = (pos - below).astype(x.dtype)
+        value = x[below, cols] * (1 - frac) + x[above, cols] * frac
+        out.append(np.where(n_valid > 0, value, np.nan))
+    return out
+
+@timed()
+def bootstrap_ci(prefix: PrefixIndex, start_date, end_date, stocks: list[str] | None = None, n_boot: int = 1000,
+                 level: float = 0.95, seed: int = 0) -> pd.DataFrame:
+    # Day-level bootstrap of every METRICS weighted average for every ticker, in one batch:
+    # the trading days of the range are resampled with replacement (the same draw for all tickers,
+    # so market-wide day effects stay together), each draw is a row of day counts C (B, D), and the
+    # resampled weighted means of all tickers and metrics are two matrix products,
+    #   sum_d C[b, d] * value[d, t] * total[d, t] / sum_d C[b, d] * total[d, t].
+    # A ticker without any of its days in a draw gives NaN there and is ignored by the quantiles.
+    # Returns islem_kodu, metric, ci_low, ci_high (long).
+    lo, hi = prefix_day_range(prefix, start_date, end_date)
+    n_d = hi - lo
+    keys = list(prefix.cum_weighted)
+    cols = np.arange(len(prefix.tickers))
+    if stocks is not None:
+        wanted = set(stocks)
+        cols = np.array([i for i, t in enumerate(prefix.tickers) if t in wanted], dtype=np.int64)
+    if n_d == 0 or len(cols) == 0:
+        return pd.DataFrame(columns=["islem_kodu", "metric", "ci_low", "ci_high"])
+
+    total = np.diff(prefix.cum_total[lo:hi + 1][:, cols], axis=0)                             # (D, T)
+    weighted = [np.diff(prefix.cum_weighted[k][lo:hi + 1][:, cols], axis=0) for k in keys]   # K x (D, T)
+    stacked = np.concatenate([total] + weighted, axis=1).astype(np.float32)                  # (D, T*(K+1))
+
+    rng = np.random.default_rng(seed)
+    draws = rng.integers(0, n_d, size=(n_boot, n_d))
+    counts = np.bincount((np.arange(n_boot)[:, None] * n_d + draws).ravel(), minlength=n_boot * n_d)
+    counts = counts.reshape(n_boot, n_d).astype(np.float32)                                  # (B, D)
+
+    sums = counts @ stacked                                                                   # (B, T*(K+1))
+    n_t = len(cols)
+    den = sums[:, :n_t]
+    alpha = (1.0 - level) / 2
+    parts = []
+    for i, key in enumerate(keys):
+        num = sums[:, n_t * (i + 1):n_t * (i + 2)]
+        est = np.divide(num, den, out=np.full_like(num, np.nan), where=den > 0)
+        q_lo, q_hi = _column_quantiles(est, [alpha, 1.0 - alpha])
+        parts.append(pd.DataFrame({
+            "islem_kodu": [prefix.tickers[c] for c in cols],
+            "metric": key,
+            "ci_low": q_lo.astype(np.float64),
+            "ci_high": q_hi.astype(np.float64),
+        }))
+    return pd.concat(parts, ignore_index=True)
+
+
+# -----------------------------
+# Ticker similarity
+# -----------------------------
+class Similarity(NamedTuple):
+    tickers: list[str]                      # (T,)
+    states: list[str]                       # (S,)
+    features: np.ndarray                    # (T, S) final-state share of the period's orders
+    distance: np.ndarray                    # (T, T) pairwise distance, 0 on the diagonal
+    order: np.ndarray                       # (T,) spectral ordering (similar tickers adjacent)
+    labels: np.ndarray                      # (T,) cluster id, numbered in heatmap order
+
+def state_mix(prefix: PrefixIndex, start_date, end_date, stocks: list[str] | None = None):
+    # (tickers, (T, S) state shares) over [start_date, end_date] from the prefix index; tickers
+    # without orders in the range are dropped
+    lo, hi = prefix_day_range(prefix, start_date, end_date)
+    counts = prefix.cum_counts[hi] - prefix.cum_counts[lo]
+    total = counts.sum(axis=1)
+    keep = total > 0
+    if stocks is not None:
+        keep &= np.isin(np.array(prefix.tickers, dtype=object), list(stocks))
+    idx = np.flatnonzero(keep)
+    return [prefix.tickers[i] for i in idx], counts[idx] / total[idx, None]
+
+def js_distance_matrix(p: np.ndarray, block: int = 256) -> np.ndarray:
+    # Jensen-Shannon distance (sqrt of the divergence, base 2, in [0, 1]) between all rows of p:
+    # JS(i, j) = H((p_i + p_j) / 2) - (H(p_i) + H(p_j)) / 2. Row blocks bound memory to block * T * S.
+    def entropy(x):
+        return -np.sum(np.where(x > 0, x * np.log2(np.where(x > 0, x, 1.0)), 0.0), axis=-1)
+
+    h = entropy(p)
+    n = len(p)
+    out = np.empty((n, n))
+    for a in range(0, n, block):
+        m = 0.5 * (p[a:a + block, None, :] + p[None, :, :])
+        out[a:a + block] = entropy(m) - 0.5 * (h[a:a + block, None] + h[None, :])
+    np.fill_diagonal(out, 0.0)
+    return np.sqrt(np.clip(out, 0.0, None))
+
+def cosine_distance_matrix(p: np.ndarray) -> np.ndarray:
+    unit = p / np.maximum(np.linalg.norm(p, axis=1, keepdims=True), 1e-12)
+    out = 1.0 - unit @ unit.T
+    np.fill_diagonal(out, 0.0)
+    return np.clip(out, 0.0, None)
+
+def _spectral_embedding(distance: np.ndarray, k: int) -> np.ndarray:
+    # k smallest eigenvectors of the symmetric normalized Laplacian of a Gaussian affinity
+    nonzero = distance[distance > 0]
+    sigma = np.median(nonzero) if len(nonzero) else 1.0
+    w = np.exp(-(distance / sigma) ** 2)
+    np.fill_diagonal(w, 0.0)
+    d = w.sum(axis=1)
+    d_inv = 1.0 / np.sqrt(np.maximum(d, 1e-12))
+    laplacian = np.eye(len(w)) - d_inv[:, None] * w * d_inv[None, :]
+    _, vecs = np.linalg.eigh(laplacian)
+    return vecs[:, :k] * d_inv[:, None]
+
+def _kmeans(x: np.ndarray, k: int, n_iter: int = 50) -> np.ndarray:
+    # Lloyd's algorithm with deterministic farthest-point initialisation
+    centers = [x[0]]
+    for _ in range(1, k):
+        dist = np.min(((x[:, None, :] - np.array(centers)[None]) ** 2).sum(-1), axis=1)
+        centers.append(x[int(np.argmax(dist))])
+    centers = np.array(centers)
+    labels = np.zeros(len(x), dtype=np.int64)
+    for _ in range(n_iter):
+        labels = ((x[:, None, :] - centers[None]) ** 2).sum(-1).argmin(axis=1)
+        new = np.array([x[labels == c].mean(axis=0) if np.any(labels == c) else centers[c] for c in range(k)])
+        if np.allclose(new, centers):
+            break
+        centers = new
+    return labels
+
+@timed()
+def ticker_similarity(prefix: PrefixIndex, start_date, end_date, stocks: list[str] | None = None,
+                      metric: str = "js", n_clusters: int = 6) -> Similarity:
+    # Full pairwise distance matrix on the state-mix vectors, spectral ordering (Fiedler vector) for the
+    # heatmap and spectral clustering (k-means on the embedding), all dense numpy
+    tickers, features = state_mix(prefix, start_date, end_date, stocks)
+    if metric == "js":
+        distance = js_distance_matrix(features)
+    elif metric == "cosine":
+        distance = cosine_distance_matrix(features)
+    else:
+        raise ValueError(f"unknown distance: {metric}")
+    n = len(tickers)
+    if n < 3:
+        return Similarity(tickers, list(prefix.states), features, distance, np.arange(n), np.zeros(n, dtype=np.int64))
+
+    k = min(n_clusters, n - 1)
+    embedding = _spectral_embedding(distance, max(k, 2))
+    labels = _kmeans(embedding[:, 1:] / np.maximum(np.linalg.norm(embedding[:, 1:], axis=1, keepdims=True), 1e-12), k)
+    # clusters contiguous in the heatmap, ordered by their mean Fiedler coordinate, Fiedler order inside
+    fiedler = embedding[:, 1]
+    cluster_pos = {c: fiedler[labels == c].mean() for c in np.unique(labels)}
+    order = np.lexsort((fiedler, np.array([cluster_pos[c] for c in labels])))
+    rename = {c: i for i, c in enumerate(dict.fromkeys(labels[order]))}
+    labels = np.array([rename[c] for c in labels])
+    return Similarity(tickers, list(prefix.states), features, distance, order, labels)
+
+def nearest_neighbours(sim: Similarity, ticker: str, n: int = 10) -> pd.DataFrame:
+    if ticker not in sim.tickers:
+        return pd.DataFrame(columns=["islem_kodu", "mesafe", "kume"])
+    i = sim.tickers.index(ticker)
+    d = sim.distance[i]
+    cand = np.array([j for j in np.argsort(d, kind="stable") if j != i][:n], dtype=np.int64)
+    return pd.DataFrame({
+        "islem_kodu": [sim.tickers[j] for j in cand],
+        "mesafe": d[cand],
+        "kume": sim.labels[cand],
+    })
+
+
+# -----------------------------
+# Time-series buckets
+# -----------------------------
+# Calendar buckets for the time-series view (None = one bucket per trading day)
+BUCKET_FREQS = {"Günlük": None, "Haftalık": "W-SUN", "Aylık": "M"}
+
+@timed()
+def bucket_series(prefix: PrefixIndex, tickers: list[str], start_date, end_date, freq: str | None = None):
+    # Per-bucket sums for the given tickers from the prefix index: each bucket is a contiguous run of
+    # trading days, so its sum is cum[last + 1] - cum[first]. Returns (bucket start dates,
+    # counts (B, K, S), totals (B, K)).
+    lo, hi = prefix_day_range(prefix, start_date, end_date)
+    days = pd.DatetimeIndex(prefix.dates[lo:hi])
+    if freq is None:
+        starts = days
+    else:
+        starts = days.to_period(freq).start_time
+    change = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]]) if len(days) else np.array([], dtype=int)
+    b_lo = lo + change
+    b_hi = np.r_[b_lo[1:], hi]
+
+    pos = {t: i for i, t in enumerate(prefix.tickers)}
+    cols = np.array([pos[t] for t in tickers if t in pos], dtype=np.int64)
+    counts = prefix.cum_counts[b_hi][:, cols] - prefix.cum_counts[b_lo][:, cols]
+    totals = prefix.cum_total[b_hi][:, cols] - prefix.cum_total[b_lo][:, cols]
+    return pd.DatetimeIndex(starts[change]), counts, totals
+
+
+# -----------------------------
+# Anomalies (EWMA z-scores, incremental)
+# -----------------------------
+ANOMALY_SPAN = 20            # EWMA span in trading days (alpha = 2 / (span + 1))
+ANOMALY_WARMUP = 10          # days a ticker needs before it can be flagged
+ANOMALY_MIN_STD = 1.0        # std floor in percentage points, so flat histories don't flag noise
+ANOMALY_Z = 3.0              # |z| kept in the alert table (the UI can raise it)
+ANOMALY_COLUMNS = ["tarih", "islem_kodu", "final_state", "yuzde", "ewma_ort", "ewma_std", "z"]
+
+class AnomalyState(NamedTuple):
+    # EWMA mean/variance of each (ticker, state) daily share after the last folded-in day; a new day
+    # is scored against the statistics of the days before it and then folded in
+    dates: np.ndarray                       # (D,) days folded in so far
+    tickers: list[str]                      # (T,)
+    states: list[str]                       # (S,)
+    mean: np.ndarray                        # (T, S) EWMA of the daily share (%)
+    var: np.ndarray                         # (T, S) EWMA variance
+    n_obs: np.ndarray                       # (T,) days with data per ticker
+    alerts: pd.DataFrame                    # ANOMALY_COLUMNS, |z| >= ANOMALY_Z
+
+def _empty_anomalies(tickers: list[str], states: list[str]) -> AnomalyState:
+    n_t, n_s = len(tickers), len(states)
+    return AnomalyState(np.array([], dtype="datetime64[ns]"), tickers, states, np.zeros((n_t, n_s)),
+                        np.zeros((n_t, n_s)), np.zeros(n_t, dtype=np.int64), _alerts_frame([], [], [], [], []))
+
+def _alerts_frame(days, tickers, states, pieces, z) -> pd.DataFrame:
+    # pieces: (yuzde, ewma_ort, ewma_std) arrays per flagged day
+    cols = [np.concatenate(c) if c else np.array([], dtype=np.float64) for c in zip(*pieces)] or [np.array([])] * 3
+    return pd.DataFrame({
+        "tarih": pd.DatetimeIndex(np.concatenate(days) if days else np.array([], dtype="datetime64[ns]")),
+        "islem_kodu": pd.Series(tickers, dtype=object),
+        "final_state": pd.Series(states, dtype=object),
+        "yuzde": cols[0],
+        "ewma_ort": cols[1],
+        "ewma_std": cols[2],
+        "z": np.concatenate(z) if z else np.array([], dtype=np.float64),
+    })
+
+def _align_anomalies(state: AnomalyState, tickers: list[str], states: list[str]) -> AnomalyState:
+    # New tickers/states (category union on append) start without history
+    if state.tickers == tickers and state.states == states:
+        return state
+    t_pos = {t: i for i, t in enumerate(state.tickers)}
+    s_pos = {s: i for i, s in enumerate(state.states)}
+    t_idx = np.array([t_pos.get(t, -1) for t in tickers], dtype=np.int64)
+    s_idx = np.array([s_pos.get(s, -1) for s in states], dtype=np.int64)
+    ok = (t_idx >= 0)[:, None] & (s_idx >= 0)[None, :]
+
+    def take(x):
+        out = np.zeros((len(tickers), len(states)))
+        out[ok] = x[np.ix_(np.maximum(t_idx, 0), np.maximum(s_idx, 0))][ok]
+        return out
+
+    n_obs = np.where(t_idx >= 0, state.n_obs[np.maximum(t_idx, 0)], 0)
+    return AnomalyState(state.dates, tickers, states, take(state.mean), take(state.var), n_obs, state.alerts)
+
+@timed()
+def update_anomalies(state: AnomalyState | None, prefix: PrefixIndex, span: int = ANOMALY_SPAN,
+                     warmup: int = ANOMALY_WARMUP, min_std: float = ANOMALY_MIN_STD, z_min: float = ANOMALY_Z) -> AnomalyState:
+    # Folds in the prefix-index days after state.dates[-1]; O(new days * T * S). If the history the
+    # state was built on is no longer a prefix of the index (backfilled days), it starts over.
+    n_done = 0 if state is None else len(state.dates)
+    if state is None or not np.array_equal(prefix.dates[:n_done], state.dates):
+        state, n_done = _empty_anomalies(prefix.tickers, prefix.states), 0
+    state = _align_anomalies(state, prefix.tickers, prefix.states)
+    if n_done == len(prefix.dates):
+        return state
+
+    alpha = 2.0 / (span + 1.0)
+    mean, var, n_obs = state.mean.copy(), state.var.copy(), state.n_obs.copy()
+    days, f_tickers, f_states, pieces, zs = [], [], [], [], []
+    for d in range(n_done, len(prefix.dates)):
+        counts = prefix.cum_counts[d + 1] - prefix.cum_counts[d]
+        total = counts.sum(axis=1)
+        present = total > 0
+        x = 100.0 * counts / np.where(present, total, 1.0)[:, None]
+
+        std = np.maximum(np.sqrt(var), min_std)
+        z = (x - mean) / std
+        flag = present[:, None] & (n_obs >= warmup)[:, None] & (np.abs(z) >= z_min)
+        if flag.any():
+            t, s = np.nonzero(flag)
+            days.append(np.repeat(prefix.dates[d], len(t)))
+            f_tickers += [prefix.tickers[i] for i in t]
+            f_states += [prefix.states[i] for i in s]
+            pieces.append((x[t, s], mean[t, s], std[t, s]))
+            zs.append(z[t, s])
+
+        # incremental EWMA mean/variance; a ticker's first day seeds its mean
+        first = present & (n_obs == 0)
+        diff = x - mean
+        incr = alpha * diff
+        upd = present[:, None]
+        mean = np.where(upd, mean + incr, mean)
+        var = np.where(upd, (1.0 - alpha) * (var + diff * incr), var)
+        mean[first] = x[first]
+        var[first] = 0.0
+        n_obs += present
+
+    alerts = state.alerts
+    if zs:
+        alerts = pd.concat([alerts, _alerts_frame(days, f_tickers, f_states, pieces, zs)], ignore_index=True)
+    return AnomalyState(prefix.dates.copy(), list(prefix.tickers), list(prefix.states), mean, var, n_obs, alerts)
+
+def anomaly_alerts(state: AnomalyState, start_date, end_date, stocks: list[str] | None = None,
+                   states: list[str] | None = None, z_min: float = ANOMALY_Z) -> pd.DataFrame:
+    a = state.alerts
+    mask = (a["tarih"] >= pd.Timestamp(start_date)) & (a["tarih"] <= pd.Timestamp(end_date)) & (a["z"].abs() >= z_min)
+    if stocks is not None:
+        mask &= a["islem_kodu"].isin(stocks)
+    if states is not None:
+        mask &= a["final_state"].isin(states)
+    out = a[mask]
+    return out.iloc[np.argsort(-out["z"].abs().to_numpy(), kind="stable")].reset_index(drop=True)
+
+
+# -----------------------------
+# Dataset versions
+# -----------------------------
+class DatasetState(NamedTuple):
+    fingerprint: str
+    files: dict[str, tuple]                 # file -> (mtime_ns, size, footer...) at load time
+    index: StockIndex
+    tensor: DailyTensor
+    prefix: PrefixIndex
+    anomalies: AnomalyState
+
+@timed()
+def refresh_dataset(state: DatasetState | None, parquet_path: str, start_date=None, end_date=None,
+                    load_mode: str = "duckdb", arrow_cache_dir: str | None = None) -> DatasetState:
+    files = file_fingerprints(parquet_path)
+    fingerprint = dataset_fingerprint(files)
+    if state is not None and state.fingerprint == fingerprint:
+        return state
+
+    new_files = [f for f in files if f not in state.files] if state is not None else []
+    unchanged = state is not None and all(files.get(f) == fp for f, fp in state.files.items())
+    if unchanged and new_files:
+        # Only new day/partition files appeared: read just those
+        df_new = load_all_daily_states(parquet_path, start_date, end_date, files=new_files,
+                                       mode=load_mode, arrow_cache_dir=None)
+        dates = state.tensor.dates
+        if len(df_new) == 0 or len(dates) == 0 or df_new["tarih"].min() > dates[-1]:
+            # later days: merge them into the sorted frame, count only their rows into the tensor and
+            # continue the prefix sums and the EWMA state from the last loaded day
+            index = append_stock_index(state.index, df_new)
+            tensor = append_daily_tensor(state.tensor, align_categories(df_new, index.frame))
+            prefix = append_prefix_index(state.prefix, tensor)
+            return DatasetState(fingerprint, files, index, tensor, prefix, update_anomalies(state.anomalies, prefix))
+        # backfilled or overlapping days: the day axis changes in the middle, rebuild everything
+        frame = append_daily_states(state.index.frame, df_new)
+    else:
+        frame = load_all_daily_states(parquet_path, start_date, end_date, mode=load_mode,
+                                      arrow_cache_dir=arrow_cache_dir)
+    index = build_stock_index(frame)
+    tensor = build_daily_tensor(index.frame)
+    prefix = build_prefix_index(index.frame, tensor)
+    # update_anomalies starts over when the loaded days are no longer a continuation of its history
+    anomalies = update_anomalies(state.anomalies if unchanged and new_files else None, prefix)
+    return DatasetState(fingerprint, files, index, tensor, prefix, anomalies)
+
+def dataset_ranking(state: DatasetState, stocks: list[str], start_date, end_date, metric_key: str,
+                    engine: str = "prefix") -> pd.DataFrame:
+    # The ranking frame app.py and api_server.py serve; "prefix" answers any range from two prefix rows
+    if engine == "prefix":
+        metric_df, _ = range_ranking(state.prefix, list(stocks), start_date, end_date, metric_key)
+    else:
+        metric_df, _ = compute_bist100_metric(state.index.frame, list(stocks), start_date, end_date, metric_key,
+                                              index=state.index, engine=engine)
+    return metric_df
+
+
+# -----------------------------
+# Weekly / monthly references
+# -----------------------------
+@timed()
+def add_week_index(df: pd.DataFrame, n_days: int | None = None) -> pd.DataFrame:
+    # hafta: 1-based index of the calendar week (Mon-Sun) among the weeks present in df, so any span
+    # works and a short (holiday) week stays its own week. n_days keeps only the first n trading days.
+    out = df.copy()
+    out["tarih"] = pd.to_datetime(out["tarih"])
+    days = np.sort(out["tarih"].unique())
+    if n_days is not None:
+        days = days[:n_days]
+        out = out[out["tarih"].isin(days)].copy()
+    out["gun_idx"] = np.searchsorted(days, out["tarih"].to_numpy())
+    out["hafta_baslangic"] = out["tarih"].dt.to_period("W-SUN").dt.start_time
+    week_starts = np.unique(out["hafta_baslangic"].to_numpy())
+    out["hafta"] = np.searchsorted(week_starts, out["hafta_baslangic"].to_numpy()) + 1
+    out["tarih_str"] = out["tarih"].dt.strftime("%Y-%m-%d")
+    return out
+
+@timed()
+def calc_month_references(df_daily: pd.DataFrame):
+    d = df_daily.copy()
+    d["tarih"] = pd.to_datetime(d["tarih"])
+    n_days = int(d["tarih"].nunique()) if d["tarih"].nunique() else 1
+
+    month_cnt = d.groupby("final_state", as_index=False, observed=True)["emir_sayisi"].sum()
+    total = float(month_cnt["emir_sayisi"].sum())
+    month_pct = month_cnt.copy()
+    month_pct["yuzde"] = (100.0 * month_pct["emir_sayisi"] / total) if total else 0.0
+
+    month_cnt_daily_avg = month_cnt.copy()
+    month_cnt_daily_avg["emir_sayisi"] = month_cnt_daily_avg["emir_sayisi"] / n_days
+
+    return month_pct, month_cnt_daily_avg, n_days
+
+# -----------------------------
+# BIST100 comparison metrics
+# -----------------------------
+@timed("metric_pivot")
+def compute_bist100_metric_pandas(df_all: pd.DataFrame, stocks: list[str], start_date: pd.Timestamp, end_date: pd.Timestamp, metric_key: str):
+    df = df_all[
+        (df_all["islem_kodu"].isin(stocks)) &
+        (df_all["tarih"] >= start_date) &
+        (df_all["tarih"] <= end_date)
+    ].copy()
+
+    if df.empty:
+        return pd.DataFrame(columns=["islem_kodu", "metric_wavg", "total_emir_period"]), METRICS[metric_key]["better_high"]
+
+    # daily pivot: percentages and counts per state
+    daily = (df.pivot_table(index=["tarih", "islem_kodu"], columns="final_state",
+                            values=["yuzde", "emir_sayisi"], aggfunc="sum", observed=True)
+             .fillna(0))
+    daily.columns = [f"{a}_{b}" for a, b in daily.columns]
+    daily = daily.reset_index()
+
+    daily["trade_pct"] = daily.get("yuzde_Trade", 0.0)
+    daily["cancel_pct"] = daily.get("yuzde_CanceledByUser", 0.0)
+    daily["expired_pct"] = daily.get("yuzde_Expired", 0.0)
+
+    emir_cols = [c for c in daily.columns if c.startswith("emir_sayisi_")]
+    daily["total_emir"] = daily[emir_cols].sum(axis=1)
+
+    if metric_key == "EQS (w.avg)":
+        daily["metric_value"] = daily["trade_pct"] - daily["cancel_pct"] - daily["expired_pct"]
+    elif metric_key == "Trade% (w.avg)":
+        daily["metric_value"] = daily["trade_pct"]
+    elif metric_key == "CanceledByUser% (w.avg)":
+        daily["metric_value"] = daily["cancel_pct"]
+    elif metric_key == "Expired% (w.avg)":
+        daily["metric_value"] = daily["expired_pct"]
+    elif metric_key == "Cancel/Trade (w.avg)":
+        daily["metric_value"] = daily["cancel_pct"] / daily["trade_pct"].replace(0, pd.NA)
+        daily["metric_value"] = daily["metric_value"].fillna(0.0)
+    else:
+        daily["metric_value"] = daily["trade_pct"] - daily["cancel_pct"] - daily["expired_pct"]
+
+    better_high = METRICS[metric_key]["better_high"]
+
+    # volume-weighted average over the period
+    def wavg(g):
+        w = g["total_emir"]
+        denom = float(w.sum())
+        if denom <= 0:
+            return pd.Series({"metric_wavg": 0.0, "total_emir_period": 0.0})
+        return pd.Series({
+            "metric_wavg": float((g["metric_value"] * w).sum() / denom),
+            "total_emir_period": float(denom),
+        })
+
+    out = daily.groupby("islem_kodu", as_index=False, observed=True).apply(wavg).reset_index(drop=True)
+    out["islem_kodu"] = out["islem_kodu"].astype(str)
+    out = out.sort_values("metric_wavg", ascending=better_high is False)  # if better_high False, sort ascending
+
+    return out, better_high
+
+# Daily trade/cancel/expired % and total orders per (tarih, islem_kodu) via conditional aggregation
+METRIC_DAILY_CTE = """
+WITH daily AS (
+    SELECT
+        tarih,
+        islem_kodu,
+        COALESCE(SUM(CAST(yuzde AS DOUBLE)) FILTER (WHERE final_state = 'Trade'), 0.0) AS trade_pct,
+        COALESCE(SUM(CAST(yuzde AS DOUBLE)) FILTER (WHERE final_state = 'CanceledByUser'), 0.0) AS cancel_pct,
+        COALESCE(SUM(CAST(yuzde AS DOUBLE)) FILTER (WHERE final_state = 'Expired'), 0.0) AS expired_pct,
+        SUM(CAST(emir_sayisi AS DOUBLE)) AS total_emir
+    FROM {source}
+    WHERE list_contains(?, CAST(islem_kodu AS VARCHAR)) AND tarih >= ? AND tarih <= ?
+    GROUP BY tarih, islem_kodu
+)
+"""
+
+METRIC_QUERY = METRIC_DAILY_CTE + """
+SELECT
+    CAST(islem_kodu AS VARCHAR) AS islem_kodu,
+    CASE WHEN SUM(total_emir) > 0
+         THEN SUM(({metric_sql}) * total_emir) / SUM(total_emir)
+         ELSE 0.0 END AS metric_wavg,
+    CASE WHEN SUM(total_emir) > 0 THEN SUM(total_emir) ELSE 0.0 END AS total_emir_period
+FROM daily
+GROUP BY islem_kodu
+ORDER BY metric_wavg {order}, islem_kodu
+"""
+
+def _wavg_sql(metric_sql: str) -> str:
+    return f"CASE WHEN SUM(total_emir) > 0 THEN SUM(({metric_sql}) * total_emir) / SUM(total_emir) ELSE 0.0 END"
+
+ALL_METRICS_QUERY = METRIC_DAILY_CTE + """
+SELECT
+    CAST(islem_kodu AS VARCHAR) AS islem_kodu,
+    {metric_columns},
+    CASE WHEN SUM(total_emir) > 0 THEN SUM(total_emir) ELSE 0.0 END AS total_emir_period
+FROM daily
+GROUP BY islem_kodu
+ORDER BY islem_kodu
+"""
+
+def _run_metric_query(source, query: str, params: list) -> pd.DataFrame:
+    # source: parquet path/glob/dir, or an in-memory pandas DataFrame / Arrow table (scanned without copying)
+    import duckdb
+
+    con = duckdb.connect(database=":memory:")
+    if isinstance(source, str):
+        source_sql = parquet_source_sql(source)
+    else:
+        con.register("daily_states", source)
+        source_sql = "daily_states"
+    out = con.execute(query.replace("{source}", source_sql), params).fetchdf()
+    con.close()
+    return out
+
+@timed("metric_sql")
+def compute_bist100_metric_sql(source, stocks: list[str], start_date: pd.Timestamp, end_date: pd.Timestamp, metric_key: str):
+    better_high = METRICS[metric_key]["better_high"]
+    metric_sql = METRIC_SQL.get(metric_key, METRIC_SQL["EQS (w.avg)"])
+    query = METRIC_QUERY.replace("{metric_sql}", metric_sql).replace("{order}", "DESC" if better_high else "ASC")
+    out = _run_metric_query(source, query, [list(stocks), start_date, end_date])
+    return out, better_high
+
+def compute_all_metrics(source, stocks: list[str], start_date: pd.Timestamp, end_date: pd.Timestamp) -> pd.DataFrame:
+    # Every METRICS entry in one pass: islem_kodu, one w.avg column per metric key, total_emir_period
+    metric_columns = ",\n    ".join(f'{_wavg_sql(sql)} AS "{key}"' for key, sql in METRIC_SQL.items())
+    query = ALL_METRICS_QUERY.replace("{metric_columns}", metric_columns)
+    return _run_metric_query(source, query, [list(stocks), start_date, end_date])
+
+@timed()
+def compute_bist100_metric(df_all: pd.DataFrame, stocks: list[str], start_date: pd.Timestamp, end_date: pd.Timestamp, metric_key: str,
+                           index: StockIndex | None = None, engine: str = "duckdb"):
+    if index is not None:
+        # ticker/date selection through the offset index instead of isin + range masks over df_all
+        df_all = index_rows(index, stocks, start_date, end_date)
+    if engine == "pandas":
+        return compute_bist100_metric_pandas(df_all, stocks, start_date, end_date, metric_key)
+    return compute_bist100_metric_sql(df_all, stocks, start_date, end_date, metric_key)
+
@@ -0,0 +1,277 @@
+# build_final_state.py
+# Aggregation step: raw order lifecycle events -> final_state_daily parquet read by app.py
+# Requirements: duckdb, pyarrow, numpy
+#
+# Raw event expectation (parquet file, glob, or hive-partitioned directory e.g. raw/tarih=2025-11-03/*.parquet):
+#   - zaman        TIMESTAMP  event time
+#   - islem_kodu   VARCHAR    ticker (e.g. AKBNK.E)
+#   - emir_no      BIGINT     order id (unique per day)
+#   - durum        VARCHAR    order state after this update (New, Trade, CanceledByUser, Expired, ...)
+#   - seq          BIGINT     optional, tie-breaker for updates with the same zaman
+#
+# Output: tarih, islem_kodu, final_state, emir_sayisi, yuzde (one row per day x ticker x final state);
+# yuzde is the share of the ticker's orders on that day, in percent.
+#
+# Each trading day is aggregated separately (last state per order with arg_max, then counts per
+# ticker/state), by a pool of worker threads with their own DuckDB connection. DuckDB runs
+# the scans outside the GIL, spills to --temp-dir when a day does not fit into --memory-limit,
+# and per-day results are staged as small parquet parts before the final file is written, so
+# memory stays bounded by the largest day, not by the whole input.
+#
+# Run:
+#   python build_final_state.py generate raw_events --days 20 --tickers 100 --orders 20000
+#   python build_final_state.py build raw_events final_state_daily_bist100.parquet --workers 4
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import duckdb
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+OUTPUT_SCHEMA_SQL = """
+    CAST(tarih AS DATE) AS tarih,
+    CAST(islem_kodu AS VARCHAR) AS islem_kodu,
+    CAST(final_state AS VARCHAR) AS final_state,
+    CAST(emir_sayisi AS BIGINT) AS emir_sayisi,
+    CAST(yuzde AS DOUBLE) AS yuzde
+"""
+
+DAY_QUERY = """
+WITH orders AS (
+    SELECT
+        islem_kodu,
+        arg_max(durum, {order_key}) AS final_state,
+        COUNT(*) AS n_events
+    FROM {source}
+    WHERE {day_filter}
+    GROUP BY islem_kodu, emir_no
+)
+SELECT
+    ?::DATE AS tarih,
+    islem_kodu,
+    final_state,
+    COUNT(*) AS emir_sayisi,
+    100.0 * COUNT(*) / SUM(COUNT(*)) OVER (PARTITION BY islem_kodu) AS yuzde,
+    SUM(n_events) AS n_events
+FROM orders
+GROUP BY islem_kodu, final_state
+"""
+
+
+def raw_source_sql(raw_path: str) -> str:
+    if os.path.isdir(raw_path):
+        pattern = os.path.join(raw_path, "**", "*.parquet")
+        return f"read_parquet('{pattern}', hive_partitioning = true, union_by_name = true)"
+    return f"read_parquet('{raw_path}')"
+
+
+def connect(memory_limit: str | None = None, threads: int | None = None, temp_dir: str | None = None):
+    con = duckdb.connect(database=":memory:")
+    if memory_limit:
+        con.execute(f"SET memory_limit = '{memory_limit}'")
+    if threads:
+        con.execute(f"SET threads = {int(threads)}")
+    if temp_dir:
+        con.execute(f"SET temp_directory = '{temp_dir}'")
+    con.execute("SET preserve_insertion_order = false")
+    return con
+
+
+def raw_days(con, source: str, columns: list[str]) -> list:
+    # With a hive tarih partition the day list comes from the paths, otherwise from the zaman column only
+    if "tarih" in columns:
+        return [r[0] for r in con.execute(f"SELECT DISTINCT CAST(tarih AS DATE) FROM {source} ORDER BY 1").fetchall()]
+    return [r[0] for r in con.execute(f"SELECT DISTINCT CAST(zaman AS DATE) FROM {source} ORDER BY 1").fetchall()]
+
+
+def aggregate_day(con, source: str, columns: list[str], day, part_path: str) -> int:
+    order_key = "{'zaman': zaman, 'seq': seq}" if "seq" in columns else "zaman"
+    day_filter = "zaman >= ?::DATE AND zaman < ?::DATE + INTERVAL 1 DAY"
+    params = [day, day]
+    if "tarih" in columns:
+        # partition column: lets DuckDB open only that day's files
+        day_filter = "CAST(tarih AS DATE) = ?::DATE AND " + day_filter
+        params = [day] + params
+
+    query = DAY_QUERY.format(source=source, order_key=order_key, day_filter=day_filter)
+    table = pa.table(con.execute(query, params + [day]).arrow())
+    n_events = int(pc.sum(table["n_events"]).as_py() or 0)
+    pq.write_table(table.drop(["n_events"]), part_path)
+    return n_events
+
+
+def build(raw_path: str, out_path: str, workers: int = 4, memory_limit: str = "2GB", temp_dir: str | None = None) -> dict:
+    t0 = time.perf_counter()
+    source = raw_source_sql(raw_path)
+    staging = tempfile.mkdtemp(prefix="final_state_parts_")
+    temp_dir = temp_dir or os.path.join(staging, "spill")
+
+    con = connect(memory_limit, temp_dir=temp_dir)
+    columns = [r[0] for r in con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()]
+    missing = {"zaman", "islem_kodu", "emir_no", "durum"} - set(columns)
+    if missing:
+        raise ValueError(f"Ham veride eksik kolon(lar): {sorted(missing)}")
+    days = raw_days(con, source, columns)
+    con.close()
+    if not days:
+        raise ValueError(f"Ham veride gün bulunamadı: {raw_path}")
+
+    cpu = os.cpu_count() or 1
+    workers = max(1, min(workers, len(days) or 1))
+    threads_per_worker = max(1, cpu // workers)
+    mem_per_worker = _split_memory(memory_limit, workers)
+
+    def run(chunk: list) -> list[tuple]:
+        wcon = connect(mem_per_worker, threads_per_worker, temp_dir)
+        done = []
+        for day in chunk:
+            d0 = time.perf_counter()
+            part = os.path.join(staging, f"tarih={day}.parquet")
+            n = aggregate_day(wcon, source, columns, day, part)
+            done.append((day, n, time.perf_counter() - d0))
+        wcon.close()
+        return done
+
+    chunks = [days[i::workers] for i in range(workers)]
+    per_day = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for done in pool.map(run, chunks):
+                per_day.extend(done)
+
+        con = connect(memory_limit, temp_dir=temp_dir)
+        parts = os.path.join(staging, "tarih=*.parquet")
+        con.execute(f"""
+            COPY (
+                SELECT {OUTPUT_SCHEMA_SQL}
+                FROM read_parquet('{parts}')
+                ORDER BY tarih, islem_kodu, emir_sayisi DESC
+            ) TO '{out_path}' (FORMAT PARQUET)
+        """)
+        n_rows = con.execute(f"SELECT COUNT(*) FROM read_parquet('{out_path}')").fetchone()[0]
+        con.close()
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    elapsed = time.perf_counter() - t0
+    n_events = sum(n for _, n, _ in per_day)
+    return {
+        "days": len(days),
+        "events": n_events,
+        "rows": int(n_rows),
+        "seconds": elapsed,
+        "events_per_sec": n_events / elapsed if elapsed > 0 else 0.0,
+        "per_day": sorted(per_day),
+    }
+
+
+def _split_memory(memory_limit: str, workers: int) -> str:
+    units = {"KB": 1 << 10, "MB": 1 << 20, "GB": 1 << 30, "TB": 1 << 40}
+    value = memory_limit.strip().upper().replace("IB", "B")
+    for unit, mult in units.items():
+        if value.endswith(unit):
+            total = float(value[: -len(unit)]) * mult
+            return f"{max(64, int(total / workers / (1 << 20)))}MB"
+    raise ValueError(f"Geçersiz memory limit: {memory_limit} (örn. 2GB, 512MB)")
+
+
+# -----------------------------
+# Synthetic raw events (local testing)
+# -----------------------------
+SYNTH_FINAL_STATES = ["Trade", "CanceledByUser", "Expired", "New", "CanceledBySystem"]
+SYNTH_FINAL_PROBS = [0.45, 0.33, 0.12, 0.05, 0.05]
+
+
+def generate_raw_events(out_dir: str, n_days: int = 20, n_tickers: int = 100, orders_per_ticker: int = 2000,
+                        start: str = "2025-11-03", seed: int = 0) -> int:
+    # One hive partition per business day (tarih=YYYY-MM-DD). Every order starts with a "New" event,
+    # may get up to two intermediate "New" updates (price/qty changes), and ends in its final state.
+    rng = np.random.default_rng(seed)
+    days = np.arange(np.datetime64(start, "D"), np.datetime64(start, "D") + n_days * 2)
+    days = days[np.is_busday(days)][:n_days]
+    tickers = np.array([f"SYN{i:03d}.E" for i in range(n_tickers)])
+    states = np.array(SYNTH_FINAL_STATES + ["New"])
+    final_probs = np.array(SYNTH_FINAL_PROBS)
+
+    total = 0
+    for day in days:
+        # per-ticker activity varies so the generated shares differ between tickers
+        activity = rng.lognormal(0.0, 0.6, n_tickers)
+        n_orders = np.maximum(1, (orders_per_ticker * activity).astype(np.int64))
+        order_ticker = np.repeat(np.arange(n_tickers), n_orders)
+        n = len(order_ticker)
+        order_id = np.arange(n, dtype=np.int64)
+        final = rng.choice(len(SYNTH_FINAL_STATES), size=n, p=final_probs)
+        n_updates = rng.integers(1, 4, size=n)                  # events besides the final one
+        n_updates[final == SYNTH_FINAL_STATES.index("New")] = 0  # still "New" at snapshot: single event
+
+        events_per_order = n_updates + 1
+        ev_order = np.repeat(order_id, events_per_order)
+        ev_pos = np.arange(len(ev_order)) - np.repeat(np.cumsum(events_per_order) - events_per_order, events_per_order)
+        is_last = ev_pos == np.repeat(events_per_order - 1, events_per_order)
+        ev_state = np.where(is_last, np.repeat(final, events_per_order), len(states) - 1)
+
+        # first event between 10:00 and 18:00, later updates 1s-10min apart (ties resolved by seq)
+        t_first = rng.integers(10 * 3600, 18 * 3600, size=n)
+        gaps = np.cumsum(rng.integers(1, 600, size=len(ev_order)) * (ev_pos > 0))
+        first_idx = np.cumsum(events_per_order) - events_per_order
+        since_first = gaps - np.repeat(gaps[first_idx], events_per_order)
+        ev_seconds = np.minimum(np.repeat(t_first, events_per_order) + since_first, 18 * 3600)
+        zaman = day.astype("datetime64[s]") + ev_seconds.astype("timedelta64[s]")
+
+        table = pa.table({
+            "zaman": pa.array(zaman.astype("datetime64[us]")),
+            "islem_kodu": pa.array(tickers[order_ticker[ev_order]]).dictionary_encode(),
+            "emir_no": pa.array(ev_order),
+            "durum": pa.array(states[ev_state]).dictionary_encode(),
+            "seq": pa.array(ev_pos.astype(np.int64)),
+        })
+        part_dir = os.path.join(out_dir, f"tarih={day}")
+        os.makedirs(part_dir, exist_ok=True)
+        pq.write_table(table, os.path.join(part_dir, "part-0.parquet"))
+        total += table.num_rows
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ham emir olaylarından final_state_daily parquet üretir")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_build = sub.add_parser("build", help="ham olaylar -> final_state_daily parquet")
+    p_build.add_argument("raw_path", help="ham olay parquet dosyası, glob veya hive-partitioned dizin")
+    p_build.add_argument("out_path", help="çıktı parquet (örn. final_state_daily_bist100.parquet)")
+    p_build.add_argument("--workers", type=int, default=4, help="paralel gün sayısı")
+    p_build.add_argument("--memory-limit", default="2GB", help="toplam DuckDB bellek limiti")
+    p_build.add_argument("--temp-dir", default=None, help="bellek yetmezse spill dizini")
+
+    p_gen = sub.add_parser("generate", help="sentetik ham olay verisi üretir")
+    p_gen.add_argument("out_dir")
+    p_gen.add_argument("--days", type=int, default=20)
+    p_gen.add_argument("--tickers", type=int, default=100)
+    p_gen.add_argument("--orders", type=int, default=2000, help="hisse başına günlük ortalama emir")
+    p_gen.add_argument("--start", default="2025-11-03")
+    p_gen.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.cmd == "generate":
+        t0 = time.perf_counter()
+        n = generate_raw_events(args.out_dir, args.days, args.tickers, args.orders, args.start, args.seed)
+        print(f"{n:,} olay -> {args.out_dir} ({time.perf_counter() - t0:.1f}s)")
+        return
+
+    report = build(args.raw_path, args.out_path, args.workers, args.memory_limit, args.temp_dir)
+    for day, n, secs in report["per_day"]:
+        print(f"  {day}  {n:>12,} olay  {secs:6.2f}s  {n / secs if secs else 0:>12,.0f} olay/s")
+    print(f"{report['days']} gün, {report['events']:,} olay -> {report['rows']:,} satır ({args.out_path})")
+    print(f"Süre: {report['seconds']:.2f}s  Throughput: {report['events_per_sec']:,.0f} olay/s")
+
+
+if __name__ == "__main__":
+    main()
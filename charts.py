@@ -0,0 +1,330 @@
+# charts.py
+# Plotly figure builders for the dashboard views (ranking, stock detail, time series). No Streamlit dependency,
+# so the same figures can be built by app.py and by batch/export jobs.
+# Requirements: numpy, pandas, plotly
+
+from __future__ import annotations
+
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+from bist_metrics import (
+    METRICS,
+    DailyTensor,
+    Similarity,
+    add_week_index,
+    calc_month_references,
+    tensor_day_range,
+    week_starts_of,
+)
+from perf import timed
+
+# Points per time-series trace sent to the browser; longer series are downsampled on the server
+TS_MAX_POINTS = 1000
+
+
+def black_ref_bar(name: str, x, y):
+    return go.Bar(
+        name=name,
+        x=x,
+        y=y,
+        marker=dict(color="black", opacity=0.45, line=dict(color="black", width=3)),
+    )
+
+
+# -----------------------------
+# 1) Comparison
+# -----------------------------
+def ranking_bar_figure(metric_df: pd.DataFrame, metric_key: str) -> go.Figure:
+    fig = px.bar(
+        metric_df,
+        x="islem_kodu",
+        y="metric_wavg",
+        hover_data=[c for c in ("total_emir_period", "ci_low", "ci_high") if c in metric_df.columns],
+        title=METRICS[metric_key]["label"],
+        labels={"islem_kodu": "Hisse", "metric_wavg": metric_key, "total_emir_period": "Toplam Emir (Period)",
+                "ci_low": "GA alt", "ci_high": "GA üst"},
+    )
+    if "ci_low" in metric_df.columns:
+        # bootstrap interval as asymmetric error bars around the point estimate
+        v = metric_df["metric_wavg"].to_numpy()
+        fig.update_traces(error_y=dict(
+            type="data",
+            array=np.clip(metric_df["ci_high"].to_numpy() - v, 0, None),
+            arrayminus=np.clip(v - metric_df["ci_low"].to_numpy(), 0, None),
+            thickness=1,
+            width=2,
+        ))
+    fig.update_layout(xaxis_tickangle=-45, height=520)
+    return fig
+
+
+def ranking_scatter_figure(metric_df: pd.DataFrame, metric_key: str) -> go.Figure:
+    fig = px.scatter(
+        metric_df,
+        x="total_emir_period",
+        y="metric_wavg",
+        hover_name="islem_kodu",
+        title=f"{metric_key} vs Toplam Emir (Period)",
+        labels={"total_emir_period": "Toplam Emir (Period)", "metric_wavg": metric_key},
+    )
+    fig.update_layout(height=520)
+    return fig
+
+
+# -----------------------------
+# 2) Stock detail
+# -----------------------------
+class DetailData(NamedTuple):
+    state_order: list[str]          # states by total count, descending
+    weeks: list[int]                # calendar weeks present (1-based)
+    week_starts: dict[int, pd.Timestamp]
+    n_days: int
+    month_pct: pd.Series            # period share per state (index: state_order)
+    month_cnt_daily_avg: pd.Series  # daily average count per state (index: state_order)
+    weekly_pct: pd.DataFrame        # hafta x state: mean daily %
+    weekly_cnt: pd.DataFrame        # hafta x state: total count
+    daily_pct: pd.DataFrame         # (hafta, tarih) x state: daily %
+    daily_cnt: pd.DataFrame         # (hafta, tarih) x state: daily count
+
+
+@timed()
+def detail_data(dfh: pd.DataFrame, n_days: int | None = None) -> DetailData:
+    # Every series the detail charts need, each reshaped once with a pivot/unstack + column reindex
+    # (instead of a set_index/reindex per week or per day).
+    month_pct, month_cnt_daily_avg, n_days_total = calc_month_references(dfh)
+    state_order = month_pct.sort_values("emir_sayisi", ascending=False, kind="stable")["final_state"].astype(str).tolist()
+    month_pct = month_pct.set_index("final_state")["yuzde"].reindex(state_order).fillna(0)
+    month_cnt_daily_avg = month_cnt_daily_avg.set_index("final_state")["emir_sayisi"].reindex(state_order).fillna(0)
+
+    dfw = add_week_index(dfh, n_days=n_days)
+    week_starts = dfw.groupby("hafta")["hafta_baslangic"].first().to_dict()
+    weeks = sorted(week_starts)
+    by_week = dfw.groupby(["hafta", "final_state"], observed=True)
+    weekly_pct = by_week["yuzde"].mean().unstack("final_state").reindex(index=weeks, columns=state_order).fillna(0)
+    weekly_cnt = by_week["emir_sayisi"].sum().unstack("final_state").reindex(index=weeks, columns=state_order).fillna(0)
+
+    daily = dfw.pivot_table(index=["hafta", "tarih"], columns="final_state", values=["yuzde", "emir_sayisi"],
+                            aggfunc="sum", observed=True)
+    daily_pct = daily["yuzde"].reindex(columns=state_order).fillna(0)
+    daily_cnt = daily["emir_sayisi"].reindex(columns=state_order).fillna(0)
+
+    return DetailData(state_order, weeks, week_starts, n_days_total, month_pct, month_cnt_daily_avg,
+                      weekly_pct, weekly_cnt, daily_pct, daily_cnt)
+
+
+@timed()
+def tensor_detail_data(tensor: DailyTensor, ticker: str, start_date, end_date) -> DetailData | None:
+    # detail_data() from the dense tensor: the ticker's (days, states) block is a slice and every table
+    # is an axis reduction or a (weeks x days) @ (days x states) product. None when there are no rows.
+    if ticker not in tensor.ticker_pos:
+        return None
+    lo, hi = tensor_day_range(tensor, start_date, end_date)
+    t = tensor.ticker_pos[ticker]
+    rows = tensor.rows[lo:hi, t]
+    has_day = rows.any(axis=1)
+    if not has_day.any():
+        return None
+    days = tensor.dates[lo:hi][has_day]
+    rows = rows[has_day]
+    cnt = tensor.counts[lo:hi, t][has_day].astype(np.float64)
+    pct = tensor.pct[lo:hi, t][has_day].astype(np.float64)
+
+    # states with rows in the range, by total count (ties keep category order, like the stable sort above)
+    state_cnt = cnt.sum(axis=0)
+    observed = np.flatnonzero(rows.any(axis=0))
+    order = observed[np.argsort(-state_cnt[observed], kind="stable")]
+    state_order = [tensor.states[i] for i in order]
+    total = state_cnt.sum()
+    n_days = len(days)
+    month_pct = pd.Series(100.0 * state_cnt[order] / total if total else np.zeros(len(order)), index=state_order)
+    month_cnt_daily_avg = pd.Series(state_cnt[order] / n_days, index=state_order)
+
+    starts = week_starts_of(days)
+    week_values, hafta = np.unique(starts, return_inverse=True)
+    weeks = list(range(1, len(week_values) + 1))
+    week_starts = {w: pd.Timestamp(v) for w, v in zip(weeks, week_values)}
+    onehot = (hafta[None, :] == np.arange(len(weeks))[:, None]).astype(np.float64)   # (W, N)
+    rows_o = rows[:, order].astype(np.float64)
+    n_rows = onehot @ rows_o
+    weekly_pct = np.divide(onehot @ (pct[:, order] * rows_o), n_rows, out=np.zeros_like(n_rows), where=n_rows > 0)
+    weekly_cnt = onehot @ cnt[:, order]
+
+    columns = pd.Index(state_order, name="final_state")
+    week_index = pd.Index(weeks, name="hafta")
+    day_index = pd.MultiIndex.from_arrays([np.asarray(weeks)[hafta], pd.DatetimeIndex(days)], names=["hafta", "tarih"])
+    return DetailData(
+        state_order, weeks, week_starts, n_days, month_pct, month_cnt_daily_avg,
+        pd.DataFrame(weekly_pct, index=week_index, columns=columns),
+        pd.DataFrame(weekly_cnt, index=week_index, columns=columns),
+        pd.DataFrame(pct[:, order], index=day_index, columns=columns),
+        pd.DataFrame(cnt[:, order], index=day_index, columns=columns),
+    )
+
+
+def weekly_pct_figure(d: DetailData, start_date: pd.Timestamp, end_date: pd.Timestamp) -> go.Figure:
+    fig = go.Figure()
+    for w, row in d.weekly_pct.iterrows():
+        fig.add_trace(go.Bar(name=f"Hafta {w} (Ort.)", x=d.state_order, y=row.values))
+    fig.add_trace(black_ref_bar(f"Ay Toplamı ({start_date.strftime('%Y-%m-%d')}→{end_date.strftime('%Y-%m-%d')})",
+                                d.state_order, d.month_pct.values))
+    fig.update_layout(
+        barmode="group",
+        height=520,
+        title="Hafta Hafta Ortalama % + Ay Toplamı",
+        xaxis_title="Final State",
+        yaxis_title="Yüzde",
+        yaxis=dict(range=[0, 100]),
+        legend_title="Seriler",
+    )
+    return fig
+
+
+def weekly_cnt_figure(d: DetailData) -> go.Figure:
+    fig = go.Figure()
+    for w, row in d.weekly_cnt.iterrows():
+        fig.add_trace(go.Bar(name=f"Hafta {w} (Toplam)", x=d.state_order, y=row.values))
+    # Monthly reference for weekly counts: daily avg * 5 (benchmark)
+    fig.add_trace(black_ref_bar("Ay Ort. (5 gün beklenen)", d.state_order, d.month_cnt_daily_avg.values * 5))
+    fig.update_layout(
+        barmode="group",
+        height=520,
+        title="Hafta Hafta Toplam Emir + Ay Ort. (5 gün beklenen)",
+        xaxis_title="Final State",
+        yaxis_title="Emir Sayısı",
+        legend_title="Seriler",
+    )
+    return fig
+
+
+def _week_rows(table: pd.DataFrame, week: int) -> pd.DataFrame:
+    if week not in table.index.get_level_values("hafta"):
+        return table.iloc[0:0].droplevel("hafta")
+    return table.xs(week, level="hafta")
+
+
+def _alert_marker(alerts: pd.DataFrame | None, day, state_order: list[str]) -> dict:
+    # Red outline on the (day, state) bars flagged by the anomaly detector
+    if alerts is None or alerts.empty:
+        return {}
+    hit = alerts[alerts["tarih"] == pd.Timestamp(day)].set_index("final_state")["z"]
+    if hit.empty:
+        return {}
+    flagged = np.isin(state_order, hit.index)
+    return dict(
+        marker_line_color=np.where(flagged, "red", "rgba(0,0,0,0)"),
+        marker_line_width=np.where(flagged, 3, 0),
+        hovertext=[f"Anomali z={hit[s]:+.1f}" if s in hit.index else "" for s in state_order],
+    )
+
+
+def daily_pct_figure(d: DetailData, week: int, alerts: pd.DataFrame | None = None) -> go.Figure:
+    fig = go.Figure()
+    for day, row in _week_rows(d.daily_pct, week).iterrows():
+        fig.add_trace(go.Bar(name=pd.Timestamp(day).strftime("%Y-%m-%d"), x=d.state_order, y=row.values,
+                             **_alert_marker(alerts, day, d.state_order)))
+    fig.add_trace(black_ref_bar("Ay Toplamı", d.state_order, d.month_pct.values))
+    fig.update_layout(
+        barmode="group",
+        height=520,
+        title=f"Hafta {week} — Günlük % + Ay Toplamı",
+        xaxis_title="Final State",
+        yaxis_title="Yüzde",
+        yaxis=dict(range=[0, 100]),
+        legend_title="Seriler",
+    )
+    return fig
+
+
+def daily_cnt_figure(d: DetailData, week: int, alerts: pd.DataFrame | None = None) -> go.Figure:
+    fig = go.Figure()
+    for day, row in _week_rows(d.daily_cnt, week).iterrows():
+        fig.add_trace(go.Bar(name=pd.Timestamp(day).strftime("%Y-%m-%d"), x=d.state_order, y=row.values,
+                             **_alert_marker(alerts, day, d.state_order)))
+    # Monthly reference for daily counts: daily avg per state
+    fig.add_trace(black_ref_bar("Ay Günlük Ort.", d.state_order, d.month_cnt_daily_avg.values))
+    fig.update_layout(
+        barmode="group",
+        height=520,
+        title=f"Hafta {week} — Günlük Emir Sayısı + Ay Günlük Ort.",
+        xaxis_title="Final State",
+        yaxis_title="Emir Sayısı",
+        legend_title="Seriler",
+    )
+    return fig
+
+
+def similarity_heatmap_figure(sim: Similarity, highlight: str | None = None) -> go.Figure:
+    # Distance matrix in spectral order, so clusters show up as dark blocks on the diagonal
+    order = sim.order
+    names = [sim.tickers[i] for i in order]
+    z = sim.distance[np.ix_(order, order)].astype(np.float32)
+    fig = go.Figure(go.Heatmap(
+        z=z,
+        x=names,
+        y=names,
+        colorscale="Viridis",
+        colorbar=dict(title="Mesafe"),
+        hovertemplate="%{y} ↔ %{x}<br>mesafe=%{z:.4f}<extra></extra>",
+    ))
+    # cluster boundaries
+    labels = sim.labels[order]
+    for b in np.flatnonzero(np.diff(labels)) + 0.5:
+        fig.add_shape(type="line", x0=b, x1=b, y0=-0.5, y1=len(names) - 0.5, line=dict(color="white", width=1))
+        fig.add_shape(type="line", y0=b, y1=b, x0=-0.5, x1=len(names) - 0.5, line=dict(color="white", width=1))
+    if highlight in names:
+        i = names.index(highlight)
+        fig.add_shape(type="rect", x0=-0.5, x1=len(names) - 0.5, y0=i - 0.5, y1=i + 0.5, line=dict(color="red", width=2))
+    fig.update_layout(
+        height=720,
+        title="Hisse Benzerliği (Final State karışımı, kümelenmiş)",
+        xaxis=dict(showticklabels=len(names) <= 120, tickangle=-90),
+        yaxis=dict(showticklabels=len(names) <= 120, autorange="reversed"),
+    )
+    return fig
+
+
+# -----------------------------
+# 3) Time series
+# -----------------------------
+def minmax_downsample(y: np.ndarray, max_points: int = TS_MAX_POINTS) -> np.ndarray:
+    # Indices to keep: first/last point plus the min and max of each of max_points/2 equal-width
+    # buckets (per pixel column), so spikes survive while the payload stays bounded.
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    n_buckets = max(1, max_points // 2)
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    width = int(np.diff(edges).max())
+    idx = edges[:-1, None] + np.arange(width)[None, :]
+    valid = idx < edges[1:, None]
+    idx = np.minimum(idx, n - 1)
+    vals = y[idx]
+    lows = np.where(valid & ~np.isnan(vals), vals, np.inf)
+    highs = np.where(valid & ~np.isnan(vals), vals, -np.inf)
+    rows = np.arange(n_buckets)
+    keep = np.concatenate([idx[rows, lows.argmin(axis=1)], idx[rows, highs.argmax(axis=1)], [0, n - 1]])
+    return np.unique(keep)
+
+
+def timeseries_figure(x: pd.DatetimeIndex, series: dict[str, np.ndarray], title: str, yaxis_title: str,
+                      max_points: int = TS_MAX_POINTS) -> go.Figure:
+    # WebGL traces (Scattergl); each series is downsampled on the server before it is serialized
+    fig = go.Figure()
+    x = np.asarray(x)
+    for name, y in series.items():
+        keep = minmax_downsample(y, max_points)
+        fig.add_trace(go.Scattergl(name=name, x=x[keep], y=y[keep].astype(np.float32), mode="lines"))
+    fig.update_layout(
+        height=520,
+        title=title,
+        xaxis_title="Tarih",
+        yaxis_title=yaxis_title,
+        legend_title="Seriler",
+        hovermode="x unified",
+    )
+    return fig
@@ -0,0 +1,111 @@
+# dataset_watcher.py
+# Background refresh of the loaded dataset with an atomic version swap. No Streamlit dependency.
+# Requirements: pandas, numpy, duckdb (pyarrow for LOAD_MODE=arrow), see bist_metrics.py
+#
+# A daemon thread checks the dataset fingerprint (file list, mtimes, sizes, parquet footers) every
+# poll_seconds. When it changes, refresh_dataset() loads the new data off the request path: new
+# day/partition files are appended (incrementally when they only add later days), a rewritten file
+# triggers a full reload. The stock index, tensor, prefix index and anomaly state are all built
+# before anything is published. The finished version is then published with a single reference
+# assignment, so a reader sees either the old version or the new one, never a half-built frame,
+# and readers never wait on a reload.
+#
+# A failed reload keeps serving the current version and is reported in last_error.
+
+import threading
+import time
+from typing import NamedTuple
+
+from bist_metrics import DatasetState, refresh_dataset
+
+
+class ActiveDataset(NamedTuple):
+    state: DatasetState
+    version: int                            # 1 for the first load, +1 per swap
+    loaded_at: float                        # time.time() when this version was published
+    load_seconds: float                     # wall time of the load that produced it
+
+
+class DatasetWatcher:
+    def __init__(self, parquet_path: str, start_date=None, end_date=None, load_mode: str = "duckdb",
+                 arrow_cache_dir: str | None = None, poll_seconds: float = 10.0):
+        self.parquet_path = parquet_path
+        self.start_date = start_date
+        self.end_date = end_date
+        self.load_mode = load_mode
+        self.arrow_cache_dir = arrow_cache_dir
+        self.poll_seconds = poll_seconds
+        self.last_error: str | None = None
+        self.last_check: float | None = None
+        self._active: ActiveDataset | None = None
+        self._refresh_lock = threading.Lock()   # one load at a time; readers never take it
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def active(self) -> ActiveDataset:
+        # The first call loads synchronously (nothing to serve yet); later calls return immediately
+        active = self._active
+        if active is None:
+            self.refresh(raise_errors=True)
+            active = self._active
+        return active
+
+    def refresh(self, raise_errors: bool = False) -> bool:
+        # Loads the dataset if its fingerprint changed; True when a new version was published
+        with self._refresh_lock:
+            current = self._active
+            t0 = time.perf_counter()
+            try:
+                state = refresh_dataset(current.state if current is not None else None, self.parquet_path,
+                                        self.start_date, self.end_date, load_mode=self.load_mode,
+                                        arrow_cache_dir=self.arrow_cache_dir)
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                if raise_errors or current is None:
+                    raise
+                return False
+            finally:
+                self.last_check = time.time()
+            self.last_error = None
+            if current is not None and state is current.state:
+                return False
+            version = current.version + 1 if current is not None else 1
+            self._active = ActiveDataset(state, version, time.time(), time.perf_counter() - t0)
+            return True
+
+    # -----------------------------
+    # Background thread
+    # -----------------------------
+    def start(self) -> "DatasetWatcher":
+        if self.poll_seconds > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"dataset-watcher:{self.parquet_path}",
+                                            daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.refresh()
+            except Exception:
+                # refresh() already recorded it in last_error; keep serving and keep polling
+                pass
+
+    def info(self) -> dict:
+        active = self._active
+        return {
+            "version": active.version if active is not None else None,
+            "fingerprint": active.state.fingerprint if active is not None else None,
+            "loaded_at": active.loaded_at if active is not None else None,
+            "load_seconds": active.load_seconds if active is not None else None,
+            "last_check": self.last_check,
+            "last_error": self.last_error,
+            "polling": self._thread is not None,
+        }
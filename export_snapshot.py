@@ -0,0 +1,283 @@
+# export_snapshot.py
+# Static snapshot CLI: the dashboard views pre-rendered as HTML pages + JSON figure bundles (no Streamlit).
+# Requirements: pandas, numpy, plotly, duckdb (pyarrow for --load-mode arrow)
+#
+# Output directory:
+#   plotly.min.js                 one shared copy of plotly.js, referenced by every page
+#   index.html                    links to the ranking page and every ticker page
+#   ranking.html / ranking.json   bar (with bootstrap CI) + scatter for every metric in the universe
+#   hisse/<TICKER>.html / .json   weekly %, weekly count, daily % and daily count per week, with the monthly
+#                                 reference bars and the anomaly markers, like section 2 of app.py
+#   manifest.json                 content hash per ticker / ranking, used for incremental runs
+#
+# The figures come from charts.py, so they are the same ones app.py renders. Ticker pages are rendered
+# in parallel worker processes. On a rerun only tickers whose hash changed are rendered again. The hash
+# covers the ticker's rows in the range, its anomaly alerts and the export format, so appending one
+# day re-renders only the tickers that have that day. Each page is titled with the ticker's own
+# date range, not the export range.
+#
+# Run:
+#   python export_snapshot.py final_state_daily_bist100.parquet snapshot
+#   python export_snapshot.py data/final_state_daily snapshot --start 2025-11-01 --workers 8
+#   python export_snapshot.py data/final_state_daily snapshot --force        # re-render everything
+
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import plotly
+import plotly.offline
+
+from batch_metrics import resolve_universes
+from bist_metrics import (
+    METRICS,
+    anomaly_alerts,
+    bootstrap_ci,
+    load_universes,
+    range_ranking,
+    refresh_dataset,
+    stock_slice,
+    universe_members,
+)
+from charts import (
+    DetailData,
+    daily_cnt_figure,
+    daily_pct_figure,
+    ranking_bar_figure,
+    ranking_scatter_figure,
+    tensor_detail_data,
+    weekly_cnt_figure,
+    weekly_pct_figure,
+)
+
+# Bump when the page layout or the figures change, so the next run re-renders everything
+EXPORT_FORMAT = 2
+PLOTLY_JS = "plotly.min.js"
+MANIFEST = "manifest.json"
+
+
+# -----------------------------
+# Files
+# -----------------------------
+def _write_atomic(path: str, text: str) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^0-9A-Za-z]+", "_", name).strip("_")
+
+
+def write_bundle(out_dir: str, name: str, title: str, sections: list[tuple[str, str, object]], asset: str) -> None:
+    # sections: (key, heading, figure) -> name.html (plotly.js from asset) + name.json ({key: figure})
+    divs = "\n".join(
+        f"<h3>{html.escape(heading)}</h3>\n{fig.to_html(full_html=False, include_plotlyjs=False)}"
+        for _, heading, fig in sections
+    )
+    page = (
+        f'<!DOCTYPE html>\n<html lang="tr">\n<head>\n<meta charset="utf-8">\n<title>{html.escape(title)}</title>\n'
+        f'<script src="{asset}"></script>\n</head>\n<body>\n<h1>{html.escape(title)}</h1>\n{divs}\n</body>\n</html>\n'
+    )
+    bundle = "{" + ",".join(f"{json.dumps(key)}:{fig.to_json()}" for key, _, fig in sections) + "}"
+    _write_atomic(os.path.join(out_dir, f"{name}.html"), page)
+    _write_atomic(os.path.join(out_dir, f"{name}.json"), bundle)
+
+
+def write_plotly_js(out_dir: str) -> None:
+    path = os.path.join(out_dir, PLOTLY_JS)
+    stamp = f"{path}.version"
+    if os.path.exists(path) and os.path.exists(stamp) and open(stamp).read() == plotly.__version__:
+        return
+    _write_atomic(path, plotly.offline.get_plotlyjs())
+    _write_atomic(stamp, plotly.__version__)
+
+
+def load_manifest(out_dir: str) -> dict:
+    try:
+        with open(os.path.join(out_dir, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest if manifest.get("format") == EXPORT_FORMAT else {}
+
+
+# -----------------------------
+# Content hashes
+# -----------------------------
+def frame_hash(*frames: pd.DataFrame, extra: str = "") -> str:
+    h = hashlib.sha1(f"{EXPORT_FORMAT}|{plotly.__version__}|{extra}".encode())
+    for frame in frames:
+        h.update(",".join(map(str, frame.columns)).encode())
+        h.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+# -----------------------------
+# Views
+# -----------------------------
+def render_ticker(out_dir: str, ticker: str, d: DetailData, alerts: pd.DataFrame) -> str:
+    # Section 2 of app.py for one ticker, every week
+    days = d.daily_cnt.index.get_level_values("tarih")
+    first, last = days.min(), days.max()
+    sections = [
+        ("weekly_pct", "Hafta hafta ortalama Final State %", weekly_pct_figure(d, first, last)),
+        ("weekly_cnt", "Hafta hafta Final State Emir Sayısı", weekly_cnt_figure(d)),
+    ]
+    for w in d.weeks:
+        label = f"Hafta {w} ({d.week_starts[w]:%Y-%m-%d})"
+        sections.append((f"daily_pct_{w}", f"{label} — Günlük Final State %", daily_pct_figure(d, w, alerts)))
+        sections.append((f"daily_cnt_{w}", f"{label} — Günlük Final State Emir Sayısı", daily_cnt_figure(d, w, alerts)))
+    title = f"{ticker} — Hisse Detayı ({first:%Y-%m-%d} → {last:%Y-%m-%d})"
+    write_bundle(os.path.join(out_dir, "hisse"), ticker, title, sections, f"../{PLOTLY_JS}")
+    return ticker
+
+
+def _render_ticker_job(job: tuple) -> str:
+    return render_ticker(*job)
+
+
+def ranking_frames(state, stocks: list[str], start_date, end_date, n_boot: int) -> dict[str, pd.DataFrame]:
+    # metric -> ranking frame as section 1 of app.py shows it (prefix engine, CI merged in)
+    ci = bootstrap_ci(state.prefix, start_date, end_date, stocks, n_boot=n_boot) if n_boot > 0 and stocks else None
+    out = {}
+    for metric_key in METRICS:
+        metric_df, _ = range_ranking(state.prefix, stocks, start_date, end_date, metric_key)
+        if ci is not None and not metric_df.empty:
+            metric_ci = ci.loc[ci["metric"] == metric_key, ["islem_kodu", "ci_low", "ci_high"]]
+            metric_df = metric_df.merge(metric_ci, on="islem_kodu", how="left")
+        out[metric_key] = metric_df
+    return out
+
+
+def render_ranking(out_dir: str, frames: dict[str, pd.DataFrame], universe: str, start_date, end_date) -> None:
+    sections = []
+    for metric_key, metric_df in frames.items():
+        if metric_df.empty:
+            continue
+        sections.append((f"bar_{_slug(metric_key)}", f"{metric_key} — Bar (Ranking)", ranking_bar_figure(metric_df, metric_key)))
+        sections.append((f"scatter_{_slug(metric_key)}", f"{metric_key} — Scatter (Metrik vs Hacim)",
+                         ranking_scatter_figure(metric_df, metric_key)))
+    title = f"{universe} Karşılaştırma ({pd.Timestamp(start_date):%Y-%m-%d} → {pd.Timestamp(end_date):%Y-%m-%d})"
+    write_bundle(out_dir, "ranking", title, sections, PLOTLY_JS)
+
+
+def write_index(out_dir: str, tickers: list[str], universe: str, fingerprint: str) -> None:
+    links = "\n".join(f'<li><a href="hisse/{html.escape(t)}.html">{html.escape(t)}</a></li>' for t in tickers)
+    page = (
+        '<!DOCTYPE html>\n<html lang="tr">\n<head>\n<meta charset="utf-8">\n<title>BIST Final State Snapshot</title>\n'
+        f'</head>\n<body>\n<h1>BIST Final State Snapshot</h1>\n<p>Veri sürümü {html.escape(fingerprint[:8])}</p>\n'
+        f'<p><a href="ranking.html">{html.escape(universe)} Karşılaştırma</a></p>\n<ul>\n{links}\n</ul>\n</body>\n</html>\n'
+    )
+    _write_atomic(os.path.join(out_dir, "index.html"), page)
+
+
+# -----------------------------
+# Export
+# -----------------------------
+def export_snapshot(parquet_path: str, out_dir: str, universe: str = "BIST100", start_date=None, end_date=None,
+                    workers: int = 0, n_boot: int = 1000, force: bool = False, load_mode: str = "duckdb",
+                    universes_path: str | None = "universes.csv") -> dict:
+    state = refresh_dataset(None, parquet_path, start_date, end_date, load_mode=load_mode)
+    if not len(state.prefix.dates):
+        raise ValueError(f"no data in {parquet_path}")
+    start_date = pd.Timestamp(start_date) if start_date else pd.Timestamp(state.prefix.dates[0])
+    end_date = pd.Timestamp(end_date) if end_date else pd.Timestamp(state.prefix.dates[-1])
+
+    universes = load_universes(universes_path)
+    universe = resolve_universes(universes, universe)[0]
+    members = universe_members(universes, universe, end_date)
+    loaded = set(state.index.offsets)
+    stocks = sorted(loaded if members is None else loaded.intersection(members))
+
+    os.makedirs(os.path.join(out_dir, "hisse"), exist_ok=True)
+    write_plotly_js(out_dir)
+    old = {} if force else load_manifest(out_dir)
+    old_tickers = old.get("tickers", {})
+
+    # Hash every ticker in the parent (cheap), render only the changed ones in the workers
+    hashes, jobs = {}, []
+    for ticker in stocks:
+        dfh = stock_slice(state.index, ticker, start_date, end_date)
+        if dfh.empty:
+            continue
+        alerts = anomaly_alerts(state.anomalies, start_date, end_date, stocks=[ticker])
+        hashes[ticker] = frame_hash(dfh, alerts, extra=ticker)
+        page = os.path.join(out_dir, "hisse", f"{ticker}.html")
+        if old_tickers.get(ticker) != hashes[ticker] or not os.path.exists(page):
+            # detail tables are slices of the dense tensor; workers only build and write the figures
+            jobs.append((out_dir, ticker, tensor_detail_data(state.tensor, ticker, start_date, end_date), alerts))
+
+    workers = workers or min(len(jobs), os.cpu_count() or 1)
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            _render_ticker_job(job)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_render_ticker_job, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+
+    for ticker in set(old_tickers) - set(hashes):
+        for ext in ("html", "json"):
+            path = os.path.join(out_dir, "hisse", f"{ticker}.{ext}")
+            if os.path.exists(path):
+                os.remove(path)
+
+    frames = ranking_frames(state, stocks, start_date, end_date, n_boot)
+    ranking_hash = frame_hash(*frames.values(), extra=f"{universe}|{start_date}|{end_date}|{n_boot}")
+    ranking_rendered = old.get("ranking") != ranking_hash or not os.path.exists(os.path.join(out_dir, "ranking.html"))
+    if ranking_rendered:
+        render_ranking(out_dir, frames, universe, start_date, end_date)
+
+    write_index(out_dir, sorted(hashes), universe, state.fingerprint)
+    manifest = {
+        "format": EXPORT_FORMAT,
+        "plotly": plotly.__version__,
+        "dataset_fingerprint": state.fingerprint,
+        "universe": universe,
+        "start_date": f"{start_date:%Y-%m-%d}",
+        "end_date": f"{end_date:%Y-%m-%d}",
+        "ranking": ranking_hash,
+        "tickers": hashes,
+    }
+    # written last: an interrupted run leaves the previous manifest, so the next run redoes its work
+    _write_atomic(os.path.join(out_dir, MANIFEST), json.dumps(manifest, indent=1, ensure_ascii=False))
+    return {"tickers": len(hashes), "rendered": [job[1] for job in jobs], "ranking_rendered": ranking_rendered}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard görünümlerini statik HTML/JSON olarak dışa aktarır")
+    parser.add_argument("parquet_path", nargs="?", default=os.getenv("PARQUET_PATH", "final_state_daily_bist100.parquet"),
+                        help="final state parquet dosyası, glob veya hive-partitioned dizin")
+    parser.add_argument("out_dir", nargs="?", default="snapshot", help="çıktı dizini")
+    parser.add_argument("--universe", default="BIST100", help="sıralama ve hisse sayfaları için evren (ALL = tümü)")
+    parser.add_argument("--universes-file", default=os.getenv("UNIVERSES_PATH", "universes.csv"),
+                        help="tarihli endeks üyelikleri (universe, islem_kodu, start_date, end_date)")
+    parser.add_argument("--start", default=None, help="YYYY-MM-DD")
+    parser.add_argument("--end", default=None, help="YYYY-MM-DD")
+    parser.add_argument("--workers", type=int, default=0, help="process sayısı (0 = CPU sayısı)")
+    parser.add_argument("--bootstrap-samples", type=int, default=int(os.getenv("BOOTSTRAP_SAMPLES", "1000")),
+                        help="sıralama güven aralığı için bootstrap örnek sayısı (0 = kapalı)")
+    parser.add_argument("--load-mode", choices=["duckdb", "arrow"], default=os.getenv("LOAD_MODE", "duckdb"))
+    parser.add_argument("--force", action="store_true", help="manifest'i yok say, her şeyi yeniden üret")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    try:
+        result = export_snapshot(args.parquet_path, args.out_dir, args.universe, args.start, args.end, args.workers,
+                                 args.bootstrap_samples, args.force, args.load_mode, args.universes_file)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"{result['tickers']} hisse, {len(result['rendered'])} yeniden üretildi, "
+          f"sıralama {'yeniden üretildi' if result['ranking_rendered'] else 'değişmedi'} "
+          f"-> {args.out_dir} ({time.perf_counter() - t0:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
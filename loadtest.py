@@ -0,0 +1,348 @@
+# loadtest.py
+# Concurrent multi-session load test for app.py, headless through Streamlit's AppTest.
+# Requirements: streamlit>=1.65 (streamlit.testing), plus everything app.py needs
+#
+# Every simulated session is an AppTest instance driven from its own thread in this process, which is
+# how one Streamlit server runs sessions: threads sharing one interpreter, GIL, cache_resource
+# registry, dataset and result cache. A session opens the app, then performs --steps interactions
+# drawn from ACTIONS (weighted, seeded per session). Each interaction is timed as one rerun.
+#
+# AppTest always reruns the whole script, including widgets inside st.fragment. A fragment-only
+# rerun on a real server is cheaper, so the fragment-scoped actions (week radio, time series,
+# similarity) give upper bounds here.
+#
+# The numbers are AppTest measurements, not a browser against a running server: there is no
+# websocket, no serialization to a client and no network. The output header and every JSON record
+# ("harness": "AppTest") say so.
+#
+# AppTest is built for one session at a time. While the test runs, _share_server_state() gives the
+# concurrent runs the process-wide state a server has, and restores Streamlit's originals afterwards:
+# - one ScriptCache: a server compiles app.py once for all sessions, AppTest compiles it again for
+#   every run, and concurrent compiles fail inside ast.parse ("AST constructor recursion depth
+#   mismatch");
+# - one Runtime: AppTest installs a mock Runtime per run and resets it to None when the run ends,
+#   under the other sessions still running ("Runtime hasn't been created!");
+# - global.appTest stays on instead of being patched and restored around each run.
+# All sessions of a level open, then start interacting together (barrier); latency / throughput are
+# measured over that phase.
+#
+# A warm-up session runs first and loads the dataset, so level 1 measures reruns rather than the
+# load. If it fails (e.g. PARQUET_PATH does not resolve) the test aborts.
+#
+# For each concurrency level the harness reports:
+# - p50 / p95 / p99 rerun latency (the session open separately);
+# - throughput in reruns/s;
+# - errors: a raised exception, an uncaught script exception, an st.error or an empty page (the
+#   script did not compile). Failed reruns are counted only here; latency and throughput use the
+#   successful ones, and a session whose open failed performs no interactions;
+# - process RSS (current and peak), RSS growth per opened session and during the interaction phase.
+# The process is the "worker": one app.py server. Results are appended as JSON lines (--out), one
+# record per level.
+#
+# Run:
+#   python loadtest.py --concurrency 1,2,4,8 --steps 10
+#   PARQUET_PATH=data/final_state_daily python loadtest.py --concurrency 1,4,16 --steps 20 --out loadtest.jsonl
+
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+
+import numpy as np
+
+from benchmark import run_info
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+
+# -----------------------------
+# Interactions
+# -----------------------------
+def _by_label(widgets, label: str):
+    for w in widgets:
+        if w.label == label:
+            return w
+    return None
+
+
+def change_metric(at, rng: random.Random) -> bool:
+    w = _by_label(at.selectbox, "Ana sayfa metriği")
+    if w is None:
+        return False
+    w.select(rng.choice([o for o in w.options if o != w.value] or w.options)).run()
+    return True
+
+
+def change_universe(at, rng: random.Random) -> bool:
+    w = _by_label(at.selectbox, "Evren")
+    if w is None or len(w.options) < 2:
+        return False
+    w.select(rng.choice([o for o in w.options if o != w.value])).run()
+    return True
+
+
+def toggle_ci(at, rng: random.Random) -> bool:
+    w = _by_label(at.toggle, "Güven aralığı (%95, gün bazlı bootstrap)")
+    if w is None:
+        return False
+    w.set_value(not w.value).run()
+    return True
+
+
+def pick_ticker(at, rng: random.Random) -> bool:
+    w = _by_label(at.selectbox, "Hisse seç")
+    if w is None:
+        return False
+    w.select(rng.choice(w.options)).run()
+    return True
+
+
+def switch_week(at, rng: random.Random) -> bool:
+    w = _by_label(at.radio, "Hafta seç") or _by_label(at.select_slider, "Hafta seç")
+    if w is None or len(w.options) < 2:
+        return False
+    w.set_value(rng.choice([o for o in w.options if o != w.value])).run()
+    return True
+
+
+def pick_series(at, rng: random.Random) -> bool:
+    w = at.multiselect(key="ts_tickers")
+    w.set_value(rng.sample(list(w.options), k=min(len(w.options), rng.randint(1, 4)))).run()
+    return True
+
+
+def change_bucket(at, rng: random.Random) -> bool:
+    w = at.radio(key="ts_bucket")
+    w.set_value(rng.choice([o for o in w.options if o != w.value])).run()
+    return True
+
+
+# name -> (action, weight): mostly ranking / detail browsing, occasionally the slower views
+ACTIONS = {
+    "metric": (change_metric, 4),
+    "ticker": (pick_ticker, 4),
+    "week": (switch_week, 3),
+    "universe": (change_universe, 1),
+    "ci": (toggle_ci, 1),
+    "series": (pick_series, 2),
+    "bucket": (change_bucket, 1),
+}
+
+
+# -----------------------------
+# Sessions
+# -----------------------------
+def _rss_mib() -> float:
+    # current resident set size (Linux), falling back to the peak
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@contextmanager
+def _share_server_state():
+    # Patches AppTest's per-run state into process-wide state for the duration of the block and
+    # restores the originals on exit, so importing or calling into this module leaves Streamlit as it was
+    from streamlit import config
+    from streamlit.runtime.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import local_script_runner
+
+    orig_instance = Runtime.__dict__["instance"]
+    orig_exists = Runtime.__dict__["exists"]
+    orig_script_cache = local_script_runner.ScriptCache
+    orig_app_test = config.get_option("global.appTest")
+
+    # every AppTest run gets this one (thread-safe) ScriptCache instead of a fresh one
+    script_cache = ScriptCache()
+    local_script_runner.ScriptCache = lambda: script_cache
+
+    # the last installed mock Runtime stays available after a run resets Runtime._instance
+    last = []
+
+    def instance(cls):
+        if cls._instance is not None:
+            last[:] = [cls._instance]
+            return cls._instance
+        if last:
+            return last[0]
+        raise RuntimeError("Runtime hasn't been created!")
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or bool(last))
+    config.set_option("global.appTest", True)
+    try:
+        yield
+    finally:
+        Runtime.instance = orig_instance
+        Runtime.exists = orig_exists
+        local_script_runner.ScriptCache = orig_script_cache
+        config.set_option("global.appTest", orig_app_test)
+
+
+def _page_error(at) -> str | None:
+    # An uncaught exception in the script, an st.error (e.g. the dataset failed to load) or nothing
+    # rendered at all (a compile error stops the run before the first element)
+    if at.exception:
+        return str(at.exception[0].value)
+    if at.error:
+        return str(at.error[0].value)
+    if not at.main.children:
+        return "boş sayfa (script çalışmadı)"
+    return None
+
+
+def run_session(seed: int, steps: int, timeout: float, results: list, lock: threading.Lock,
+                barrier: threading.Barrier | None = None) -> None:
+    # Appends (action, seconds, error message or None) records to results
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed)
+    names = list(ACTIONS)
+    weights = [ACTIONS[n][1] for n in names]
+    records = []
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    t0 = time.perf_counter()
+    try:
+        at.run()
+        error = _page_error(at)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    records.append(("open", time.perf_counter() - t0, error))
+    if error:
+        steps = 0
+    if barrier is not None:
+        barrier.wait()
+    for _ in range(steps):
+        name = rng.choices(names, weights)[0]
+        t0 = time.perf_counter()
+        try:
+            done = ACTIONS[name][0](at, rng)
+            error = _page_error(at)
+        except Exception as e:
+            done, error = True, f"{type(e).__name__}: {e}"
+        if done:
+            records.append((name, time.perf_counter() - t0, error))
+    with lock:
+        results.extend(records)
+
+
+def run_level(concurrency: int, steps: int, seed: int, timeout: float) -> dict:
+    results: list = []
+    lock = threading.Lock()
+    rss_before = _rss_mib()
+    started = []
+    barrier = threading.Barrier(concurrency, action=lambda: started.append((time.perf_counter(), _rss_mib())))
+    threads = [threading.Thread(target=run_session, args=(seed * 100_003 + i, steps, timeout, results, lock, barrier),
+                                name=f"session-{i}") for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    t0, rss_open = started[0]
+    wall = time.perf_counter() - t0
+    rss_after = _rss_mib()
+
+    ok = [(name, s) for name, s, error in results if not error]
+    reruns = np.array([s for name, s in ok if name != "open"])
+    opens = np.array([s for name, s in ok if name == "open"])
+    errors = [(name, error) for name, _, error in results if error]
+
+    def pct(x, q):
+        return float(np.percentile(x, q)) * 1000 if len(x) else None
+
+    by_action = {}
+    for name in sorted({n for n, _, _ in results}):
+        xs = [s for n, s in ok if n == name]
+        by_action[name] = {"n": len(xs), "errors": sum(1 for n, _ in errors if n == name),
+                           "p50_ms": statistics.median(xs) * 1000 if xs else None}
+    return {
+        "concurrency": concurrency,
+        "sessions": concurrency,
+        "steps": steps,
+        "reruns": int(len(reruns)),
+        "errors": len(errors),
+        "failed_opens": sum(1 for name, _ in errors if name == "open"),
+        "error_samples": sorted({f"{name}: {error}" for name, error in errors})[:5],
+        "wall_s": wall,
+        "throughput_rps": len(reruns) / wall if wall and len(reruns) else None,
+        "open_p50_ms": pct(opens, 50),
+        "p50_ms": pct(reruns, 50),
+        "p95_ms": pct(reruns, 95),
+        "p99_ms": pct(reruns, 99),
+        "max_ms": float(reruns.max()) * 1000 if len(reruns) else None,
+        "rss_mib": rss_after,
+        "rss_peak_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "rss_per_session_mib": (rss_open - rss_before) / concurrency,
+        "rss_interaction_mib": rss_after - rss_open,
+        "actions": by_action,
+    }
+
+
+def _cell(value, width: int, fmt: str) -> str:
+    # "-" when nothing succeeded at this level
+    return f"{value:>{width}{fmt}}" if value is not None else f"{'-':>{width}}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="app.py için eşzamanlı çok oturumlu yük testi (AppTest)")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="virgülle ayrılmış eşzamanlı oturum sayıları")
+    parser.add_argument("--steps", type=int, default=10, help="oturum başına etkileşim (rerun) sayısı")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=300, help="rerun başına zaman aşımı (sn)")
+    parser.add_argument("--parquet", default=None, help="PARQUET_PATH (varsayılan: ortam değişkeni / app.py)")
+    parser.add_argument("--out", default="loadtest.jsonl", help="sonuç dosyası (JSON lines, sona eklenir)")
+    args = parser.parse_args()
+
+    if args.parquet:
+        os.environ["PARQUET_PATH"] = args.parquet
+    # AppTest sessions have no browser: silence the missing-context / deprecation noise. The config option
+    # too, so loggers Streamlit creates later pick it up.
+    import streamlit.logger
+    from streamlit import config
+
+    config.set_option("logger.level", "error")
+    streamlit.logger.set_log_level("ERROR")
+    warnings.filterwarnings("ignore")
+    with _share_server_state():
+        info = run_info()
+        # warm-up session: loads the dataset into the shared registry so level 1 measures reruns, not the load
+        t0 = time.perf_counter()
+        warmup: list = []
+        run_session(args.seed - 1, 0, args.timeout, warmup, threading.Lock())
+        error = warmup[0][2]
+        if error:
+            raise SystemExit(f"ısınma oturumu başarısız, yük testi durduruldu: {error}")
+        print(f"ısınma (veri yükleme dahil): {time.perf_counter() - t0:.2f}s, RSS {_rss_mib():.0f} MiB")
+
+        levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+        print("AppTest ölçümü: oturumlar bu süreçte thread olarak çalışır, tarayıcı / websocket yok; "
+              "fragment eylemleri tam rerun olduğu için üst sınırdır")
+        print(f"{'oturum':>6} {'rerun':>6} {'hata':>5} {'rerun/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+              f"{'RSS MiB':>8} {'MiB/oturum':>10}")
+        with open(args.out, "a", encoding="utf-8") as f:
+            for c in levels:
+                r = run_level(c, args.steps, args.seed, args.timeout)
+                f.write(json.dumps({**info, "harness": "AppTest", **r}) + "\n")
+                f.flush()
+                print(f"{c:>6} {r['reruns']:>6} {r['errors']:>5} {_cell(r['throughput_rps'], 8, '.2f')} "
+                      f"{_cell(r['p50_ms'], 9, '.0f')} {_cell(r['p95_ms'], 9, '.0f')} {_cell(r['p99_ms'], 9, '.0f')} "
+                      f"{r['rss_mib']:>8.0f} {r['rss_per_session_mib']:>10.1f}")
+                for sample in r["error_samples"]:
+                    print(f"       hata: {sample}")
+        print(f"{len(levels)} seviye -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
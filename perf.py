@@ -0,0 +1,186 @@
+# perf.py
+# Lightweight span/timer instrumentation for the dashboard hot paths (no Streamlit dependency).
+# Requirements: none (standard library only)
+#
+# Enabled with PERF_TRACE=1 (like SHOW_TABLE). When disabled, timed() returns the function
+# unchanged and span() is a no-op, so production reruns pay nothing.
+#
+# A run is one script rerun (or one fragment rerun). Spans opened inside a run are recorded with
+# their nesting depth. When the outermost run ends, it is appended as one JSON line to PERF_LOG.
+# If PERF_PROM is set, cumulative per-span and per-cache counters are rewritten there in
+# Prometheus text format (node_exporter textfile collector style).
+#
+# Config:
+#   export PERF_TRACE=1                    enable instrumentation + the debug panel in app.py
+#   export PERF_LOG=perf_timings.jsonl     JSON lines, one record per run
+#   export PERF_PROM=perf_metrics.prom     optional Prometheus textfile
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+ENABLED = os.getenv("PERF_TRACE", "0") == "1"
+PERF_LOG = os.getenv("PERF_LOG", "perf_timings.jsonl")
+PERF_PROM = os.getenv("PERF_PROM") or None
+
+_local = threading.local()
+_lock = threading.Lock()
+# Process-wide totals (Prometheus counters): span -> [count, seconds], cache -> [hits, misses]
+_span_totals: dict[str, list] = defaultdict(lambda: [0, 0.0])
+_cache_totals: dict[str, list] = defaultdict(lambda: [0, 0])
+
+
+# -----------------------------
+# Runs and spans
+# -----------------------------
+def start_run(name: str) -> dict | None:
+    # Starts a run on this thread; a run left open by an interrupted rerun (st.stop / rerun) is dropped
+    if not ENABLED:
+        return None
+    run = {"run": name, "ts": time.time(), "spans": [], "cache": {}, "_t0": time.perf_counter(), "_depth": 0}
+    _local.run = run
+    return run
+
+
+def finish_run() -> dict | None:
+    # Ends the run on this thread and exports it; returns the record (without private fields)
+    run = getattr(_local, "run", None)
+    if run is None:
+        return None
+    _local.run = None
+    run["total_ms"] = (time.perf_counter() - run.pop("_t0")) * 1000
+    run.pop("_depth")
+    _export(run)
+    return run
+
+
+@contextmanager
+def run(name: str):
+    # A fragment body: its own run when the fragment reruns alone, a span inside a full rerun
+    if not ENABLED:
+        yield None
+        return
+    if getattr(_local, "run", None) is not None:
+        with span(name):
+            yield _local.run
+        return
+    record = start_run(name)
+    try:
+        yield record
+    finally:
+        finish_run()
+
+
+@contextmanager
+def span(name: str):
+    if not ENABLED:
+        yield
+        return
+    run = getattr(_local, "run", None)
+    record = None
+    if run is not None:
+        # appended on entry so spans are listed in start order (parents before children)
+        record = {"name": name, "depth": run["_depth"], "ms": None}
+        run["spans"].append(record)
+        run["_depth"] += 1
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        secs = time.perf_counter() - t0
+        if record is not None:
+            run["_depth"] -= 1
+            record["ms"] = secs * 1000
+        with _lock:
+            totals = _span_totals[name]
+            totals[0] += 1
+            totals[1] += secs
+
+
+def timed(name: str | None = None):
+    # Decorator; a no-op when instrumentation is off
+    def wrap(fn):
+        if not ENABLED:
+            return fn
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with span(label):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+# -----------------------------
+# Cache hit / miss
+# -----------------------------
+@contextmanager
+def cache_lookup(name: str):
+    # Wraps a call to a cached function; the cached body calls cache_miss() when it actually runs,
+    # so anything else is a hit. The span also captures (de)serialization time of the cache layer.
+    if not ENABLED:
+        yield
+        return
+    _local.miss = False
+    with span(f"cache.{name}"):
+        yield
+    miss = getattr(_local, "miss", False)
+    _local.miss = False
+    run = getattr(_local, "run", None)
+    if run is not None:
+        hits, misses = run["cache"].get(name, (0, 0))
+        run["cache"][name] = (hits + (not miss), misses + miss)
+    with _lock:
+        _cache_totals[name][0 if not miss else 1] += 1
+
+
+def cache_miss() -> None:
+    if ENABLED:
+        _local.miss = True
+
+
+def cache_totals() -> dict[str, tuple[int, int]]:
+    with _lock:
+        return {k: (v[0], v[1]) for k, v in _cache_totals.items()}
+
+
+# -----------------------------
+# Export
+# -----------------------------
+def prometheus_text() -> str:
+    lines = [
+        "# HELP bist_span_seconds_total Total time spent in an instrumented stage.",
+        "# TYPE bist_span_seconds_total counter",
+    ]
+    with _lock:
+        spans = {k: tuple(v) for k, v in _span_totals.items()}
+        caches = {k: tuple(v) for k, v in _cache_totals.items()}
+    lines += [f'bist_span_seconds_total{{span="{k}"}} {v[1]:.6f}' for k, v in sorted(spans.items())]
+    lines += ["# HELP bist_span_calls_total Number of times an instrumented stage ran.",
+              "# TYPE bist_span_calls_total counter"]
+    lines += [f'bist_span_calls_total{{span="{k}"}} {v[0]}' for k, v in sorted(spans.items())]
+    lines += ["# HELP bist_cache_requests_total Cache lookups by result.",
+              "# TYPE bist_cache_requests_total counter"]
+    for k, (hits, misses) in sorted(caches.items()):
+        lines.append(f'bist_cache_requests_total{{cache="{k}",result="hit"}} {hits}')
+        lines.append(f'bist_cache_requests_total{{cache="{k}",result="miss"}} {misses}')
+    return "\n".join(lines) + "\n"
+
+
+def _export(run: dict) -> None:
+    line = json.dumps({**run, "cache": {k: {"hit": h, "miss": m} for k, (h, m) in run["cache"].items()}})
+    with _lock:
+        if PERF_LOG:
+            with open(PERF_LOG, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    if PERF_PROM:
+        # write + rename so a scraper never reads a half-written file
+        tmp = f"{PERF_PROM}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(prometheus_text())
+        os.replace(tmp, PERF_PROM)
@@ -0,0 +1,73 @@
+# repartition_parquet.py
+# Rewrites a flat final-state parquet (e.g. final_state_daily_bist100.parquet) as a hive-partitioned
+# dataset that app.py can read with PARQUET_PATH=<out_dir>.
+# Requirements: duckdb
+#
+# Layout (default --by year,month):
+#   <out_dir>/year=2025/month=11/data_0.parquet
+# With --by year,month,islem_kodu every ticker gets its own directory as well.
+#
+# Rows are sorted by (islem_kodu, tarih) inside each partition so the parquet row-group statistics
+# let the loader skip row groups for ticker / date filters.
+#
+# Run:
+#   python repartition_parquet.py final_state_daily_bist100.parquet data/final_state_daily
+#   python repartition_parquet.py "exports/*.parquet" data/final_state_daily --by year,month,islem_kodu
+
+import argparse
+import os
+import duckdb
+
+PARTITION_EXPR = {
+    "year": "CAST(year(tarih) AS INTEGER) AS year",
+    "month": "CAST(month(tarih) AS INTEGER) AS month",
+    "islem_kodu": None,  # already a column
+}
+
+
+def repartition(src: str, out_dir: str, by: list[str], row_group_size: int = 122_880, overwrite: bool = False) -> int:
+    unknown = [c for c in by if c not in PARTITION_EXPR]
+    if unknown:
+        raise ValueError(f"Desteklenmeyen partition kolonu: {unknown} (seçenekler: {list(PARTITION_EXPR)})")
+    if os.path.exists(out_dir) and os.listdir(out_dir) and not overwrite:
+        raise FileExistsError(f"{out_dir} boş değil (üzerine yazmak için --overwrite)")
+
+    extra = [PARTITION_EXPR[c] for c in by if PARTITION_EXPR[c]]
+    select_sql = ", ".join(["tarih", "islem_kodu", "final_state", "emir_sayisi", "yuzde"] + extra)
+
+    # DuckDB creates out_dir itself but not its missing parents (e.g. data/ on a fresh checkout)
+    os.makedirs(os.path.dirname(os.path.abspath(out_dir)), exist_ok=True)
+    con = duckdb.connect(database=":memory:")
+    n_rows = con.execute(f"SELECT COUNT(*) FROM read_parquet('{src}')").fetchone()[0]
+    con.execute(f"""
+        COPY (
+            SELECT {select_sql}
+            FROM read_parquet('{src}')
+            ORDER BY islem_kodu, tarih, final_state
+        ) TO '{out_dir}' (
+            FORMAT PARQUET,
+            PARTITION_BY ({", ".join(by)}),
+            ROW_GROUP_SIZE {int(row_group_size)},
+            OVERWRITE_OR_IGNORE {"true" if overwrite else "false"}
+        )
+    """)
+    con.close()
+    return n_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Düz final-state parquet dosyasını hive-partitioned dizine yeniden yazar")
+    parser.add_argument("src", help="kaynak parquet dosyası veya glob")
+    parser.add_argument("out_dir", help="hedef dizin")
+    parser.add_argument("--by", default="year,month", help="partition kolonları (year, month, islem_kodu)")
+    parser.add_argument("--row-group-size", type=int, default=122_880)
+    parser.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args()
+
+    by = [c.strip() for c in args.by.split(",") if c.strip()]
+    n_rows = repartition(args.src, args.out_dir, by, args.row_group_size, args.overwrite)
+    print(f"{n_rows:,} satır -> {args.out_dir} (partition: {'/'.join(by)})")
+
+
+if __name__ == "__main__":
+    main()
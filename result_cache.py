@@ -0,0 +1,181 @@
+# result_cache.py
+# Process-wide result cache for computed views (rankings, stock detail aggregates). No Streamlit dependency.
+# Requirements: pandas, numpy
+#
+# Keys are tuples that start with the dataset fingerprint, e.g.
+#   (fingerprint, "ranking", metric_key, start, end, universe, engine)
+#   (fingerprint, "detail", ticker, start, end)
+# so a new dataset version never serves stale results.
+#
+# Memory tier: LRU over an OrderedDict, bounded by the estimated size of the stored values (and
+# optionally an entry count). Hits return the stored object itself, not a copy like st.cache_data's
+# pickle round trip, so callers must treat cached values as read-only.
+# Disk tier (optional): one pickle per key in disk_dir, written atomically. A restarted server reads
+# it back on the first miss. It is bounded by total size, and the least recently used files go first.
+
+import hashlib
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+_MISSING = object()
+
+
+def value_nbytes(value) -> int:
+    # Estimated memory held by a cached value (DataFrames/Series/arrays, tuples of them, scalars)
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(value_nbytes(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(value_nbytes(k) + value_nbytes(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+def key_digest(key: tuple) -> str:
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_bytes: int = 256 * 2**20, max_entries: int | None = None,
+                 disk_dir: str | None = None, disk_max_bytes: int = 1024 * 2**20):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()      # key -> (value, nbytes)
+        self._key_locks: dict = {}                      # key -> Lock, so one session computes a miss
+        self.nbytes = 0
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    # -----------------------------
+    # Memory tier
+    # -----------------------------
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes: int | None = None) -> None:
+        nbytes = value_nbytes(value) if nbytes is None else nbytes
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            self._entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+            while self._entries and (self.nbytes > self.max_bytes
+                                     or (self.max_entries is not None and len(self._entries) > self.max_entries)):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+                self.stats["evictions"] += 1
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                # another session may have filled it while we waited
+                value = self.get(key, _MISSING)
+                if value is not _MISSING:
+                    return value
+                value = self._disk_get(key)
+                if value is not _MISSING:
+                    with self._lock:
+                        self.stats["disk_hits"] += 1
+                else:
+                    with self._lock:
+                        self.stats["misses"] += 1
+                    value = compute()
+                    self._disk_put(key, value)
+                self.put(key, value)
+                return value
+        finally:
+            # also when compute() raised; only our own lock, a later caller may have installed a new one
+            with self._lock:
+                if self._key_locks.get(key) is key_lock:
+                    del self._key_locks[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def info(self) -> dict:
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries), "nbytes": self.nbytes, "max_bytes": self.max_bytes}
+
+    # -----------------------------
+    # Disk tier
+    # -----------------------------
+    def _disk_path(self, key) -> str:
+        return os.path.join(self.disk_dir, f"{key_digest(key)}.pkl")
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return _MISSING
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                stored_key, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return _MISSING
+        if stored_key != key:
+            return _MISSING
+        os.utime(path)  # mtime doubles as last-use time for disk eviction
+        return value
+
+    def _disk_put(self, key, value) -> None:
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump((key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except (OSError, pickle.PicklingError):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        self._disk_evict()
+
+    def _disk_evict(self) -> None:
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".pkl"):
+                try:
+                    st = os.stat(os.path.join(self.disk_dir, name))
+                except OSError:
+                    continue
+                files.append((st.st_mtime_ns, st.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.disk_dir, name))
+            except OSError:
+                pass
+            total -= size
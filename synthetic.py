@@ -0,0 +1,128 @@
+# synthetic.py
+# Deterministic synthetic final-state data and the engine equivalence checks. Shared by benchmark.py
+# (timings, --check) and the tests; no CLI of its own.
+# Requirements: pandas, numpy, duckdb, pyarrow, plotly (charts.py detail tables)
+#
+# generate_daily_states returns an Arrow table with the schema of final_state_daily_bist100.parquet
+# (tarih, islem_kodu, final_state, emir_sayisi, yuzde); the same (tickers, days, start, seed) always
+# gives the same table. The checks raise AssertionError with the metric / ticker that differs.
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from bist_metrics import (
+    BIST100,
+    METRICS,
+    build_daily_tensor,
+    build_prefix_index,
+    build_stock_index,
+    compute_bist100_metric,
+    range_ranking,
+    stock_slice,
+)
+from charts import detail_data, tensor_detail_data
+
+
+# -----------------------------
+# Generator
+# -----------------------------
+# Final states with their average share in the bundled data; rare states are often absent on a day
+SYNTH_STATES = ["Trade", "CanceledByUser", "Expired", "New", "CanceledBySystem",
+                "ConvertedBySystem", "CanceledAfterAuction", "ReplacedByUser", "Inactivate"]
+SYNTH_SHARES = [0.45, 0.30, 0.12, 0.06, 0.05, 0.008, 0.008, 0.003, 0.001]
+
+
+def synthetic_tickers(n_tickers: int) -> list[str]:
+    # Real BIST100 codes first (so the app's BIST100 filter keeps them), then SYNnnn.E
+    real = BIST100[:n_tickers]
+    return real + [f"SYN{i:04d}.E" for i in range(n_tickers - len(real))]
+
+
+def generate_daily_states(n_tickers: int = 100, n_days: int = 20, start: str = "2025-11-03", seed: int = 0) -> pa.Table:
+    # Per ticker: a lognormal activity level and a Dirichlet state mix around SYNTH_SHARES; per day:
+    # a noisy total and a multinomial split of it. Zero-count states are dropped like in the real data.
+    rng = np.random.default_rng(seed)
+    days = np.arange(np.datetime64(start, "D"), np.datetime64(start, "D") + n_days * 2)
+    days = days[np.is_busday(days)][:n_days]
+    tickers = np.array(synthetic_tickers(n_tickers))
+    n_states = len(SYNTH_STATES)
+
+    activity = rng.lognormal(np.log(36_000), 0.7, n_tickers)
+    mix = rng.dirichlet(np.array(SYNTH_SHARES) * 200, size=n_tickers)            # (T, S)
+
+    totals = np.maximum(1, (activity[None, :] * rng.lognormal(0.0, 0.25, (len(days), n_tickers)))).astype(np.int64)
+    day_mix = mix[None, :, :] * rng.lognormal(0.0, 0.15, (len(days), n_tickers, n_states))
+    day_mix /= day_mix.sum(axis=2, keepdims=True)
+    counts = rng.multinomial(totals, day_mix)                                    # (D, T, S)
+
+    d_idx, t_idx, s_idx = np.nonzero(counts)
+    cnt = counts[d_idx, t_idx, s_idx]
+    return pa.table({
+        "tarih": pa.array(days[d_idx]),
+        "islem_kodu": pa.array(tickers[t_idx]),
+        "final_state": pa.array(np.array(SYNTH_STATES)[s_idx]),
+        "emir_sayisi": pa.array(cnt.astype(np.int64)),
+        "yuzde": pa.array(cnt / totals[d_idx, t_idx] * 100.0),
+    })
+
+
+# -----------------------------
+# Equivalence checks
+# -----------------------------
+def check_equivalence(frame: pd.DataFrame, rtol: float = 1e-6, start_date=None, end_date=None,
+                      atol: float = 1e-6) -> None:
+    # The three ranking engines must return the same tickers and values for every metric, each sorted
+    # best first. rtol covers yuzde being read as FLOAT (float32): engines sum it in different orders.
+    # atol (percentage points) covers EQS near 0, where that rounding cancels into a large relative error.
+    # The range defaults to the whole frame.
+    stocks = sorted(str(c) for c in frame["islem_kodu"].cat.categories)
+    start = frame["tarih"].min() if start_date is None else pd.Timestamp(start_date)
+    end = frame["tarih"].max() if end_date is None else pd.Timestamp(end_date)
+    prefix = build_prefix_index(frame)
+    for metric_key, meta in METRICS.items():
+        ref, _ = compute_bist100_metric(frame, stocks, start, end, metric_key, engine="pandas")
+        ref = ref.set_index(ref["islem_kodu"].astype(str))
+        others = {
+            "duckdb": compute_bist100_metric(frame, stocks, start, end, metric_key, engine="duckdb")[0],
+            "prefix": range_ranking(prefix, stocks, start, end, metric_key)[0],
+        }
+        for engine, out in others.items():
+            step = np.diff(out["metric_wavg"].to_numpy(float))
+            if np.any(step * (-1 if meta["better_high"] else 1) < -1e-9):
+                raise AssertionError(f"{metric_key} [{engine}]: not sorted best first")
+            out = out.set_index(out["islem_kodu"].astype(str))
+            if set(out.index) != set(ref.index):
+                raise AssertionError(f"{metric_key} [{engine}]: tickers differ from pandas")
+            out = out.reindex(ref.index)
+            for col in ("metric_wavg", "total_emir_period"):
+                np.testing.assert_allclose(out[col].to_numpy(float), ref[col].to_numpy(float), rtol=rtol,
+                                           atol=atol, err_msg=f"{metric_key} [{engine}] {col}")
+
+
+def check_detail_equivalence(frame: pd.DataFrame, rtol: float = 1e-6, max_tickers: int = 50,
+                             start_date=None, end_date=None) -> None:
+    # tensor_detail_data must reproduce detail_data (pandas pivot/groupby) for the stock detail view:
+    # same state order, weeks and day index, same values in every table. A ticker without rows in the
+    # range has no detail (None) on the tensor path.
+    index = build_stock_index(frame)
+    tensor = build_daily_tensor(frame)
+    start = frame["tarih"].min() if start_date is None else pd.Timestamp(start_date)
+    end = frame["tarih"].max() if end_date is None else pd.Timestamp(end_date)
+    for ticker in sorted(index.offsets)[:max_tickers]:
+        rows = stock_slice(index, ticker, start, end)
+        out = tensor_detail_data(tensor, ticker, start, end)
+        if rows.empty:
+            if out is not None:
+                raise AssertionError(f"{ticker}: detail for a range without rows")
+            continue
+        ref = detail_data(rows)
+        if (out.state_order, out.weeks, out.n_days) != (ref.state_order, ref.weeks, ref.n_days):
+            raise AssertionError(f"{ticker}: state order / weeks / day count differ")
+        if any(out.week_starts[w] != ref.week_starts[w] for w in ref.weeks):
+            raise AssertionError(f"{ticker}: week starts differ")
+        for name in ("month_pct", "month_cnt_daily_avg", "weekly_pct", "weekly_cnt", "daily_pct", "daily_cnt"):
+            a, b = getattr(out, name), getattr(ref, name)
+            if list(a.index) != list(b.index):
+                raise AssertionError(f"{ticker} {name}: index differs")
+            np.testing.assert_allclose(a.to_numpy(float), b.to_numpy(float), rtol=rtol, err_msg=f"{ticker} {name}")
@@ -0,0 +1,9 @@
+# tests/conftest.py
+# The modules are flat scripts in the repository root: make them importable from the tests.
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
@@ -0,0 +1,57 @@
+# tests/test_api_server.py
+# api_server over a real socket: unexpected errors become a 500 JSON response, not a dropped connection.
+
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from api_server import PooledHTTPServer, QueryApi
+from bist_metrics import load_universes
+from conftest import ROOT
+from dataset_watcher import DatasetWatcher
+from result_cache import ResultCache
+
+
+@pytest.fixture
+def server():
+    watcher = DatasetWatcher(f"{ROOT}/final_state_daily_bist100.parquet", poll_seconds=0)
+    api = QueryApi(watcher, ResultCache(), load_universes(f"{ROOT}/universes.csv"))
+    srv = PooledHTTPServer(("127.0.0.1", 0), api, workers=2, quiet=True)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def _get(srv, path):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{srv.server_port}{path}", timeout=30) as r:
+            return r.status, r.headers, r.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def test_unexpected_error_is_a_500_json_response(server, capsys):
+    def broken(active, params):
+        raise RuntimeError("IO Error: parquet file vanished")
+
+    server.api.ranking = broken
+    status, headers, body = _get(server, "/ranking")
+    assert status == 500
+    assert headers["Content-Type"].startswith("application/json")
+    assert json.loads(body) == {"error": "internal error: RuntimeError: IO Error: parquet file vanished"}
+    assert "parquet file vanished" in capsys.readouterr().err
+
+    # the worker survives and keeps answering
+    status, _, body = _get(server, "/health")
+    assert status == 200 and b"dataset_fingerprint" in body
+
+
+def test_api_error_keeps_its_status(server):
+    status, _, body = _get(server, "/ranking?metric=yok")
+    assert status == 400
+    assert "unknown metric" in json.loads(body)["error"]
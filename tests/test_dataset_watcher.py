@@ -0,0 +1,54 @@
+# tests/test_dataset_watcher.py
+# DatasetWatcher.refresh as app.get_dataset calls it inline (DATA_POLL_SECONDS=0): a broken first load
+# raises, a broken reload keeps the active version and reports last_error.
+
+import shutil
+
+import pytest
+
+from conftest import ROOT
+from dataset_watcher import DatasetWatcher
+
+SRC = f"{ROOT}/final_state_daily_bist100.parquet"
+
+
+def test_failed_reload_keeps_serving(tmp_path):
+    path = tmp_path / "data.parquet"
+    shutil.copy(SRC, path)
+    watcher = DatasetWatcher(str(path), poll_seconds=0)
+    watcher.refresh()
+    active = watcher.active
+    assert active.version == 1
+
+    path.write_bytes(b"not a parquet file")
+    assert watcher.refresh() is False
+    assert watcher.active is active
+    assert watcher.last_error
+
+    shutil.copy(SRC, path)
+    watcher.refresh()
+    assert watcher.last_error is None
+
+
+def test_failed_first_load_raises(tmp_path):
+    path = tmp_path / "data.parquet"
+    path.write_bytes(b"not a parquet file")
+    with pytest.raises(Exception):
+        DatasetWatcher(str(path), poll_seconds=0).refresh()
+
+
+def test_app_inline_refresh_keeps_serving(tmp_path, monkeypatch):
+    from streamlit.testing.v1 import AppTest
+
+    path = tmp_path / "data.parquet"
+    shutil.copy(SRC, path)
+    monkeypatch.setenv("PARQUET_PATH", str(path))
+    monkeypatch.setenv("DATA_POLL_SECONDS", "0")
+    at = AppTest.from_file(f"{ROOT}/app.py", default_timeout=120)
+    at.run()
+    assert not at.exception and not at.error
+
+    path.write_bytes(b"not a parquet file")
+    at.run()
+    assert not at.exception and not at.error
+    assert any("kullanılmaya devam ediyor" in w.value for w in at.sidebar.warning)
@@ -0,0 +1,61 @@
+# tests/test_load.py
+# Count coercion of the parquet loaders: counts that do not fit int32 are kept, not zeroed or wrapped.
+
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from bist_metrics import load_all_daily_states
+
+
+def _write(path, counts):
+    n = len(counts)
+    pq.write_table(pa.table({
+        "tarih": pa.array(pd.to_datetime(["2025-11-03"] * n).date),
+        "islem_kodu": pa.array(["AKBNK.E"] * n),
+        "final_state": pa.array(["Trade", "CanceledByUser", "Expired"][:n]),
+        "emir_sayisi": pa.array(counts, pa.int64()),
+        "yuzde": pa.array([100.0 / n] * n),
+    }), path)
+
+
+@pytest.mark.parametrize("mode", ["duckdb", "arrow"])
+def test_large_counts_are_kept(tmp_path, mode):
+    path = tmp_path / "big.parquet"
+    _write(path, [3_000_000_000, 12, 5])
+    df = load_all_daily_states(str(path), mode=mode)
+    assert df["emir_sayisi"].dtype == np.int64
+    assert sorted(df["emir_sayisi"].tolist()) == [5, 12, 3_000_000_000]
+
+
+@pytest.mark.parametrize("mode", ["duckdb", "arrow"])
+def test_small_counts_are_int32(tmp_path, mode):
+    path = tmp_path / "small.parquet"
+    _write(path, [2**31 - 1, 12, 5])
+    df = load_all_daily_states(str(path), mode=mode)
+    assert df["emir_sayisi"].dtype == np.int32
+    assert sorted(df["emir_sayisi"].tolist()) == [5, 12, 2**31 - 1]
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/maps"), reason="needs /proc/self/maps")
+def test_arrow_cache_shares_numeric_columns(tmp_path):
+    # the numeric columns of a cached load point into the memory-mapped .arrow file
+    from bist_metrics import load_daily_states_arrow
+    from conftest import ROOT
+
+    src = f"{ROOT}/final_state_daily_bist100.parquet"
+    df = load_daily_states_arrow(src, cache_dir=str(tmp_path))
+    cached = load_daily_states_arrow(src, cache_dir=str(tmp_path))
+    pd.testing.assert_frame_equal(df, cached)
+
+    with open("/proc/self/maps", encoding="utf-8") as f:
+        mapped = [tuple(int(x, 16) for x in line.split()[0].split("-")) for line in f
+                  if line.rstrip().endswith(".arrow") and str(tmp_path) in line]
+    assert mapped
+    for col in ("tarih", "emir_sayisi", "yuzde"):
+        address = cached[col].to_numpy().ctypes.data
+        assert any(lo <= address < hi for lo, hi in mapped), col
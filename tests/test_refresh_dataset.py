@@ -0,0 +1,98 @@
+# tests/test_refresh_dataset.py
+# refresh_dataset on an appended partition: the incremental path (later days) and the fallback
+# (backfilled days) must both end up equal to loading the whole dataset from scratch.
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import bist_metrics
+from bist_metrics import refresh_dataset
+from synthetic import generate_daily_states
+
+
+@pytest.fixture
+def parts(tmp_path):
+    # 16 tickers x 20 days split by day into three files; the last ticker only exists from day 12 on
+    table = generate_daily_states(n_tickers=16, n_days=20, seed=3)
+    days = np.unique(table["tarih"].to_numpy())
+    late = sorted(set(table["islem_kodu"].to_pylist()))[-1]
+    tarih = table["tarih"].to_numpy()
+    islem = np.array(table["islem_kodu"].to_pylist())
+
+    def part(mask):
+        return table.filter(pa.array(mask))
+
+    return tmp_path / "data", {
+        "early": part((tarih >= days[4]) & (tarih < days[12]) & (islem != late)),
+        "backfill": part(tarih < days[4]),
+        "later": part(tarih >= days[12]),
+    }
+
+
+def _write(root, name, table):
+    root.mkdir(exist_ok=True)
+    pq.write_table(table, root / f"{name}.parquet")
+
+
+def assert_same_dataset(a, b):
+    sort = ["islem_kodu", "tarih", "final_state"]
+    fa = a.index.frame.sort_values(sort, kind="stable").reset_index(drop=True)
+    fb = b.index.frame.sort_values(sort, kind="stable").reset_index(drop=True)
+    pd.testing.assert_frame_equal(fa, fb)
+    assert a.index.offsets == b.index.offsets
+    np.testing.assert_array_equal(a.index.tarih, b.index.tarih)
+
+    assert (a.tensor.tickers, a.tensor.states) == (b.tensor.tickers, b.tensor.states)
+    for name in ("dates", "counts", "pct", "rows"):
+        x, y = getattr(a.tensor, name), getattr(b.tensor, name)
+        assert x.dtype == y.dtype, name
+        np.testing.assert_array_equal(x, y, err_msg=name)
+
+    for name in ("dates", "cum_counts", "cum_total", "cum_days"):
+        np.testing.assert_array_equal(getattr(a.prefix, name), getattr(b.prefix, name), err_msg=name)
+    assert a.prefix.cum_weighted.keys() == b.prefix.cum_weighted.keys()
+    for key in a.prefix.cum_weighted:
+        np.testing.assert_array_equal(a.prefix.cum_weighted[key], b.prefix.cum_weighted[key], err_msg=key)
+
+    np.testing.assert_allclose(a.anomalies.mean, b.anomalies.mean)
+    np.testing.assert_allclose(a.anomalies.var, b.anomalies.var, atol=1e-9)
+    np.testing.assert_array_equal(a.anomalies.n_obs, b.anomalies.n_obs)
+    pd.testing.assert_frame_equal(a.anomalies.alerts, b.anomalies.alerts)
+
+
+def test_append_later_days_is_incremental(parts, monkeypatch):
+    root, tables = parts
+    _write(root, "early", tables["early"])
+    state = refresh_dataset(None, str(root))
+    _write(root, "later", tables["later"])
+
+    # the append path must not fall back to the full builds
+    for name in ("build_stock_index", "build_prefix_index"):
+        monkeypatch.setattr(bist_metrics, name, lambda *a, _name=name, **k: pytest.fail(f"{_name} called"))
+    appended = refresh_dataset(state, str(root))
+    monkeypatch.undo()
+
+    assert appended.tensor.counts.shape[0] == state.tensor.counts.shape[0] + 8
+    assert len(appended.tensor.tickers) == len(state.tensor.tickers) + 1
+    assert_same_dataset(appended, refresh_dataset(None, str(root)))
+
+
+def test_backfilled_days_rebuild(parts):
+    root, tables = parts
+    _write(root, "early", tables["early"])
+    state = refresh_dataset(None, str(root))
+    _write(root, "backfill", tables["backfill"])
+
+    assert_same_dataset(refresh_dataset(state, str(root)), refresh_dataset(None, str(root)))
+
+
+def test_append_without_rows(parts):
+    root, tables = parts
+    _write(root, "early", tables["early"])
+    state = refresh_dataset(None, str(root))
+    _write(root, "empty", tables["later"].slice(0, 0))
+
+    assert_same_dataset(refresh_dataset(state, str(root)), refresh_dataset(None, str(root)))
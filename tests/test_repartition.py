@@ -0,0 +1,25 @@
+# tests/test_repartition.py
+# The README's repartition command, run from a fresh directory (no data/ yet).
+
+import os
+import subprocess
+import sys
+
+import duckdb
+
+from conftest import ROOT
+
+SRC = os.path.join(ROOT, "final_state_daily_bist100.parquet")
+
+
+def test_documented_command_creates_missing_parents(tmp_path):
+    out_dir = os.path.join("data", "final_state_daily")
+    subprocess.run([sys.executable, os.path.join(ROOT, "repartition_parquet.py"), SRC, out_dir, "--by", "year,month"],
+                   cwd=tmp_path, check=True, capture_output=True)
+
+    files = list((tmp_path / out_dir).rglob("*.parquet"))
+    assert files and all("year=" in str(f) and "month=" in str(f) for f in files)
+    con = duckdb.connect()
+    n_src = con.execute(f"SELECT COUNT(*) FROM read_parquet('{SRC}')").fetchone()[0]
+    n_out = con.execute(f"SELECT COUNT(*) FROM read_parquet('{tmp_path / out_dir}/**/*.parquet')").fetchone()[0]
+    assert n_out == n_src
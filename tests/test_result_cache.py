@@ -0,0 +1,43 @@
+# tests/test_result_cache.py
+# ResultCache.get_or_compute: one compute per missing key across threads, no per-key lock left behind.
+
+import threading
+import time
+
+import pytest
+
+from result_cache import ResultCache
+
+
+def test_failed_compute_releases_key_lock():
+    cache = ResultCache()
+
+    def boom():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        cache.get_or_compute(("fp", "ranking"), boom)
+    assert cache._key_locks == {}
+    assert cache.get_or_compute(("fp", "ranking"), lambda: 42) == 42
+    assert cache._key_locks == {}
+
+
+def test_concurrent_miss_computes_once():
+    cache = ResultCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute(("fp", "detail"), compute)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == ["value"] * 8
+    assert len(calls) == 1
+    assert cache._key_locks == {}
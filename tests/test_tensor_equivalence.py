@@ -0,0 +1,89 @@
+# tests/test_tensor_equivalence.py
+# The tensor-backed ranking (prefix index built from DailyTensor) and stock detail (tensor_detail_data)
+# against the pandas paths, on the bundled parquet and on a small synthetic frame with gaps.
+
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from bist_metrics import (
+    METRICS,
+    build_daily_tensor,
+    build_prefix_index,
+    compute_bist100_metric,
+    load_all_daily_states,
+    range_ranking,
+)
+from charts import tensor_detail_data
+from conftest import ROOT
+from synthetic import check_detail_equivalence, check_equivalence, generate_daily_states
+
+BUNDLED = os.path.join(ROOT, "final_state_daily_bist100.parquet")
+
+
+@pytest.fixture(scope="module")
+def bundled():
+    return load_all_daily_states(BUNDLED)
+
+
+@pytest.fixture(scope="module")
+def gappy(tmp_path_factory):
+    # 12 tickers x 15 trading days, then: one market-wide day removed, one ticker missing for a week,
+    # one ticker that only trades on the last days, one state never seen for a ticker
+    table = generate_daily_states(n_tickers=12, n_days=15, seed=7)
+    days = np.unique(table["tarih"].to_numpy())
+    tickers = sorted(set(table["islem_kodu"].to_pylist()))
+    df = table.to_pandas()
+    drop = (df["tarih"] == days[4])
+    drop |= (df["islem_kodu"] == tickers[1]) & df["tarih"].between(days[6], days[10])
+    drop |= (df["islem_kodu"] == tickers[2]) & (df["tarih"] < days[12])
+    drop |= (df["islem_kodu"] == tickers[3]) & (df["final_state"] == "Expired")
+    path = tmp_path_factory.mktemp("gappy") / "gappy.parquet"
+    pq.write_table(table.filter(pa.array(~drop.to_numpy())), path)
+    return load_all_daily_states(str(path))
+
+
+def _ranges(frame: pd.DataFrame) -> list[tuple]:
+    days = np.sort(frame["tarih"].unique())
+    return [(None, None), (days[0], days[len(days) // 2]), (days[len(days) // 3], days[-1]), (days[5], days[5])]
+
+
+@pytest.mark.parametrize("name", ["bundled", "gappy"])
+def test_ranking_matches_pandas(name, request):
+    frame = request.getfixturevalue(name)
+    for start, end in _ranges(frame):
+        check_equivalence(frame, start_date=start, end_date=end)
+
+
+@pytest.mark.parametrize("name", ["bundled", "gappy"])
+def test_detail_matches_pandas(name, request):
+    frame = request.getfixturevalue(name)
+    for start, end in _ranges(frame):
+        check_detail_equivalence(frame, max_tickers=200, start_date=start, end_date=end)
+
+
+def test_gaps_are_not_counted(gappy):
+    tickers = [str(c) for c in gappy["islem_kodu"].cat.categories]
+    days = np.sort(gappy["tarih"].unique())
+    tensor = build_daily_tensor(gappy)
+    prefix = build_prefix_index(gappy, tensor)
+
+    # the late ticker has no rows before days[-3]: no detail and no ranking row there
+    late = tickers[2]
+    assert tensor_detail_data(tensor, late, days[0], days[-4]) is None
+    out, _ = range_ranking(prefix, tickers, days[0], days[-4], "Trade% (w.avg)")
+    assert late not in set(out["islem_kodu"].astype(str))
+    assert tensor_detail_data(tensor, "YOK.E", days[0], days[-1]) is None
+
+    # a ticker missing for some days averages only over the days it has
+    absent = tickers[1]
+    detail = tensor_detail_data(tensor, absent, days[0], days[-1])
+    assert detail.n_days == int(gappy.loc[gappy["islem_kodu"] == absent, "tarih"].nunique())
+    for metric_key in METRICS:
+        ref, _ = compute_bist100_metric(gappy, tickers, days[0], days[-1], metric_key, engine="pandas")
+        out, _ = range_ranking(prefix, tickers, days[0], days[-1], metric_key)
+        assert list(out["islem_kodu"].astype(str)) == list(ref["islem_kodu"].astype(str))
@@ -0,0 +1,55 @@
+# tests/test_universes.py
+# Dated universe membership: a ticker counts only inside its [start_date, end_date] window, both in
+# universe_members and in the per-period batch rankings (membership as of the period's end date).
+
+import pandas as pd
+import pytest
+
+from batch_metrics import compute_period
+from bist_metrics import load_universes, universe_members
+from conftest import ROOT
+
+SRC = f"{ROOT}/final_state_daily_bist100.parquet"
+
+
+def test_bundled_bist100_renames():
+    universes = load_universes(f"{ROOT}/universes.csv")
+    before = universe_members(universes, "BIST100", "2025-11-21")
+    after = universe_members(universes, "BIST100", "2025-11-24")
+    assert len(before) == len(after) == 100
+    assert {"KOZAL.E", "KOZAA.E", "IPEKE.E"} <= set(before)
+    assert not {"TRALT.E", "TRMET.E", "TRENJ.E"} & set(before)
+    assert {"TRALT.E", "TRMET.E", "TRENJ.E"} <= set(after)
+    assert not {"KOZAL.E", "KOZAA.E", "IPEKE.E"} & set(after)
+
+
+def test_ranking_respects_membership_window(tmp_path):
+    path = tmp_path / "universes.csv"
+    pd.DataFrame({
+        "universe": ["TEST", "TEST"],
+        "islem_kodu": ["AKBNK.E", "GARAN.E"],
+        "start_date": ["", "2025-11-17"],
+        "end_date": ["", "2025-11-21"],
+    }).to_csv(path, index=False)
+    universes = load_universes(str(path))
+
+    def ranked(start, end):
+        out = compute_period(SRC, "p", pd.Timestamp(start), pd.Timestamp(end), universes, ["TEST"])
+        return set(out["islem_kodu"])
+
+    # GARAN.E trades all month, but belongs to TEST only in the week of 2025-11-17
+    assert ranked("2025-11-10", "2025-11-14") == {"AKBNK.E"}
+    assert ranked("2025-11-17", "2025-11-21") == {"AKBNK.E", "GARAN.E"}
+    assert ranked("2025-11-24", "2025-11-28") == {"AKBNK.E"}
+
+
+def test_shipped_universes():
+    # BIST30 / BIST50 are not shipped (no verified constituent lists): they must fail loudly, not rank
+    # an empty or made-up membership
+    from batch_metrics import resolve_universes
+    from bist_metrics import universe_names
+
+    universes = load_universes(f"{ROOT}/universes.csv")
+    assert universe_names(universes) == ["BIST100", "BANKA", "ALL"]
+    with pytest.raises(ValueError, match="unknown universe"):
+        resolve_universes(universes, "BIST30")